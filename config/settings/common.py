@@ -51,7 +51,7 @@ LOCAL_APPS = (
     'django_tables2',
     'django_filters',
     'captcha',
-    'to_do_list.tasks',
+    'to_do_list.tasks.apps.TasksConfig',
 )
 
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#installed-apps
@@ -60,11 +60,15 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 # MIDDLEWARE CONFIGURATION
 # ------------------------------------------------------------------------------
 MIDDLEWARE = (
+    'to_do_list.tasks.middleware.MetricsMiddleware',
+    'to_do_list.tasks.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'to_do_list.tasks.middleware.ProfileMiddleware',
+    'to_do_list.tasks.middleware.PrimaryStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 )
@@ -126,6 +130,14 @@ else:
 
 DATABASES['default']['ATOMIC_REQUESTS'] = True
 
+# Read replicas, given as a comma-separated list of URLs. The read-only views of
+# the tasks read from them, see to_do_list/tasks/routers.py
+DATABASE_REPLICAS = []
+for index, url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[])):
+    DATABASES['replica{0}'.format(index)] = env.db_url_config(url)
+    DATABASE_REPLICAS.append('replica{0}'.format(index))
+DATABASE_ROUTERS = ['to_do_list.tasks.routers.ReplicaRouter']
+
 
 # GENERAL CONFIGURATION
 # ------------------------------------------------------------------------------
@@ -156,7 +168,8 @@ USE_TZ = True
 TEMPLATES = [
     {
         # See: https://docs.djangoproject.com/en/dev/ref/settings/#std:setting-TEMPLATES-BACKEND
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # The Django backend, timing the renders, see tasks/metrics.py
+        'BACKEND': 'to_do_list.tasks.metrics.TimedDjangoTemplates',
         # See: https://docs.djangoproject.com/en/dev/ref/settings/#template-dirs
         'DIRS': [
             str(APPS_DIR.path('templates')),
@@ -280,3 +293,59 @@ ADMIN_URL = r'^admin/'
 RECAPTCHA_PUBLIC_KEY = env('RECAPTCHA_PUBLIC_KEY', default='6LeIxAcTAAAAAJcZVRqyHh71UMIEGNQ_MXjiZKhI')
 RECAPTCHA_PRIVATE_KEY = env('RECAPTCHA_PRIVATE_KEY', default='6LeIxAcTAAAAAGG-vFI1TnRWxMZNFuojJ4WifJWe')
 NOCAPTCHA = True
+
+# TASKS
+# ------------------------------------------------------------------------------
+# Paginate the home page table with next/previous cursors instead of page numbers
+TASKS_KEYSET_PAGINATION = env.bool('DJANGO_TASKS_KEYSET_PAGINATION', False)
+# Above this number of tasks, the table shows the estimate of the PostgreSQL planner
+TASKS_EXACT_COUNT_THRESHOLD = env.int('DJANGO_TASKS_EXACT_COUNT_THRESHOLD', 10000)
+# Cache holding the version counters and the rendered home tables
+TASKS_CACHE_ALIAS = env('DJANGO_TASKS_CACHE_ALIAS', default='default')
+TASKS_CACHE_TIMEOUT = env.int('DJANGO_TASKS_CACHE_TIMEOUT', 300)
+# Seconds the profiles and the teams are cached for, on the same cache and in
+# each process
+TASKS_PROFILE_CACHE_TIMEOUT = env.int('DJANGO_TASKS_PROFILE_CACHE_TIMEOUT', 60)
+TASKS_TEAM_CACHE_TIMEOUT = env.int('DJANGO_TASKS_TEAM_CACHE_TIMEOUT', 3600)
+# Number of profiles, teams... kept by each process in front of the cache
+TASKS_LOCAL_CACHE_SIZE = env.int('DJANGO_TASKS_LOCAL_CACHE_SIZE', 1000)
+# Replica read by the read-only views: 'round_robin' or 'least_lag', the lag
+# being measured every TASKS_REPLICA_LAG_INTERVAL seconds and the replicas lagging
+# more than TASKS_REPLICA_MAX_LAG seconds skipped
+TASKS_REPLICA_SELECTION = env('DJANGO_TASKS_REPLICA_SELECTION', default='round_robin')
+TASKS_REPLICA_LAG_INTERVAL = env.int('DJANGO_TASKS_REPLICA_LAG_INTERVAL', 5)
+TASKS_REPLICA_MAX_LAG = env.int('DJANGO_TASKS_REPLICA_MAX_LAG', 30)
+# Seconds after a write during which the user reads from the primary
+TASKS_PRIMARY_STICKINESS = env.int('DJANGO_TASKS_PRIMARY_STICKINESS', 10)
+# Run the read-only views in a READ ONLY transaction rather than in autocommit
+TASKS_READ_ONLY_TRANSACTION = env.bool('DJANGO_TASKS_READ_ONLY_TRANSACTION', False)
+# If set, only this number of the latest tasks matching a search are ranked by
+# relevance -- bounding the cost of the frequent words, at the price of the
+# older matches. By default all the matches are ranked
+TASKS_SEARCH_WINDOW = env.int('DJANGO_TASKS_SEARCH_WINDOW', 0)
+# Record the queries of the views by URL name, see tasks/queries.py, keeping
+# the TASKS_QUERY_SLOWEST slowest ones. Off by default: every query then goes
+# through the debug cursor and is logged. The database metrics of
+# tasks/metrics.py are collected without it
+TASKS_QUERY_STATS = env.bool('DJANGO_TASKS_QUERY_STATS', False)
+TASKS_QUERY_SLOWEST = env.int('DJANGO_TASKS_QUERY_SLOWEST', 5)
+# Maximum number of queries of a request of the views, by URL name, savepoints
+# excluded, and what exceeding it does: 'log' or 'raise'. A search takes up to
+# four more with a TASKS_SEARCH_WINDOW, see TaskQuerySet.search_window
+TASKS_QUERY_BUDGETS = {
+    'tasks:home': 10,
+    'tasks:detail_task': 7,
+    'tasks:api_tasks': 9,
+    'tasks:leaderboard': 5,
+}
+TASKS_QUERY_BUDGET_ACTION = env('DJANGO_TASKS_QUERY_BUDGET_ACTION', default='log')
+# Directory shared by the workers of a server, where each one writes its
+# metrics at most every TASKS_METRICS_FLUSH_INTERVAL seconds for tasks:metrics
+# to sum them, see tasks/metrics.py. Without it the metrics are the ones of
+# the process answering. The files unchanged for TASKS_METRICS_RETENTION
+# seconds -- of the workers exited, of the former servers -- are removed
+TASKS_METRICS_DIR = env('DJANGO_TASKS_METRICS_DIR', default='')
+TASKS_METRICS_FLUSH_INTERVAL = env.int('DJANGO_TASKS_METRICS_FLUSH_INTERVAL', 5)
+TASKS_METRICS_RETENTION = env.int('DJANGO_TASKS_METRICS_RETENTION', 24 * 3600)
+# Redis cache holding the leaderboards, kept in-process if it isn't configured
+TASKS_LEADERBOARD_CACHE_ALIAS = env('DJANGO_TASKS_LEADERBOARD_CACHE_ALIAS', default='redis')
@@ -66,6 +66,9 @@ DEBUG_TOOLBAR_CONFIG = {
 # ------------------------------------------------------------------------------
 INSTALLED_APPS += ('django_extensions', )
 
+# The queries of the views are recorded and checked against their budgets
+TASKS_QUERY_STATS = env.bool('DJANGO_TASKS_QUERY_STATS', True)
+
 # TESTING
 # ------------------------------------------------------------------------------
 TEST_RUNNER = 'django.test.runner.DiscoverRunner'
@@ -36,8 +36,21 @@ CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': ''
-    }
+    },
+    # The tables are not cached across tests whose database is rolled back,
+    # the tests of the cache switch TASKS_CACHE_ALIAS to 'default'
+    'tasks': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
 }
+TASKS_CACHE_ALIAS = 'tasks'
+
+# A view exceeding its budget of queries fails the test
+TASKS_QUERY_STATS = True
+TASKS_QUERY_BUDGET_ACTION = 'raise'
+
+# The replica the tests of the routing read from, the test database itself
+DATABASES['replica'] = dict(DATABASES['default'], ATOMIC_REQUESTS=False, TEST={'MIRROR': 'default'})
 
 # TESTING
 # ------------------------------------------------------------------------------
@@ -4,7 +4,7 @@
 
 from django.contrib import admin
 from .models import (
-    Profile, Task, Team,
+    Profile, ReputationEvent, Task, Team,
 )
 
 
@@ -20,6 +20,13 @@ class TaskAdmin(admin.ModelAdmin):
     pass
 
 
+class ReputationEventAdmin(admin.ModelAdmin):
+    """Admin class for the reputation ledger, which is append-only."""
+
+    list_display = ('user', 'task', 'amount', 'created_at', 'applied_at')
+    readonly_fields = list_display
+
+
 class TeamAdmin(admin.ModelAdmin):
     """Admin class for teams."""
 
@@ -27,5 +34,6 @@ class TeamAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Profile, ProfileAdmin)
+admin.site.register(ReputationEvent, ReputationEventAdmin)
 admin.site.register(Task, TaskAdmin)
 admin.site.register(Team, TeamAdmin)
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+"""
+JSON API of the tasks app, versioned by its URL (api/v1/). The table of the
+home page is rendered client-side from tasks_view: rows are sent as compact
+lists, the markup of the cells is fetched once from table_config_view.
+"""
+
+import codecs
+import csv
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.paginator import EmptyPage, PageNotAnInteger
+from django.core.urlresolvers import reverse
+from django.http.response import HttpResponse, JsonResponse
+from django.template.loader import render_to_string
+from django.utils import translation
+from django.utils.translation import ugettext as _, ungettext
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
+
+from . import transitions
+from .cache import home_table_key, may_cache, task_cache
+from .decorators import read_only_requests
+from .imports import READERS, guess_format, import_tasks
+from .metrics import TABLE_CACHE
+from .middleware import get_profile
+from .models import Task
+from .paginators import EstimatedCountPaginator, KeysetPaginator
+from .routers import replica_reads
+from .tables import ORDERINGS, PK_PLACEHOLDER, ActionCell, TaskFilter, TaskTable
+
+API_VERSION = 1
+PER_PAGE = 10
+# Columns the rows can be sorted by, as for the TaskTable
+SORTABLE = tuple(ORDERINGS)
+# Fields of a row
+COLUMNS = ('pk', 'name', 'creator', 'visibility', 'difficulty', 'status', 'is_owner', 'actions')
+
+# Largest number of tasks a bulk action is applied to
+BULK_MAX_TASKS = 1000
+
+# Configuration of the table per language, see table_config_view
+_table_configs = {}
+
+
+def task_row(record, user):
+    """Return the list sent for a TaskRow, the actions being ActionCell flags."""
+    is_owner = record.creator_id == user.pk
+    actions = ActionCell(record.pk, is_owner, record.status).flags
+    return [
+        record.pk, record.name, record.creator, record.visibility, record.difficulty, record.status,
+        int(is_owner), actions,
+    ]
+
+
+@cache_control(private=True, max_age=3600)
+def table_config_view(request):
+    """
+    Return what the client needs to render the rows: the choices labels, the
+    URLs and the action cells of actions_cell.html with PK_PLACEHOLDER standing
+    for the pk, for every combination of flags. It only depends on the
+    language and is built once per language.
+    """
+    language = translation.get_language()
+    if language not in _table_configs:
+        actions = {}
+        for is_owner in (False, True):
+            for status, _label in Task.STATUS:
+                cell = ActionCell(PK_PLACEHOLDER, is_owner, status)
+                html = render_to_string('tasks/actions_cell.html', {'record': cell})
+                actions[cell.flags] = html.split(str(PK_PLACEHOLDER))
+        config = {
+            'version': API_VERSION,
+            'url': reverse('tasks:api_tasks'),
+            'bulk_url': reverse('tasks:api_bulk_action'),
+            'detail_url': reverse('tasks:detail_task', kwargs={'pk': PK_PLACEHOLDER}).split(str(PK_PLACEHOLDER)),
+            'actions': actions,
+            'labels': {
+                'visibility': dict(Task.VISIBILITIES), 'difficulty': dict(Task.DIFFICULTIES),
+                'status': dict(Task.STATUS),
+            },
+            'done': [Task.STATUS.completed, Task.STATUS.closed],
+            'empty_text': TaskTable._meta.empty_text,
+            'previous': _('previous'),
+            'next': _('next'),
+        }
+        _table_configs[language] = json.dumps(config, default=str)
+    return HttpResponse(_table_configs[language], content_type='application/json')
+
+
+def page_query(request, **params):
+    """Return the query string of the request with params replaced, or removed if None."""
+    query = request.GET.copy()
+    for key, value in params.items():
+        if value is None:
+            query.pop(key, None)
+        else:
+            query[key] = value
+    return '?' + query.urlencode()
+
+
+def paginate(request, queryset):
+    """
+    Return the page of the queryset requested, paginated as the home table,
+    and the query strings of the previous and next pages.
+    """
+    if settings.TASKS_KEYSET_PAGINATION:
+        paginator = KeysetPaginator(queryset, PER_PAGE, cursor=request.GET.get(KeysetPaginator.cursor_field))
+        page = paginator.page()
+        previous_query = page.has_previous() and page_query(request, cursor=page.previous_cursor, page=None)
+        next_query = page.has_next() and page_query(request, cursor=page.next_cursor, page=None)
+        return page, previous_query or None, next_query or None
+    paginator = EstimatedCountPaginator(queryset, PER_PAGE)
+    try:
+        page = paginator.page(request.GET.get('page', 1))
+    except PageNotAnInteger:
+        page = paginator.page(1)
+    except EmptyPage:
+        page = paginator.page(paginator.num_pages)
+    previous_query = page.has_previous() and page_query(request, page=page.previous_page_number(), cursor=None)
+    next_query = page.has_next() and page_query(request, page=page.next_page_number(), cursor=None)
+    return page, previous_query or None, next_query or None
+
+
+def tasks_etag(request):
+    """
+    ETag of tasks_view, from the versions of the tasks visible by the user.
+    None when reading from a replica, whose rows may be older than the versions.
+    """
+    profile = get_profile(request)
+    if profile is None or not may_cache():
+        return None
+    key = home_table_key(request, profile.team_id, view='api')
+    return hashlib.md5(key.encode('utf-8')).hexdigest() if key else None
+
+
+@read_only_requests
+@replica_reads
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=tasks_etag)
+def tasks_view(request):
+    """
+    Return a page of the tasks visible by the user, filtered and sorted as
+    the home table by the same query string. The rows are lists of the
+    COLUMNS, 'previous' and 'next' the query strings of the neighbouring
+    pages.
+    """
+    profile = get_profile(request)
+    if profile is None:
+        return JsonResponse({'error': _("You must have a valid profile to access this page")}, status=403)
+
+    cache = task_cache()
+    key = home_table_key(request, profile.team_id, view='api')
+    data = cache.get(key) if key else None
+    if key:
+        TABLE_CACHE.inc('tasks:api_tasks', 'hit' if data is not None else 'miss')
+    if data is None:
+        queryset = Task.objects.visible_to(request.user, team_id=profile.team_id)
+        queryset = TaskFilter(request.GET, queryset=queryset).qs.listing()
+        sort = request.GET.get('sort', '')
+        if sort.lstrip('-') not in SORTABLE:
+            sort = None
+        elif sort.lstrip('-') == 'pk':
+            queryset = queryset.order_by(sort)
+        else:
+            prefix = '-' if sort.startswith('-') else ''
+            queryset = queryset.order_by(prefix + ORDERINGS[sort.lstrip('-')], prefix + 'pk')
+        page, previous_query, next_query = paginate(request, queryset)
+        count = page.paginator.count
+        if page.paginator.is_estimated:
+            count_text = _("about %(count)s tasks") % {'count': count}
+        else:
+            count_text = ungettext("%(count)s task", "%(count)s tasks", count) % {'count': count}
+        data = {
+            'version': API_VERSION,
+            'columns': COLUMNS,
+            'rows': [task_row(record, request.user) for record in page.object_list],
+            'sort': sort,
+            'previous': previous_query,
+            'next': next_query,
+            'count': count,
+            'count_text': count_text,
+        }
+        if key and may_cache():
+            cache.set(key, data, settings.TASKS_CACHE_TIMEOUT)
+    return JsonResponse(data)
+
+
+@require_POST
+def bulk_action_view(request):
+    """
+    Apply the action -- complete, close or delete -- to the tasks of the pks
+    posted, with the permission rules of the single task views. Return the
+    outcome of each pk: applied, not_found or forbidden.
+    """
+    profile = get_profile(request)
+    if profile is None:
+        return JsonResponse({'error': _("You must have a valid profile to access this page")}, status=403)
+    transition = transitions.TRANSITIONS.get(request.POST.get('action'))
+    try:
+        pks = {int(pk) for pk in request.POST.getlist('pks')}
+    except ValueError:
+        pks = set()
+    if transition is None or not pks or len(pks) > BULK_MAX_TASKS:
+        return JsonResponse({'error': _("Invalid action or selection of tasks")}, status=400)
+    outcomes = transition.apply_many(pks, request.user, team_id=profile.team_id)
+    return JsonResponse({'outcomes': {str(pk): outcome for pk, outcome in outcomes.items()}})
+
+
+@require_POST
+def import_view(request):
+    """
+    Create the tasks of the CSV or NDJSON file uploaded as `file` for the
+    user, its format being given by `format` or else by its extension. The
+    file is read line by line. Return the number of tasks created, of invalid
+    rows and the errors of the first ones, see imports.ImportReport.
+    """
+    profile = get_profile(request)
+    if profile is None:
+        return JsonResponse({'error': _("You must have a valid profile to access this page")}, status=403)
+    upload = request.FILES.get('file')
+    format = upload and (request.POST.get('format') or guess_format(upload.name))
+    if format not in READERS:
+        return JsonResponse({'error': _("Please upload a CSV or NDJSON file")}, status=400)
+    try:
+        report = import_tasks(READERS[format](codecs.iterdecode(upload, 'utf-8-sig')), request.user.pk,
+                              profile.team_id)
+    except (ValueError, csv.Error):
+        return JsonResponse({'error': _("The file can't be read")}, status=400)
+    return JsonResponse(report.as_dict())
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class TasksConfig(AppConfig):
+    name = 'to_do_list.tasks'
+    verbose_name = "Tasks"
+
+    def ready(self):
+        """Connect the receivers invalidating the cache of the tasks."""
+        from . import signals  # noqa
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmarks for the tasks app, run with ``python manage.py benchmark``.
+Each benchmark seeds its own data in the configured database -- the command
+rolls it back afterwards -- and returns a list of (label, value, unit).
+"""
+
+import time
+import timeit
+import tracemalloc
+import uuid
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction
+from django.db.backends.utils import CursorWrapper
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.template.loader import render_to_string
+from django.utils.html import format_html
+
+from to_do_list.users.models import User
+from . import api, views
+from .imports import import_tasks
+from .paginators import KeysetPaginator
+from .models import Profile, Task, Team
+from .tables import TaskTable
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(func):
+    """Register a benchmark under the name of the function."""
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def seed_tasks(size, **kwargs):
+    """
+    Create a user with a profile and `size` tasks -- one in two created by
+    her, all statuses in turn. Return the user.
+    """
+    team = Team.objects.create(name='benchmark-{0}'.format(uuid.uuid4().hex))
+    user, other = [
+        User.objects.create(username='benchmark-{0}'.format(uuid.uuid4().hex)) for _ in range(2)
+    ]
+    Profile.objects.bulk_create([Profile(user=u, team=team, has_signed=True) for u in (user, other)])
+    Task.objects.bulk_create([
+        Task(name='task {0}'.format(i), description='benchmark', creator=(user, other)[i % 2],
+             creator_username=(user, other)[i % 2].username, creator_team=team, status=i % 4,
+             visibility=Task.VISIBILITIES.public, **kwargs)
+        for i in range(size)
+    ])
+    return user
+
+
+class LegacyTaskTable(TaskTable):
+    """TaskTable rendering each row with reverse() and render_to_string."""
+
+    def render_name(self, record, value):
+        detail_url = reverse('tasks:detail_task', kwargs={'pk': record.pk})
+        value = format_html('<a href="{}">{}</a>', detail_url, value)
+        if record.creator == self.user:
+            value = format_html("<b>{}</b>", value)
+        if record.status == Task.STATUS.completed or record.status == Task.STATUS.closed:
+            value = format_html("<del>{}</del>", value)
+        return value
+
+    def render_action(self, record):
+        record.is_editable = record.creator == self.user and record.status == Task.STATUS.new
+        record.can_be_closed = record.creator == self.user and record.status == Task.STATUS.completed
+        record.can_be_completed = record.status == Task.STATUS.new
+        return render_to_string('tasks/actions_cell.html', {'record': record})
+
+
+def render_cells(table):
+    """Render the name and action cells of every row of the table."""
+    return [(row.get_cell('name'), row.get_cell('action')) for row in table.rows]
+
+
+@benchmark
+def table_rendering(size=None, repeat=None):
+    """Per row cost of the name and action cells of the TaskTable."""
+    size, repeat = size or 100, repeat or 20
+    user = seed_tasks(size)
+    tasks = list(Task.objects.filter(creator__profile__team=user.profile.team).select_related('creator'))
+    measures = []
+    for label, table_class in (('legacy', LegacyTaskTable), ('batched', TaskTable)):
+        seconds = min(timeit.repeat(lambda: render_cells(table_class(tasks, user=user)), number=1, repeat=repeat))
+        measures.append(('{0}, per row'.format(label), seconds / size * 10 ** 6, 'us'))
+    return measures
+
+
+@benchmark
+def table_listing(size=None, repeat=None):
+    """Time and peak memory of fetching a page of tasks for the TaskTable."""
+    size, repeat = size or 1000, repeat or 20
+    user = seed_tasks(size)
+    querysets = (
+        ('model instances', lambda: Task.objects.visible_to(user).select_related()),
+        ('listing rows', lambda: Task.objects.visible_to(user).listing()),
+    )
+    measures = []
+    for label, queryset in querysets:
+        seconds = min(timeit.repeat(lambda: list(queryset()), number=1, repeat=repeat))
+        tracemalloc.start()
+        try:
+            list(queryset())
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        measures.append(('{0}, per row'.format(label), seconds / size * 10 ** 6, 'us'))
+        measures.append(('{0}, peak memory'.format(label), peak / 1024, 'KiB'))
+    return measures
+
+
+@benchmark
+def home_payload(size=None, repeat=None):
+    """Size and server time of a page of the home table, as HTML and as JSON."""
+    size, repeat = size or 100, repeat or 20
+    user = seed_tasks(size)
+    factory = RequestFactory()
+    caches = dict(settings.CACHES, benchmark={'BACKEND': 'django.core.cache.backends.dummy.DummyCache'})
+    measures = []
+    for label, view, url in (('html', views.home_view, 'tasks:home'), ('json', api.tasks_view, 'tasks:api_tasks')):
+        request = factory.get(reverse(url), {'sort': 'name'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        request.user = user
+        with override_settings(CACHES=caches, TASKS_CACHE_ALIAS='benchmark'):
+            seconds = min(timeit.repeat(lambda: view(request), number=1, repeat=repeat))
+            length = len(view(request).content)
+        measures.append(('{0}, per request'.format(label), seconds * 10 ** 3, 'ms'))
+        measures.append(('{0}, payload'.format(label), length, 'bytes'))
+    return measures
+
+
+@benchmark
+def task_import(size=None, repeat=None):
+    """Throughput of the import of tasks, with bulk_create and, on PostgreSQL, with COPY."""
+    size, repeat = size or 20000, repeat or 1
+    user = seed_tasks(0)
+    rows = [
+        {'name': 'task {0}'.format(i), 'description': 'benchmark', 'visibility': 'public', 'difficulty': '2'}
+        for i in range(size)
+    ]
+    modes = [('bulk_create', False)] + ([('copy', True)] if connection.vendor == 'postgresql' else [])
+    measures = []
+    for label, copy in modes:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            import_tasks(iter(rows), user.pk, user.profile.team_id, copy=copy)
+            timings.append(time.perf_counter() - start)
+        measures.append(('{0}, rows per second'.format(label), size / min(timings), 'rows/s'))
+    return measures
+
+
+class TimedCursor(CursorWrapper):
+    """Cursor appending the (start, duration) of its queries to timings."""
+
+    def __init__(self, cursor, db, timings):
+        super().__init__(cursor, db)
+        self.timings = timings
+
+    def timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.timings.append((start, time.perf_counter() - start))
+
+    def execute(self, sql, params=None):
+        return self.timed(super().execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self.timed(super().executemany, sql, param_list)
+
+
+@contextmanager
+def timed_queries(timings):
+    """Time the queries of the default connection in the block, see TimedCursor."""
+    forced, previous = connection.force_debug_cursor, vars(connection).get('make_debug_cursor')
+    connection.make_debug_cursor = lambda cursor: TimedCursor(cursor, connection, timings)
+    connection.force_debug_cursor = True
+    try:
+        yield
+    finally:
+        if previous is None:
+            del connection.make_debug_cursor
+        else:
+            connection.make_debug_cursor = previous
+        connection.force_debug_cursor = forced
+
+
+@benchmark
+def request_transactions(size=None, repeat=None):
+    """
+    Latency of the read-only views and time they hold the connection -- a
+    server one under transaction pooling -- run in a transaction as with
+    ATOMIC_REQUESTS, from the first query to the end of the render, and in
+    autocommit as with read_only_requests, the duration of the queries only.
+    """
+    size, repeat = size or 100, repeat or 20
+    user = seed_tasks(size)
+    task = Task.objects.filter(creator=user).first()
+    factory = RequestFactory()
+    caches = dict(settings.CACHES, benchmark={'BACKEND': 'django.core.cache.backends.dummy.DummyCache'})
+    pages = (
+        ('home', views.home_view, 'tasks:home', {}),
+        ('detail', views.TaskDetailView.as_view(), 'tasks:detail_task', {'pk': task.pk}),
+    )
+    measures = []
+    for label, view, url, kwargs in pages:
+        for mode, atomic in (('atomic', True), ('autocommit', False)):
+            latencies, holds = [], []
+            for _ in range(repeat):
+                request = factory.get(reverse(url, kwargs=kwargs))
+                request.user = user
+                timings = []
+                with override_settings(CACHES=caches, TASKS_CACHE_ALIAS='benchmark'), timed_queries(timings):
+                    start = time.perf_counter()
+                    with transaction.atomic() if atomic else ExitStack():
+                        response = view(request, **kwargs)
+                        if hasattr(response, 'render'):
+                            response.render()
+                    end = time.perf_counter()
+                latencies.append(end - start)
+                holds.append(end - timings[0][0] if atomic else sum(d for _s, d in timings))
+            measures.append(('{0}, {1}, latency'.format(label, mode), min(latencies) * 10 ** 3, 'ms'))
+            measures.append(('{0}, {1}, connection held'.format(label, mode), min(holds) * 10 ** 3, 'ms'))
+    return measures
+
+
+# Vocabulary of the tasks seeded by seed_words
+SEARCH_WORDS = (
+    'report', 'invoice', 'garden', 'meeting', 'kitchen', 'budget', 'review', 'deploy', 'laundry', 'dentist',
+    'groceries', 'presentation', 'backup', 'insurance', 'passport', 'holiday', 'painting', 'plumber', 'taxes',
+    'newsletter', 'database', 'interview', 'birthday', 'training', 'contract', 'printer', 'roadmap', 'library',
+    'workshop', 'migration', 'bicycle', 'conference', 'recipe', 'charity', 'inventory', 'marathon', 'mortgage',
+    'podcast', 'warranty', 'vaccine',
+)
+
+
+def seed_words(size):
+    """
+    Create a user and `size` public tasks named by two words of SEARCH_WORDS
+    and a number, described by two others. Return the user.
+    """
+    user = seed_tasks(0)
+    words, team_id = list(SEARCH_WORDS), user.profile.team_id
+    if connection.vendor != 'postgresql':
+        Task.objects.bulk_create([
+            Task(name='{0} {1} {2}'.format(words[i % 40], words[i // 40 % 40], i),
+                 description='{0} {1}'.format(words[i * 7 % 40], words[i * 13 % 40]),
+                 creator=user, creator_username=user.username, creator_team_id=team_id, status=i % 4)
+            for i in range(size)
+        ], batch_size=2000)
+        return user
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO tasks_task (name, description, visibility, difficulty, status, is_removed, created_at, "
+            "modified_at, creator_id, creator_username, creator_team_id) "
+            "SELECT w[1 + i %% 40] || ' ' || w[1 + i / 40 %% 40] || ' ' || i, w[1 + i * 7 %% 40] || ' ' || "
+            "w[1 + i * 13 %% 40], %s, 2, i %% 4, false, now(), now(), %s, %s, %s "
+            "FROM generate_series(0, %s - 1) AS i, (SELECT %s::text[] AS w) AS words",
+            [Task.VISIBILITIES.public, user.pk, user.username, team_id, size, words],
+        )
+        cursor.execute('ANALYZE tasks_task')
+    return user
+
+
+@benchmark
+def task_search(size=None, repeat=None):
+    """
+    Time of the first and second pages of the search of the home table,
+    ranked by relevance among the tasks visible by the user: with the
+    default settings, all the matches ranked, and with a TASKS_SEARCH_WINDOW
+    -- the one set or 1000 -- ranking the latest matches only. No time is
+    promised: ranking all the matches costs as much as the text has, the
+    window only bounds the cost of the frequent words.
+    """
+    size, repeat = size or 100000, repeat or 5
+    user = seed_words(size)
+    searches = (
+        ('two words', 'garden report'),
+        ('prefix', 'garden rep'),
+        ('name and number', 'kitchen {0}'.format(size // 2)),
+        ('one word', 'marathon'),
+        ('no match', 'zzzz'),
+    )
+    measures = []
+    for suffix, window in (('', 0), (', window', settings.TASKS_SEARCH_WINDOW or 1000)):
+        for label, text in searches:
+            def page(cursor):
+                # The search looks for its window of matches when called
+                queryset = Task.objects.visible_to(user, team_id=user.profile.team_id).search(text).listing()
+                return KeysetPaginator(queryset, 10, cursor=cursor).page()
+
+            with override_settings(TASKS_SEARCH_WINDOW=window):
+                first = page(None)
+                for name, cursor in (('first page', None), ('second page', first.next_cursor)):
+                    seconds = min(timeit.repeat(lambda: page(cursor), number=1, repeat=repeat))
+                    measures.append(('{0}, {1}{2}'.format(label, name, suffix), seconds * 10 ** 3, 'ms'))
+    return measures
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cache of the home task table. The fragments are stored under a version token
+made of three counters: the public scope, the team of the user and the user
+herself. Saving or deleting a task bumps the counters of the scopes it is
+visible in (see signals.py), so a cached table is never served once a task
+it may show has changed -- stale entries are left to expire. The facet
+counts of the filter form are cached under the same token. What is read
+from a replica isn't cached, as the replica may not have replayed yet the
+writes the token counts (see may_cache).
+The profiles and the teams are cached as well for a short while, in the
+process and in the shared backend, see TwoLevelCache.
+"""
+
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import translation
+
+from .models import Profile, Task, Team
+from .routers import current_replica, use_replica
+
+VERSION_KEY = 'tasks:version:{0}'
+
+
+def task_cache():
+    """Return the cache backend configured by settings.TASKS_CACHE_ALIAS."""
+    return caches[settings.TASKS_CACHE_ALIAS]
+
+
+def task_scopes(task, visibility=None):
+    """
+    Return the scopes a task is visible in with the given visibility, its
+    current one by default: its creator, her team and, if it is public,
+    everyone.
+    """
+    if visibility is None:
+        visibility = task.visibility
+    scopes = ['user:{0}'.format(task.creator_id)]
+    if visibility != Task.VISIBILITIES.private and task.creator_team_id is not None:
+        scopes.append('team:{0}'.format(task.creator_team_id))
+    if visibility == Task.VISIBILITIES.public:
+        scopes.append('public')
+    return scopes
+
+
+def bump_task_versions(*scopes):
+    """Increment the version counters of the given scopes."""
+    cache = task_cache()
+    for scope in set(scopes):
+        key = VERSION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # The counter is missing or has been evicted, starting it anew from
+            # the clock ensures it doesn't come back to an already used value
+            cache.add(key, int(time.time() * 1000), timeout=None)
+
+
+def version_token(user_id, team_id):
+    """
+    Return the token of the versions of the tasks visible by a user, None if
+    the counters can't be read back from the cache.
+    """
+    cache = task_cache()
+    keys = [VERSION_KEY.format(s) for s in ('public', 'team:{0}'.format(team_id), 'user:{0}'.format(user_id))]
+    versions = cache.get_many(keys)
+    missing = [k for k in keys if k not in versions]
+    if missing:
+        initial = int(time.time() * 1000)
+        for key in missing:
+            cache.add(key, initial, timeout=None)
+        versions.update(cache.get_many(missing))
+    if len(versions) < len(keys):
+        return None
+    return '.'.join(str(versions[k]) for k in keys)
+
+
+def may_cache():
+    """
+    Return whether the rows read by the thread may be cached under the version
+    token: not if they come from a replica, which may lag behind the token.
+    """
+    return current_replica() is None
+
+
+def home_table_key(request, team_id, view='home'):
+    """
+    Return the cache key of the home table of request.user, built from the
+    query string (filters, ordering, page or cursor), the language, whether
+    the request is an AJAX one and the version token -- None without token.
+    view tells apart the HTML table from its JSON API.
+    """
+    token = version_token(request.user.pk, team_id)
+    if token is None:
+        return None
+    query = sorted((k, request.GET.getlist(k)) for k in request.GET)
+    digest = hashlib.md5(repr(query).encode('utf-8')).hexdigest()
+    return 'tasks:{0}:{1}:{2}:{3}:{4}:{5}'.format(
+        view, request.user.pk, translation.get_language(), int(request.is_ajax()), digest, token,
+    )
+
+
+def cached_facets(user, team_id):
+    """
+    Return the facets of the tasks visible by the user (see
+    TaskQuerySet.facets), cached under the version token of her home table.
+    """
+    token = version_token(user.pk, team_id)
+    key = 'tasks:facets:{0}:{1}'.format(user.pk, token) if token else None
+    facets = task_cache().get(key) if key else None
+    if facets is None:
+        facets = Task.objects.visible_to(user, team_id=team_id).facets()
+        if key and may_cache():
+            task_cache().set(key, facets, settings.TASKS_CACHE_TIMEOUT)
+    return facets
+
+
+class TwoLevelCache:
+    """
+    Objects cached for a few seconds in a bounded LRU of the process in front
+    of the shared cache backend. The entries of the process are tagged with
+    the version of the cache -- a counter in the shared backend bumped by
+    invalidate -- and only served under that version, which is read at most
+    once per request (see begin_request) or, outside requests, on every get.
+    Values can't be None, and are loaded from the primary. hits, shared_hits, misses and evictions count the
+    reads served by the process, by the shared backend, by the database, and
+    the entries dropped from the process for room.
+    """
+
+    def __init__(self, name, timeout_setting, max_size_setting='TASKS_LOCAL_CACHE_SIZE'):
+        self.name = name
+        self.timeout_setting = timeout_setting
+        self.max_size_setting = max_size_setting
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.request = threading.local()
+        self.stats = dict.fromkeys(('hits', 'shared_hits', 'misses', 'evictions'), 0)
+
+    @property
+    def timeout(self):
+        return getattr(settings, self.timeout_setting)
+
+    def shared_key(self, key):
+        return 'tasks:{0}:{1}'.format(self.name, key)
+
+    def begin_request(self):
+        """Start a request of the thread: the version is read on the first get only."""
+        self.request.active, self.request.version = True, None
+
+    def end_request(self):
+        self.request.active, self.request.version = False, None
+
+    def version(self):
+        """Return the version of the cache, a token of its own if the shared backend doesn't keep it."""
+        version = getattr(self.request, 'version', None)
+        if version is None or not getattr(self.request, 'active', False):
+            cache, key = task_cache(), VERSION_KEY.format(self.name)
+            version = cache.get(key)
+            if version is None:
+                cache.add(key, int(time.time() * 1000), timeout=None)
+                # Without a shared version, the entries of the process are
+                # only served for the rest of the request
+                version = cache.get(key) or object()
+            self.request.version = version
+        return version
+
+    def get(self, key, load):
+        """Return the value cached under key, load() if it isn't cached anywhere."""
+        version = self.version()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version and entry[1] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[2]
+        cache = task_cache()
+        value = cache.get(self.shared_key(key))
+        if value is None:
+            # Read from the primary, as the version may count writes a
+            # replica hasn't replayed yet
+            with use_replica(None):
+                value = load()
+            cache.set(self.shared_key(key), value, self.timeout)
+            counter = 'misses'
+        else:
+            counter = 'shared_hits'
+        with self.lock:
+            self.stats[counter] += 1
+            self.entries[key] = (version, time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > getattr(settings, self.max_size_setting):
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+        return value
+
+    def invalidate(self, *keys):
+        """Forget the values of the keys, in every process through the version."""
+        cache = task_cache()
+        cache.delete_many([self.shared_key(key) for key in keys])
+        bump_task_versions(self.name)
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+        self.request.version = None
+
+
+PROFILES = TwoLevelCache('profiles', 'TASKS_PROFILE_CACHE_TIMEOUT')
+TEAMS = TwoLevelCache('teams', 'TASKS_TEAM_CACHE_TIMEOUT')
+OBJECT_CACHES = (PROFILES, TEAMS)
+
+
+def object_cache_stats():
+    """Return the counters of the object caches of the process, by name."""
+    return {c.name: dict(c.stats) for c in OBJECT_CACHES}
+
+
+def cached_profile(user):
+    """
+    Return the profile of the user joined with its team, None if she has none
+    or is anonymous. It is cached by PROFILES -- its absence as well -- and
+    forgotten when the profile is saved or its reputation changed.
+    """
+    if user.pk is None:
+        return None
+    profile = PROFILES.get(
+        user.pk, lambda: Profile.objects.select_related('team').filter(user_id=user.pk).first() or False,
+    )
+    if not profile:
+        return None
+    # The instance cached may be served to other requests
+    profile = copy.copy(profile)
+    profile.user = user
+    return profile
+
+
+def forget_profiles(*user_ids):
+    """Remove the cached profiles of the users."""
+    PROFILES.invalidate(*user_ids)
+
+
+def cached_teams():
+    """Return the (pk, name) of all the teams, ordered by name, cached by TEAMS."""
+    return TEAMS.get('all', lambda: list(Team.objects.order_by('name').values_list('pk', 'name')))
+
+
+def forget_teams():
+    TEAMS.invalidate('all')
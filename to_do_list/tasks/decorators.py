@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+"""
+Transaction policy of the read-only views. With ATOMIC_REQUESTS, every
+request runs in a transaction holding its database connection -- a server
+one under transaction pooling, e.g. pgbouncer -- for the whole view and the
+render. read_only_requests exempts the safe methods: the view runs in
+autocommit, the connection is only held by each query, or in a READ ONLY
+transaction on PostgreSQL if settings.TASKS_READ_ONLY_TRANSACTION is set.
+The other methods stay atomic.
+"""
+
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections, transaction
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def atomic_aliases():
+    """Return the aliases of the databases with ATOMIC_REQUESTS."""
+    return [db.alias for db in connections.all() if db.settings_dict['ATOMIC_REQUESTS']]
+
+
+@contextmanager
+def read_only_transaction(alias):
+    """
+    Run the block in a transaction of the database alias, READ ONLY on
+    PostgreSQL unless it is nested in another one.
+    """
+    connection = connections[alias]
+    read_only = connection.vendor == 'postgresql' and not connection.in_atomic_block
+    with transaction.atomic(using=alias):
+        if read_only:
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION READ ONLY')
+        yield
+
+
+def read_only_requests(view):
+    """
+    Decorator running the view outside of the transaction of ATOMIC_REQUESTS
+    for the safe methods, see the docstring of the module. Template
+    responses are rendered in the view.
+    """
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        safe = request.method in SAFE_METHODS
+        if safe and not settings.TASKS_READ_ONLY_TRANSACTION:
+            return view(request, *args, **kwargs)
+        with ExitStack() as stack:
+            for alias in atomic_aliases():
+                stack.enter_context(read_only_transaction(alias) if safe else transaction.atomic(using=alias))
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
+    return transaction.non_atomic_requests(wrapped)
+
+
+class ReadOnlyRequestMixin:
+    """CBV mixin applying read_only_requests to the view."""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return read_only_requests(super().as_view(**initkwargs))
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+"""
+Export of the tasks as CSV or NDJSON, streamed row by row so that memory
+stays flat whatever the number of tasks: on PostgreSQL the rows are read
+through a server-side cursor, Django 1.10 fetching the whole result set
+client-side otherwise.
+"""
+
+import csv
+import json
+import uuid
+
+from django.db import connections, transaction
+
+from .models import Task
+
+# Columns of the export and the lookups they are read from
+COLUMNS = ('id', 'name', 'description', 'creator', 'visibility', 'difficulty', 'status', 'created_at', 'modified_at')
+LOOKUPS = ('pk', 'name', 'description', 'creator_username', 'visibility', 'difficulty', 'status', 'created_at',
+           'modified_at')
+# Number of rows fetched from the cursor, and written to the response, at once
+CHUNK_SIZE = 2000
+
+
+def stream_values(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Yield the tuples of values of a values_list queryset. On PostgreSQL, they
+    are read from a named -- server-side -- cursor, chunk_size at a time,
+    which has to live in a transaction.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        yield from queryset.iterator()
+        return
+    sql, params = queryset.query.sql_with_params()
+    with transaction.atomic(using=queryset.db):
+        connection.ensure_connection()
+        with connection.connection.cursor(name='tasks_export_{0}'.format(uuid.uuid4().hex)) as cursor:
+            cursor.itersize = chunk_size
+            cursor.execute(sql, params)
+            yield from cursor
+
+
+def export_rows(queryset):
+    """Yield the rows of the export as lists of json-able values, the choices being labelled."""
+    labels = {
+        'visibility': dict(Task.VISIBILITIES), 'difficulty': dict(Task.DIFFICULTIES), 'status': dict(Task.STATUS),
+    }
+    labels = {field: {k: str(v) for k, v in choices.items()} for field, choices in labels.items()}
+    visibility, difficulty, status = labels['visibility'], labels['difficulty'], labels['status']
+    for pk, name, description, creator, vis, diff, stat, created_at, modified_at in stream_values(
+            queryset.values_list(*LOOKUPS)):
+        yield [
+            pk, name, description, creator, visibility[vis], difficulty[diff], status[stat],
+            created_at.isoformat() if created_at else None, modified_at.isoformat(),
+        ]
+
+
+class Echo:
+    """File-like object handing back what is written, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def chunked(lines, size=CHUNK_SIZE):
+    """Join the lines by chunks of size, to limit the number of writes."""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def export_csv(queryset):
+    """Yield the export of the tasks of the queryset as CSV, header first."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    yield from chunked(writer.writerow(row) for row in export_rows(queryset))
+
+
+def export_ndjson(queryset):
+    """Yield the export of the tasks of the queryset as NDJSON, one object per line."""
+    yield from chunked(
+        json.dumps(dict(zip(COLUMNS, row)), separators=(',', ':')) + '\n' for row in export_rows(queryset)
+    )
+
+
+# Content type and generator of each format
+FORMATS = {
+    'csv': ('text/csv', export_csv),
+    'ndjson': ('application/x-ndjson', export_ndjson),
+}
@@ -5,6 +5,7 @@
 from django import forms
 from django.utils.translation import ugettext_lazy as _
 
+from .cache import cached_teams
 from .models import Profile, Task
 from to_do_list.users.models import User
 
@@ -24,6 +25,17 @@ class UserUpdateForm(forms.ModelForm):
         fields = ['first_name', 'last_name']
 
 
+class TaskForm(forms.ModelForm):
+    """
+    Form creating or updating a task, its fields also validate the rows of
+    the task imports.
+    """
+
+    class Meta:
+        model = Task
+        fields = ['name', 'description', 'visibility', 'difficulty']
+
+
 class ProfileForm(forms.ModelForm):
     """
     Form creating a user Profile
@@ -42,6 +54,8 @@ class ProfileForm(forms.ModelForm):
             Please select a team. Choose wisely your faction as this can't be
             changed later on.
             """)}
+        # The teams are rarely changed, their choices are read from the cache
+        self.fields["team"].choices = [("", self.fields["team"].empty_label)] + cached_teams()
 
     def save(self):
         """Attach the related user to the profile."""
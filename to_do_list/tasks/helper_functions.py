@@ -1,12 +1,11 @@
 # -*- coding: utf-8 -*-
 
 """
-Helper functions for the tasks app: calculate_reputation_gain and
-give_reputation_reward.
+Helper functions for the tasks app: calculate_reputation_gain,
+give_reputation_reward and give_reputation_rewards.
 """
 
-from .models import Profile, Task
-from django.db.models import F
+from .models import ReputationEvent, Task
 
 
 def calculate_reputation_gain(task):
@@ -32,10 +31,19 @@ def calculate_reputation_gain(task):
 
 def give_reputation_reward(task):
     """
-    Add the reputation reward to the profile of the user who completed the
-    task.
+    Record the reputation reward of the user who completed the task in the
+    ledger, see give_reputation_rewards.
     """
-    reward = calculate_reputation_gain(task)
-    profile = Profile.objects.get(user=task.completed_by)
-    profile.reputation = F('reputation') + reward
-    profile.save()
+    give_reputation_rewards([task])
+
+
+def give_reputation_rewards(tasks):
+    """
+    Append the reputation rewards of the tasks to the ledger with a single
+    INSERT, the profiles of the users who completed them are left untouched
+    until reputation.aggregate_events folds the events in.
+    """
+    ReputationEvent.objects.bulk_create([
+        ReputationEvent(user_id=task.completed_by_id, task_id=task.pk, amount=calculate_reputation_gain(task))
+        for task in tasks if task.completed_by_id is not None
+    ])
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+"""
+History of the task transitions. record_transitions appends them to
+TaskStatusHistory with a single INSERT ... SELECT of the rows just updated.
+
+On PostgreSQL 11 or later the table is range-partitioned by month on
+modified_at -- see migration 0010 -- in partitions named <table>_YYYYMM (UTC
+months), a DEFAULT partition taking the rows of the months without one.
+ensure_partitions creates the partitions of the coming months and
+rollup_history counts the transitions of the months past the retention
+period into TaskStatusRollup, then drops their partitions. Elsewhere their
+rows are deleted.
+"""
+
+import re
+from datetime import date, datetime
+
+from django.db import connections, router, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Task, TaskStatusHistory, TaskStatusRollup
+
+# Number of months the history is kept for, the current one excluded
+KEEP_MONTHS = 12
+# Number of months ahead of the current one which get their partition
+MONTHS_AHEAD = 2
+
+
+def month_start(value):
+    """Return the first day of the month of a date or datetime."""
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    """Return the first day of the month count months after the month given."""
+    years, index = divmod(month.month - 1 + count, 12)
+    return date(month.year + years, index + 1, 1)
+
+
+def month_bounds(month):
+    """Return the UTC datetimes bounding a month, as the partitions are."""
+    return [datetime(m.year, m.month, 1, tzinfo=timezone.utc) for m in (month, add_months(month, 1))]
+
+
+def partition_name(month):
+    return '{0}_{1:%Y%m}'.format(TaskStatusHistory._meta.db_table, month)
+
+
+def record_transitions(pks, user):
+    """
+    Append the state of the tasks pks -- just changed by a transition made by
+    the user -- to their history, with one INSERT ... SELECT: the status and
+    modified_at are read by the database rather than by another query.
+    """
+    connection = connections[router.db_for_write(TaskStatusHistory)]
+    states = Task.objects.filter(pk__in=pks).values_list('pk', 'status', 'is_removed', 'modified_at').order_by()
+    sql, params = states.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {0} (user_id, task_id, status, is_removed, modified_at) '
+            'SELECT %s, states.* FROM ({1}) AS states'.format(
+                connection.ops.quote_name(TaskStatusHistory._meta.db_table), sql),
+            (user.pk,) + tuple(params),
+        )
+
+
+def is_partitioned(connection):
+    """Return whether the history table is a partitioned one."""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TaskStatusHistory._meta.db_table])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def partitions(connection):
+    """Return {month: name} of the monthly partitions of the history table."""
+    table = TaskStatusHistory._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(%s)", [table]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    pattern = re.compile(r'^{0}_(\d{{4}})(\d{{2}})$'.format(re.escape(table)))
+    matches = [(pattern.match(name), name) for name in names]
+    return {date(int(m.group(1)), int(m.group(2)), 1): name for m, name in matches if m}
+
+
+def create_partitions(first_month, count):
+    """
+    Create the missing partitions of count months from first_month, moving
+    their rows out of the DEFAULT partition -- PostgreSQL refuses to create a
+    partition whose rows are in it. Return the months created.
+    """
+    connection = connections[router.db_for_write(TaskStatusHistory)]
+    if not is_partitioned(connection):
+        return []
+    quote = connection.ops.quote_name
+    table = TaskStatusHistory._meta.db_table
+    existing = partitions(connection)
+    created = []
+    for month in (add_months(first_month, i) for i in range(count)):
+        if month in existing:
+            continue
+        bounds = month_bounds(month)
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE moved_history (LIKE {0})'.format(quote(table)))
+            cursor.execute(
+                'WITH moved AS (DELETE FROM {0} WHERE modified_at >= %s AND modified_at < %s RETURNING *) '
+                'INSERT INTO moved_history SELECT * FROM moved'.format(quote(table + '_default')), bounds
+            )
+            cursor.execute('CREATE TABLE {0} PARTITION OF {1} FOR VALUES FROM (%s) TO (%s)'.format(
+                quote(partition_name(month)), quote(table)), bounds)
+            cursor.execute('INSERT INTO {0} SELECT * FROM moved_history'.format(quote(table)))
+            cursor.execute('DROP TABLE moved_history')
+        created.append(month)
+    return created
+
+
+def ensure_partitions(months_ahead=MONTHS_AHEAD):
+    """Create the missing partitions of the current month and of the months_ahead next ones."""
+    return create_partitions(month_start(timezone.now()), months_ahead + 1)
+
+
+def rollup_history(keep_months=KEEP_MONTHS):
+    """
+    Count the transitions of the months older than keep_months into
+    TaskStatusRollup, then drop their partitions and delete their remaining
+    rows. Return the number of transitions rolled up.
+    """
+    connection = connections[router.db_for_write(TaskStatusHistory)]
+    cutoff = add_months(month_start(timezone.now()), -keep_months)
+    old = TaskStatusHistory.objects.filter(modified_at__lt=month_bounds(cutoff)[0])
+    with transaction.atomic(using=connection.alias):
+        counts = old.annotate(month=TruncMonth('modified_at', tzinfo=timezone.utc)).values(
+            'month', 'status', 'is_removed').annotate(count=Count('pk')).order_by()
+        rolled_up = 0
+        for row in counts:
+            month = month_start(row['month'])
+            updated = TaskStatusRollup.objects.filter(
+                month=month, status=row['status'], is_removed=row['is_removed']).update(count=F('count') + row['count'])
+            if not updated:
+                TaskStatusRollup.objects.create(
+                    month=month, status=row['status'], is_removed=row['is_removed'], count=row['count'])
+            rolled_up += row['count']
+        if is_partitioned(connection):
+            with connection.cursor() as cursor:
+                for month, name in partitions(connection).items():
+                    if month < cutoff:
+                        cursor.execute('DROP TABLE {0}'.format(connection.ops.quote_name(name)))
+        old.delete()
+    return rolled_up
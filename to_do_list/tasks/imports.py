@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+"""
+Import of tasks from CSV or NDJSON, read and validated row by row with the
+fields of TaskForm -- the rules of the creation form -- so that memory stays
+flat whatever the size of the file. The valid rows are inserted by batches
+with bulk_create or, on PostgreSQL once there is more than one batch,
+streamed into a single COPY. The invalid rows are skipped and reported.
+"""
+
+import csv
+import json
+import os
+from itertools import chain, islice
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .cache import bump_task_versions, task_scopes
+from .exports import Echo
+from .forms import TaskForm
+from .models import Task
+
+# Columns of the rows, the fields of TaskForm
+FIELDS = tuple(TaskForm._meta.fields)
+# Number of tasks inserted by bulk_create at once
+BATCH_SIZE = 2000
+# Number of invalid rows whose errors are reported, the others are counted
+MAX_ERRORS = 100
+# Columns written by COPY, the defaults of the model being given explicitly
+COPY_COLUMNS = FIELDS + (
+    'creator_id', 'creator_username', 'creator_team_id', 'status', 'is_removed', 'created_at', 'modified_at',
+)
+
+
+def read_csv(lines):
+    """Yield the rows of CSV lines as dicts, the first line naming the columns."""
+    yield from csv.DictReader(lines)
+
+
+def read_ndjson(lines):
+    """Yield the objects of NDJSON lines, None for the lines which can't be decoded."""
+    for line in lines:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+# Reader of each format
+READERS = {'csv': read_csv, 'ndjson': read_ndjson}
+
+
+def guess_format(filename):
+    """Return the format of a file from its extension, None if unknown."""
+    format = os.path.splitext(filename or '')[1].lstrip('.').lower()
+    return format if format in READERS else None
+
+
+# Types of the values of the columns, the others are invalid
+SCALARS = (str, int, float, type(None))
+
+
+class ImportReport:
+    """Outcome of an import: number of tasks created and of invalid rows, errors of the first ones."""
+
+    def __init__(self):
+        self.created = 0
+        self.invalid = 0
+        self.errors = []
+
+    def add_error(self, number, errors):
+        """Record the errors -- {column: messages} -- of the row number."""
+        self.invalid += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'row': number, 'errors': errors})
+
+    def as_dict(self):
+        return {'created': self.created, 'invalid': self.invalid, 'errors': self.errors}
+
+
+def clean_rows(rows, report):
+    """
+    Yield the values of the valid rows as tuples of FIELDS, cleaned by the
+    fields of TaskForm. The choices may be given by their value or by their
+    label, as exported. The errors of the others are added to the report,
+    among them the values which are neither strings nor numbers -- the lists
+    and objects of NDJSON rows.
+    """
+    fields = [(name, TaskForm.base_fields[name]) for name in FIELDS]
+    labels = {
+        'visibility': Task.VISIBILITIES, 'difficulty': Task.DIFFICULTIES,
+    }
+    labels = {name: {str(label): value for value, label in choices} for name, choices in labels.items()}
+    for number, row in enumerate(rows, 1):
+        if not isinstance(row, dict):
+            report.add_error(number, {'__all__': ["The row is not an object"]})
+            continue
+        values, errors = [], {}
+        for name, field in fields:
+            value = row.get(name)
+            if not isinstance(value, SCALARS):
+                errors[name] = ["The value must be a string or a number"]
+                continue
+            value = labels[name].get(value, value) if name in labels else value
+            try:
+                values.append(field.clean(value))
+            except ValidationError as e:
+                errors[name] = e.messages
+        if errors:
+            report.add_error(number, errors)
+        else:
+            yield tuple(values)
+
+
+def insert_batches(values, creator_id, username, team_id, batch_size):
+    """Insert the tasks of values with bulk_create, batch_size at a time. Return their number."""
+    created = 0
+    for batch in iter(lambda: list(islice(values, batch_size)), []):
+        Task.objects.bulk_create([
+            Task(creator_id=creator_id, creator_username=username, creator_team_id=team_id,
+                 **dict(zip(FIELDS, task_values)))
+            for task_values in batch
+        ])
+        created += len(batch)
+    return created
+
+
+class CopyFile:
+    """File-like object reading the CSV lines of the rows of COPY_COLUMNS, for copy_expert."""
+
+    def __init__(self, rows):
+        writer = csv.writer(Echo(), lineterminator='\n')
+        self.lines = (writer.writerow(row) for row in rows)
+        self.rest = ''
+
+    def read(self, size=-1):
+        chunks, length = [self.rest], len(self.rest)
+        for line in self.lines:
+            chunks.append(line)
+            length += len(line)
+            if 0 <= size <= length:
+                break
+        data = ''.join(chunks)
+        if size < 0:
+            size = len(data)
+        self.rest = data[size:]
+        return data[:size]
+
+
+def copy_tasks(connection, values, creator_id, username, team_id):
+    """Insert the tasks of values with a single COPY -- PostgreSQL only. Return their number."""
+    now = timezone.now().isoformat()
+    count = [0]
+
+    def rows():
+        for task_values in values:
+            count[0] += 1
+            yield task_values + (
+                creator_id, username, team_id if team_id is not None else '', Task.STATUS.new, 'f', now, now
+            )
+
+    sql = 'COPY {0} ({1}) FROM STDIN WITH (FORMAT csv)'.format(
+        connection.ops.quote_name(Task._meta.db_table),
+        ', '.join(connection.ops.quote_name(Task._meta.get_field(c).column) for c in COPY_COLUMNS),
+    )
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql, CopyFile(rows()))
+    return count[0]
+
+
+def import_tasks(rows, creator_id, team_id, batch_size=BATCH_SIZE, copy=None):
+    """
+    Create the tasks of the rows -- dicts of FIELDS -- for the creator and
+    her team, in a single transaction, and return the ImportReport. COPY is
+    used if copy is True or, if it is None, on PostgreSQL once the valid rows
+    exceed one batch.
+    """
+    report = ImportReport()
+    values = clean_rows(rows, report)
+    connection = connections[router.db_for_write(Task)]
+    # The username of the creator is denormalised on the tasks
+    username = get_user_model().objects.using(connection.alias).values_list(
+        'username', flat=True).get(pk=creator_id)
+    with transaction.atomic(using=connection.alias):
+        first = list(islice(values, batch_size))
+        if copy is None:
+            copy = connection.vendor == 'postgresql' and len(first) == batch_size
+        values = chain(first, values)
+        if copy:
+            report.created = copy_tasks(connection, values, creator_id, username, team_id)
+        else:
+            report.created = insert_batches(values, creator_id, username, team_id, batch_size)
+    if report.created:
+        # Neither bulk_create nor COPY send the signals, the scopes the tasks
+        # may be visible in are bumped at once, once committed as the import
+        # may run in the transaction of the request
+        scopes = task_scopes(Task(creator_id=creator_id, creator_team_id=team_id, visibility=Task.VISIBILITIES.public))
+        transaction.on_commit(lambda: bump_task_versions(*scopes), using=connection.alias)
+    return report
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""
+Reputation leaderboards: of all the users, of the members of each team and
+of the teams by their total reputation. The rankings are precomputed in
+sorted sets -- Redis ones if settings.TASKS_LEADERBOARD_CACHE_ALIAS is a
+django-redis cache, in-process ones otherwise, e.g. for the tests -- so that
+a rank is read in O(log n) instead of sorting all the profiles. They are
+incremented as the reputation events are folded into the profiles, see
+reputation.aggregate_batch, and can be rebuilt from the profiles by the
+rebuild_leaderboards command.
+"""
+
+import bisect
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Sum
+
+from .models import Profile
+
+try:
+    from redis.exceptions import RedisError
+except ImportError:  # Without redis, only the in-process rankings are used
+    RedisError = OSError
+
+logger = logging.getLogger(__name__)
+
+# Boards of all the users and of the teams, the ones of the members of a team
+# are named by team_board
+GLOBAL, TEAMS = 'global', 'teams'
+KEY_PREFIX = 'tasks:leaderboard:'
+
+
+def team_board(team_id):
+    """Name of the board of the members of a team."""
+    return 'team:{0}'.format(team_id)
+
+
+class RedisRankings:
+    """Boards stored as Redis sorted sets, members being ids."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def increment(self, increments):
+        """Add the amounts of increments -- {(board, member): amount} -- in a single round trip."""
+        pipe = self.client.pipeline(transaction=False)
+        for (board, member), amount in increments.items():
+            pipe.execute_command('ZINCRBY', KEY_PREFIX + board, amount, member)
+            pipe.execute_command('SADD', KEY_PREFIX + 'boards', board)
+        pipe.execute()
+
+    def replace(self, boards):
+        """Replace all the boards by boards -- {board: {member: score}} -- atomically."""
+        pipe = self.client.pipeline(transaction=True)
+        for board in self.client.smembers(KEY_PREFIX + 'boards'):
+            pipe.delete(KEY_PREFIX + board.decode())
+        pipe.delete(KEY_PREFIX + 'boards')
+        for board, scores in boards.items():
+            if scores:
+                args = [value for member, score in scores.items() for value in (score, member)]
+                pipe.execute_command('ZADD', KEY_PREFIX + board, *args)
+                pipe.sadd(KEY_PREFIX + 'boards', board)
+        pipe.execute()
+
+    def top(self, board, count):
+        """Return the (member, score) of the count first of the board."""
+        return [(int(m), int(s)) for m, s in self.client.zrevrange(KEY_PREFIX + board, 0, count - 1, withscores=True)]
+
+    def rank(self, board, member):
+        """Return the rank of member in the board, 1 for the first, None if absent."""
+        rank = self.client.zrevrank(KEY_PREFIX + board, member)
+        return None if rank is None else rank + 1
+
+    def count(self, board):
+        return self.client.zcard(KEY_PREFIX + board)
+
+
+def local_entry(score, member):
+    """
+    Entry of a member in the sorted list of a board of LocalRankings,
+    ordering as ZREVRANGE does: by descending score, then by descending
+    member as a string -- Redis compares the members byte by byte. The bytes
+    are negated, followed by 0 for a member to come after the ones it is a
+    prefix of.
+    """
+    return -score, tuple(-b for b in str(member).encode()) + (0,), member
+
+
+class LocalRankings:
+    """
+    Boards kept in the process with the interface of RedisRankings, each one
+    a dict of the scores and a list of the local_entry of the members kept
+    sorted.
+    """
+
+    def __init__(self):
+        self.boards = {}
+
+    def _board(self, board):
+        return self.boards.setdefault(board, ({}, []))
+
+    def increment(self, increments):
+        for (board, member), amount in increments.items():
+            scores, order = self._board(board)
+            if member in scores:
+                del order[bisect.bisect_left(order, local_entry(scores[member], member))]
+            scores[member] = scores.get(member, 0) + amount
+            bisect.insort(order, local_entry(scores[member], member))
+
+    def replace(self, boards):
+        self.boards = {
+            board: (dict(scores), sorted(local_entry(s, m) for m, s in scores.items()))
+            for board, scores in boards.items()
+        }
+
+    def top(self, board, count):
+        return [(m, -s) for s, _key, m in self._board(board)[1][:count]]
+
+    def rank(self, board, member):
+        scores, order = self._board(board)
+        if member not in scores:
+            return None
+        return bisect.bisect_left(order, local_entry(scores[member], member)) + 1
+
+    def count(self, board):
+        return len(self._board(board)[0])
+
+
+_local_rankings = LocalRankings()
+
+
+def rankings():
+    """Return the rankings store, see the docstring of the module."""
+    alias = settings.TASKS_LEADERBOARD_CACHE_ALIAS
+    if settings.CACHES.get(alias, {}).get('BACKEND', '').startswith('django_redis.'):
+        from django_redis import get_redis_connection
+        return RedisRankings(get_redis_connection(alias))
+    return _local_rankings
+
+
+def add_reputation(gains):
+    """
+    Increment the boards by the gains -- (user_id, team_id, amount) -- of
+    reputation. Failures are logged rather than raised, the profiles being
+    the reference the boards are rebuilt from.
+    """
+    increments = defaultdict(int)
+    for user_id, team_id, amount in gains:
+        if team_id is None:
+            continue
+        increments[GLOBAL, user_id] += amount
+        increments[team_board(team_id), user_id] += amount
+        increments[TEAMS, team_id] += amount
+    if not increments:
+        return
+    try:
+        rankings().increment(increments)
+    except RedisError:
+        logger.exception("The leaderboards couldn't be updated, rebuild them with rebuild_leaderboards")
+
+
+def rebuild_leaderboards():
+    """Replace the boards by the rankings of all the profiles. Return the number of profiles ranked."""
+    boards = defaultdict(dict)
+    for user_id, team_id, reputation in Profile.objects.values_list('user_id', 'team_id', 'reputation').iterator():
+        boards[GLOBAL][user_id] = reputation
+        boards[team_board(team_id)][user_id] = reputation
+    boards[TEAMS] = dict(Profile.objects.values_list('team_id').annotate(total=Sum('reputation')).order_by())
+    rankings().replace(boards)
+    return len(boards[GLOBAL])
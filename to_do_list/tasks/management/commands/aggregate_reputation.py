@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+"""
+Management command folding the pending reputation events into the profiles,
+see tasks.reputation. Meant to be run periodically, e.g. every minute by cron.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...reputation import BATCH_SIZE, aggregate_events, check_reputation
+
+
+class Command(BaseCommand):
+    help = "Fold the pending reputation events into the profiles, checking them against the ledger if asked."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Number of events folded in at once")
+        parser.add_argument('--check', action='store_true', help="Check that the profiles agree with the ledger")
+
+    def handle(self, *args, **options):
+        applied = aggregate_events(batch_size=options['batch_size'])
+        self.stdout.write("{0} reputation events applied".format(applied))
+        if options['check']:
+            mismatches = check_reputation()
+            for user_id, reputation, ledger in mismatches:
+                self.stderr.write("User {0}: reputation {1}, ledger {2}".format(user_id, reputation, ledger))
+            if mismatches:
+                raise CommandError("{0} profiles disagree with the ledger".format(len(mismatches)))
+            self.stdout.write("The profiles agree with the ledger")
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+"""Management command running the micro-benchmarks of tasks.benchmarks."""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ...benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = "Run the micro-benchmarks of the tasks app, all of them if none is named."
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=', '.join(BENCHMARKS))
+        parser.add_argument('--size', type=int, help="Number of tasks to seed")
+        parser.add_argument('--repeat', type=int, help="Number of repetitions, the best one is kept")
+
+    def handle(self, *args, **options):
+        names = options['names'] or list(BENCHMARKS)
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError("Unknown benchmark(s): {0}".format(', '.join(sorted(unknown))))
+        for name in names:
+            # The data seeded by the benchmark is rolled back
+            with transaction.atomic():
+                measures = BENCHMARKS[name](size=options['size'], repeat=options['repeat'])
+                transaction.set_rollback(True)
+            for label, value, unit in measures:
+                self.stdout.write("{0:<24} {1:<36} {2:>12.2f} {3}".format(name, label, value, unit))
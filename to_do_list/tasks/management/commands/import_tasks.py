@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+"""Management command importing tasks from a CSV or NDJSON file, see tasks.imports."""
+
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...imports import BATCH_SIZE, READERS, guess_format, import_tasks
+from ...models import Profile
+
+
+class Command(BaseCommand):
+    help = "Import tasks from a CSV or NDJSON file, '-' reading the standard input."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File of the tasks")
+        parser.add_argument('--user', help="Username of the creator of the tasks")
+        parser.add_argument('--format', choices=sorted(READERS), help="Format of the file, by default its extension")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Number of tasks inserted at once")
+        parser.add_argument('--no-copy', action='store_false', dest='copy', default=None,
+                            help="Always insert with bulk_create, never with COPY")
+
+    def handle(self, *args, **options):
+        if not options['user']:
+            raise CommandError("Please give the creator of the tasks with --user")
+        profile = Profile.objects.filter(user__username=options['user']).select_related('user').first()
+        if profile is None:
+            raise CommandError("No user {0} with a profile".format(options['user']))
+        path = options['path']
+        format = options['format'] or guess_format(path)
+        if format is None:
+            raise CommandError("Unknown format, please give it with --format")
+        lines = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8-sig')
+        try:
+            report = import_tasks(READERS[format](lines), profile.user_id, profile.team_id,
+                                  batch_size=options['batch_size'], copy=options['copy'])
+        except (ValueError, csv.Error) as e:
+            raise CommandError("The file can't be read: {0}".format(e))
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+        for error in report.errors:
+            self.stderr.write("Row {0}: {1}".format(error['row'], error['errors']))
+        self.stdout.write("{0} tasks created, {1} invalid rows skipped".format(report.created, report.invalid))
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+
+"""Management command rebuilding the leaderboards from the profiles, see tasks.leaderboards."""
+
+from django.core.management.base import BaseCommand
+
+from ...leaderboards import rebuild_leaderboards
+
+
+class Command(BaseCommand):
+    help = "Rebuild the reputation leaderboards from the profiles, e.g. after Redis lost them."
+
+    def handle(self, *args, **options):
+        self.stdout.write("{0} profiles ranked".format(rebuild_leaderboards()))
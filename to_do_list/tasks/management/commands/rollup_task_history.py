@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+"""
+Management command maintaining the task history, see tasks.history: creates
+the partitions of the coming months and rolls up the months past the
+retention period. Meant to be run daily.
+"""
+
+from django.core.management.base import BaseCommand
+
+from ...history import KEEP_MONTHS, MONTHS_AHEAD, ensure_partitions, rollup_history
+
+
+class Command(BaseCommand):
+    help = "Create the coming partitions of the task history and roll up its old months."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-months', type=int, default=KEEP_MONTHS,
+                            help="Number of past months whose history is kept")
+        parser.add_argument('--months-ahead', type=int, default=MONTHS_AHEAD,
+                            help="Number of coming months to create the partitions of")
+
+    def handle(self, *args, **options):
+        for month in ensure_partitions(options['months_ahead']):
+            self.stdout.write("Partition of {0:%Y-%m} created".format(month))
+        rolled_up = rollup_history(options['keep_months'])
+        self.stdout.write("{0} transitions rolled up".format(rolled_up))
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+
+"""
+Metrics of the tasks app, served to the staff in the text format of
+Prometheus by views.metrics_view: latency and number of the requests by URL
+name, their queries and time spent in the database -- timed by the cursors of
+QueryTimer, whatever settings.TASKS_QUERY_STATS -- time rendering the
+templates, hits of the caches and transitions of the tasks.
+Each process counts in memory. If settings.TASKS_METRICS_DIR is set -- a
+directory shared by the gunicorn workers of a server -- each process serving
+requests also writes its samples to a file of its own, at most every
+TASKS_METRICS_FLUSH_INTERVAL seconds and when it exits, and the metrics
+served are the sums of the files, including those of the workers which have
+exited since. The files left unchanged for TASKS_METRICS_RETENTION seconds
+are removed when the metrics are collected -- an idle worker writes its file
+again on its next request.
+"""
+
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.utils import CursorDebugWrapper, CursorWrapper
+from django.template.backends.django import DjangoTemplates, Template
+
+from .queries import SAVEPOINT_PREFIXES
+
+# Upper bounds of the buckets of the histograms, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+_lock = threading.Lock()
+# Samples of the process: {(sample name, ((label, value), ...)): value}
+_samples = {}
+_flushed_at = 0.0
+# Whether the process served requests, see maybe_flush
+_served = False
+# (pid, file name) of the process, see process_file
+_file = None
+# Metrics by name, in the order of the exposition
+METRICS = OrderedDict()
+# [queries, seconds] of the QueryTimer of the thread, if any
+_timed = threading.local()
+
+
+class Counter:
+    """Counter of the process, whose values are labelled by `labels`."""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        METRICS[name] = self
+
+    def key(self, values, suffix='', extra=()):
+        return self.name + suffix, tuple(zip(self.labels, (str(v) for v in values))) + extra
+
+    def inc(self, *values, amount=1):
+        key = self.key(values)
+        with _lock:
+            _samples[key] = _samples.get(key, 0) + amount
+
+    def set(self, *values, total):
+        """Set the counter to a total counted elsewhere in the process."""
+        with _lock:
+            _samples[self.key(values)] = total
+
+
+class Histogram(Counter):
+    """Histogram of the process, with the cumulative BUCKETS, labelled by `labels`."""
+
+    type = 'histogram'
+
+    def observe(self, seconds, *values):
+        with _lock:
+            for bound in BUCKETS:
+                key = self.key(values, '_bucket', (('le', format_value(bound)),))
+                _samples[key] = _samples.get(key, 0) + (seconds <= bound)
+            for suffix, amount in (('_count', 1), ('_sum', seconds)):
+                key = self.key(values, suffix)
+                _samples[key] = _samples.get(key, 0) + amount
+
+
+REQUESTS = Counter('tasks_http_requests_total', "Requests by URL name, method and status class.",
+                   ('view', 'method', 'status'))
+LATENCY = Histogram('tasks_http_request_duration_seconds', "Latency of the requests by URL name.", ('view',))
+DB_QUERIES = Counter('tasks_db_queries_total', "SQL queries of the requests by URL name.", ('view',))
+DB_DURATION = Histogram('tasks_db_duration_seconds', "Time of the SQL queries of a request by URL name.", ('view',))
+TEMPLATE_DURATION = Histogram('tasks_template_render_duration_seconds', "Time rendering a template by name.",
+                              ('template',))
+TABLE_CACHE = Counter('tasks_table_cache_requests_total', "Reads of the cached task tables by view and result.",
+                      ('view', 'result'))
+OBJECT_CACHE = Counter('tasks_object_cache_requests_total',
+                       "Reads of the profiles and teams cached by result: hits of the process, of the shared "
+                       "cache or misses, see cache.TwoLevelCache.", ('cache', 'result'))
+TRANSITIONS = Counter('tasks_task_transitions_total', "Tasks changed by a transition, once committed.",
+                      ('transition',))
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def count_object_caches():
+    """Copy the counters of the object caches of the process into OBJECT_CACHE."""
+    from .cache import object_cache_stats
+    for name, stats in object_cache_stats().items():
+        for result in ('hits', 'shared_hits', 'misses'):
+            OBJECT_CACHE.set(name, result, total=stats[result])
+
+
+def process_file():
+    """
+    Return the name of the file of the process in TASKS_METRICS_DIR: its pid
+    and the time of its first flush, as the pids of the workers which have
+    exited are reused.
+    """
+    global _file
+    if _file is None or _file[0] != os.getpid():
+        _file = (os.getpid(), '{0}-{1}.json'.format(os.getpid(), int(time.time() * 1000)))
+    return _file[1]
+
+
+def flush():
+    """Write the samples of the process to its file of TASKS_METRICS_DIR, if set."""
+    global _flushed_at
+    directory = settings.TASKS_METRICS_DIR
+    if not directory:
+        return
+    count_object_caches()
+    with _lock:
+        samples = [[name, labels, value] for (name, labels), value in _samples.items()]
+        _flushed_at = time.monotonic()
+    path = os.path.join(directory, process_file())
+    temporary = '{0}.{1}.tmp'.format(path, threading.get_ident())
+    with open(temporary, 'w') as f:
+        json.dump(samples, f)
+    # Readers see the former file or the new one, never a partial one
+    os.replace(temporary, path)
+
+
+def maybe_flush():
+    """
+    Flush the samples if the last flush is older than
+    TASKS_METRICS_FLUSH_INTERVAL. Called after each request: the process is
+    then flushed at exit as well.
+    """
+    global _served
+    _served = True
+    if settings.TASKS_METRICS_DIR and time.monotonic() - _flushed_at >= settings.TASKS_METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+@atexit.register
+def flush_at_exit():
+    # Not the management commands and the like, which served no request
+    if not _served:
+        return
+    try:
+        flush()
+    except Exception:
+        pass
+
+
+def collect():
+    """
+    Return the samples of all the processes of the server summed, as
+    {(name, labels): value}, those of this process only if TASKS_METRICS_DIR
+    isn't set. The files older than TASKS_METRICS_RETENTION are removed.
+    """
+    directory = settings.TASKS_METRICS_DIR
+    if not directory:
+        count_object_caches()
+        with _lock:
+            return dict(_samples)
+    if _served:
+        flush()
+    totals, now = defaultdict(float), time.time()
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            if now - os.path.getmtime(path) > settings.TASKS_METRICS_RETENTION:
+                os.remove(path)
+                continue
+            with open(path) as f:
+                samples = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in samples:
+            totals[name, tuple(tuple(label) for label in labels)] += value
+    return totals
+
+
+def exposition(samples):
+    """Return the samples in the text format of Prometheus, version 0.0.4."""
+    by_metric = defaultdict(list)
+    for (name, labels), value in samples.items():
+        for suffix in ('_bucket', '_count', '_sum', ''):
+            if name.endswith(suffix) and name[:len(name) - len(suffix)] in METRICS:
+                by_metric[name[:len(name) - len(suffix)]].append((name, labels, value))
+                break
+    lines = []
+    for metric in METRICS.values():
+        lines.append('# HELP {0} {1}'.format(metric.name, metric.help.replace('\\', r'\\')))
+        lines.append('# TYPE {0} {1}'.format(metric.name, metric.type))
+        for name, labels, value in sorted(by_metric[metric.name], key=sample_order):
+            label_text = ','.join('{0}="{1}"'.format(label, escape(value)) for label, value in labels)
+            lines.append('{0}{1} {2}'.format(name, '{' + label_text + '}' if labels else '', format_value(value)))
+    return '\n'.join(lines) + '\n'
+
+
+def sample_order(sample):
+    """Order of the samples of a metric: by labels, then the buckets by bound."""
+    name, labels, _ = sample
+    le = [float(value) for label, value in labels if label == 'le']
+    return [pair for pair in labels if pair[0] != 'le'], name, le
+
+
+def escape(value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+class TimingCursor:
+    """Cursor adding its queries, savepoints excluded, to the QueryTimer of the thread."""
+
+    def timed(self, method, sql, *args):
+        start = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            totals = getattr(_timed, 'totals', None)
+            if totals is not None and not sql.startswith(SAVEPOINT_PREFIXES):
+                totals[0] += 1
+                totals[1] += time.perf_counter() - start
+
+    def execute(self, sql, params=None):
+        return self.timed(super().execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self.timed(super().executemany, sql, param_list)
+
+
+class TimingCursorWrapper(TimingCursor, CursorWrapper):
+    pass
+
+
+class TimingCursorDebugWrapper(TimingCursor, CursorDebugWrapper):
+    pass
+
+
+def time_cursors(connection):
+    """Make the cursors of the connection -- debug ones included -- TimingCursor ones."""
+    attributes = vars(connection)
+    if 'make_cursor' not in attributes:
+        connection.make_cursor = lambda cursor: TimingCursorWrapper(cursor, connection)
+    if 'make_debug_cursor' not in attributes:
+        connection.make_debug_cursor = lambda cursor: TimingCursorDebugWrapper(cursor, connection)
+
+
+class QueryTimer:
+    """
+    Context manager counting the queries run on the connections of the thread
+    in the block, as queries, and their time, as seconds. Unlike
+    queries.QueryRecorder, it doesn't log the queries: the cursors only add
+    to two numbers.
+    """
+
+    def __enter__(self):
+        for connection in connections.all():
+            time_cursors(connection)
+        _timed.totals = [0, 0.0]
+        return self
+
+    def __exit__(self, *exc_info):
+        (self.queries, self.seconds), _timed.totals = _timed.totals, None
+
+
+class TimedTemplate(Template):
+    """Template whose renders are timed in TEMPLATE_DURATION."""
+
+    def render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            TEMPLATE_DURATION.observe(time.perf_counter() - start, self.origin.template_name)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Backend of the Django templates timing the renders of the templates loaded by name."""
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
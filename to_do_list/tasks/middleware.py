@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+"""
+Middleware of the tasks app: ProfileMiddleware sets request.profile, the
+profile of request.user loaded lazily -- at most once per request -- from
+cache.cached_profile. The views rely on get_profile, which works without the
+middleware as well. It also starts and ends the requests of the object
+caches, whose versions are then checked once per request.
+PrimaryStickinessMiddleware marks the users who write, see routers.py.
+QueryBudgetMiddleware records the queries of the views, see queries.py.
+MetricsMiddleware counts and times the requests, see metrics.py.
+"""
+
+import time
+
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from .cache import OBJECT_CACHES, cached_profile
+from .metrics import DB_DURATION, DB_QUERIES, LATENCY, REQUESTS, QueryTimer, maybe_flush
+from .queries import QueryRecorder, check_budget, record_queries
+from .routers import PRIMARY_COOKIE
+
+
+def get_profile(request):
+    """Return the profile of request.user, None without one, loaded once per request."""
+    if not hasattr(request, '_cached_profile'):
+        request._cached_profile = cached_profile(request.user)
+    return request._cached_profile
+
+
+class ProfileMiddleware:
+    """
+    Set request.profile, lazily, see get_profile, and delimit the request for
+    the object caches. Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.profile = SimpleLazyObject(lambda: get_profile(request))
+        for cache in OBJECT_CACHES:
+            cache.begin_request()
+        try:
+            return self.get_response(request)
+        finally:
+            for cache in OBJECT_CACHES:
+                cache.end_request()
+
+
+class PrimaryStickinessMiddleware:
+    """
+    Set the time of the request in the PRIMARY_COOKIE after the requests which
+    may write -- the ones not GET, HEAD or OPTIONS -- for the reads of the
+    user to go to the primary for settings.TASKS_PRIMARY_STICKINESS seconds.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            response.set_cookie(PRIMARY_COOKIE, '{0:.3f}'.format(time.time()),
+                                max_age=settings.TASKS_PRIMARY_STICKINESS, httponly=True)
+        return response
+
+
+class QueryBudgetMiddleware:
+    """
+    Record the queries of the requests by resolved URL name and check them
+    against the budget of the view, if settings.TASKS_QUERY_STATS is set.
+    Comes first, to count the queries of the other middleware as well.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.TASKS_QUERY_STATS:
+            return self.get_response(request)
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            record_queries(match.view_name, recorder.queries)
+            check_budget(match.view_name, recorder.queries)
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Count the requests by resolved URL name, method and status class, and
+    time them and their queries. Comes first, to time the other middleware as
+    well.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with QueryTimer() as queries:
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match is not None else ''
+        REQUESTS.inc(view_name, request.method, '{0}xx'.format(response.status_code // 100))
+        LATENCY.observe(time.perf_counter() - start, view_name)
+        DB_QUERIES.inc(view_name, amount=queries.queries)
+        DB_DURATION.observe(queries.seconds, view_name)
+        maybe_flush()
+        return response
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Partial index backing Task.objects.visible_to: removed tasks are never
+    listed so they are left out of the index.
+    """
+
+    dependencies = [
+        ('tasks', '0003_auto_20170216_1219'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=["CREATE INDEX tasks_task_visibility_creator_live "
+                 "ON tasks_task (visibility, creator_id) WHERE NOT is_removed"],
+            reverse_sql=["DROP INDEX tasks_task_visibility_creator_live"],
+        ),
+    ]
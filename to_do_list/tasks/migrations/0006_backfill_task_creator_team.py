@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Max
+
+BATCH_SIZE = 10000
+
+
+def backfill_creator_team(apps, schema_editor):
+    """
+    Copy the team of the creator onto the existing tasks by ranges of pk. The
+    migration is not atomic so that each batch is committed on its own and
+    the table is never locked as a whole.
+    """
+    Task = apps.get_model('tasks', 'Task')
+    last_pk = Task.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+    with schema_editor.connection.cursor() as cursor:
+        for start in range(0, last_pk + 1, BATCH_SIZE):
+            cursor.execute(
+                "UPDATE tasks_task SET creator_team_id = ("
+                "    SELECT team_id FROM tasks_profile WHERE tasks_profile.user_id = tasks_task.creator_id"
+                ") WHERE id >= %s AND id < %s AND creator_team_id IS NULL",
+                [start, start + BATCH_SIZE]
+            )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('tasks', '0005_task_creator_team'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_creator_team, migrations.RunPython.noop),
+        migrations.RunSQL(
+            sql=["CREATE INDEX tasks_task_visibility_creator_team_live "
+                 "ON tasks_task (visibility, creator_team_id) WHERE NOT is_removed"],
+            reverse_sql=["DROP INDEX tasks_task_visibility_creator_team_live"],
+        ),
+        # Superseded by the index above, which also serves the public tasks
+        migrations.RunSQL(
+            sql=["DROP INDEX IF EXISTS tasks_task_visibility_creator_live"],
+            reverse_sql=["CREATE INDEX tasks_task_visibility_creator_live "
+                         "ON tasks_task (visibility, creator_id) WHERE NOT is_removed"],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 09:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0006_backfill_task_creator_team'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='modified_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        # Existing tasks are deemed unchanged since their creation
+        migrations.RunSQL(
+            ["UPDATE tasks_task SET modified_at = created_at WHERE created_at IS NOT NULL"],
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 03:02
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tasks', '0007_task_modified_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReputationEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('applied_at', models.DateTimeField(blank=True, null=True)),
+                ('task', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reputation_events', to='tasks.Task')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reputation_events', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        # The aggregator only reads the pending events
+        migrations.RunSQL(
+            sql=["CREATE INDEX tasks_reputationevent_pending "
+                 "ON tasks_reputationevent (id) WHERE applied_at IS NULL"],
+            reverse_sql=["DROP INDEX tasks_reputationevent_pending"],
+        ),
+        # Opening balance of the reputation earned before the ledger, already
+        # counted in Profile.reputation
+        migrations.RunSQL(
+            ["INSERT INTO tasks_reputationevent (user_id, amount, created_at, applied_at) "
+             "SELECT user_id, reputation - 1, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP "
+             "FROM tasks_profile WHERE reputation <> 1"],
+            migrations.RunSQL.noop,
+        ),
+    ]
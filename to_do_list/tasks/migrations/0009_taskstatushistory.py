@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 03:11
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tasks', '0008_reputationevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskStatusHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.PositiveSmallIntegerField(choices=[(0, 'new'), (1, 'assigned'), (2, 'completed'), (3, 'closed')])),
+                ('is_removed', models.BooleanField(default=False)),
+                ('modified_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('task', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='history', to='tasks.Task')),
+                ('user', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TaskStatusRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('status', models.PositiveSmallIntegerField(choices=[(0, 'new'), (1, 'assigned'), (2, 'completed'), (3, 'closed')])),
+                ('is_removed', models.BooleanField(default=False)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='taskstatusrollup',
+            unique_together=set([('month', 'status', 'is_removed')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='taskstatushistory',
+            index_together=set([('task', 'modified_at')]),
+        ),
+    ]
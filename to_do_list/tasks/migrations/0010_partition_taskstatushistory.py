@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+from django.db import migrations
+import django.utils.timezone
+
+
+def partition_history(apps, schema_editor):
+    """
+    Recreate the -- still empty -- history table as range-partitioned by month
+    on modified_at, on PostgreSQL 11 or later only -- earlier versions have
+    neither DEFAULT partitions nor primary keys on partitioned tables, and
+    keep the plain table, see history.is_partitioned. The primary key has to
+    include modified_at, a DEFAULT partition takes the rows of the months
+    without partition, and the partitions of the current and next two months
+    are created, the following ones by the rollup_task_history command.
+    The log has no foreign key constraints, so that old partitions are dropped
+    at once and the tables it refers to can be truncated without it.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql' or connection.pg_version < 110000:
+        return
+    quote = schema_editor.quote_name
+    history = apps.get_model('tasks', 'TaskStatusHistory')._meta.db_table
+    schema_editor.execute('DROP TABLE {0}'.format(quote(history)))
+    schema_editor.execute(
+        'CREATE TABLE {0} ('
+        'id serial NOT NULL, '
+        'status smallint NOT NULL CHECK (status >= 0), '
+        'is_removed boolean NOT NULL, '
+        'modified_at timestamp with time zone NOT NULL, '
+        'task_id integer NOT NULL, '
+        'user_id integer NULL, '
+        'PRIMARY KEY (id, modified_at)'
+        ') PARTITION BY RANGE (modified_at)'.format(quote(history))
+    )
+    schema_editor.execute('CREATE INDEX {0} ON {1} (task_id, modified_at)'.format(
+        quote(history + '_task_id_modified_at'), quote(history)))
+    schema_editor.execute('CREATE TABLE {0} PARTITION OF {1} DEFAULT'.format(
+        quote(history + '_default'), quote(history)))
+    now = django.utils.timezone.now()
+    months = [(now.year + (now.month - 1 + i) // 12, (now.month - 1 + i) % 12 + 1) for i in range(4)]
+    for (year, month), end in zip(months, months[1:]):
+        schema_editor.execute(
+            'CREATE TABLE {0} PARTITION OF {1} FOR VALUES FROM (%s) TO (%s)'.format(
+                quote('{0}_{1}{2:02d}'.format(history, year, month)), quote(history)),
+            [datetime(year, month, 1, tzinfo=django.utils.timezone.utc),
+             datetime(end[0], end[1], 1, tzinfo=django.utils.timezone.utc)],
+        )
+
+
+class Migration(migrations.Migration):
+    """
+    Partitioning of the task history, in a migration of its own so that the
+    foreign keys Django adds at the end of 0009 are dropped with the table.
+    """
+
+    dependencies = [
+        ('tasks', '0009_taskstatushistory'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_history, migrations.RunPython.noop),
+    ]
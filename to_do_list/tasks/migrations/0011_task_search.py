@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# The tsvector of the name (weight A) and of the description (weight B)
+DOCUMENT = (
+    "setweight(to_tsvector('english', coalesce({0}name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce({0}description, '')), 'B')"
+)
+
+
+def trigram_available(connection):
+    """
+    Return whether pg_trgm is installed, or can be by the role of the
+    connection: a superuser or, from PostgreSQL 13 where pg_trgm is trusted,
+    a role allowed to CREATE in the database. Being listed among the
+    available extensions is not enough.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if cursor.fetchone() is not None:
+            return True
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return False
+        cursor.execute('SELECT rolsuper FROM pg_roles WHERE rolname = current_user')
+        if cursor.fetchone()[0]:
+            return True
+        if connection.pg_version < 130000:
+            return False
+        cursor.execute(
+            "SELECT bool_or(trusted) AND has_database_privilege(current_database(), 'CREATE') "
+            "FROM pg_available_extension_versions WHERE name = 'pg_trgm'"
+        )
+        return bool(cursor.fetchone()[0])
+
+
+def add_search(apps, schema_editor):
+    """
+    Add the search_vector column of the tasks -- PostgreSQL only, unknown to
+    the model -- kept current by a trigger on the inserts and the updates of
+    the name or description, whatever writes them (save, bulk_create, COPY).
+    It is GIN indexed, and the name has a trigram GIN index for the fuzzy
+    matches if the pg_trgm extension is installed or the role may install it,
+    see trigram_available and TaskQuerySet.search. Otherwise a superuser may
+    install it and create the index tasks_task_name_trgm later on.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    trigram = trigram_available(schema_editor.connection)
+    schema_editor.execute('ALTER TABLE tasks_task ADD COLUMN search_vector tsvector')
+    schema_editor.execute(
+        'CREATE FUNCTION tasks_task_search_vector() RETURNS trigger AS $$ '
+        'BEGIN NEW.search_vector := {0}; RETURN NEW; END '
+        '$$ LANGUAGE plpgsql'.format(DOCUMENT.format('NEW.'))
+    )
+    schema_editor.execute(
+        'CREATE TRIGGER tasks_task_search_vector BEFORE INSERT OR UPDATE OF name, description '
+        'ON tasks_task FOR EACH ROW EXECUTE PROCEDURE tasks_task_search_vector()'
+    )
+    schema_editor.execute('UPDATE tasks_task SET search_vector = {0}'.format(DOCUMENT.format('')))
+    schema_editor.execute('CREATE INDEX tasks_task_search_vector ON tasks_task USING gin (search_vector)')
+    if trigram:
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute('CREATE INDEX tasks_task_name_trgm ON tasks_task USING gin (name gin_trgm_ops)')
+
+
+def remove_search(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS tasks_task_name_trgm')
+    schema_editor.execute('DROP TRIGGER tasks_task_search_vector ON tasks_task')
+    schema_editor.execute('DROP FUNCTION tasks_task_search_vector()')
+    schema_editor.execute('ALTER TABLE tasks_task DROP COLUMN search_vector')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0010_partition_taskstatushistory'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search, remove_search),
+    ]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Max
+
+BATCH_SIZE = 10000
+
+# Columns the TaskTable can be sorted by, each one indexed with the pk as
+# tie-breaker so that a page of the sorted tasks is read in index order
+ORDERED_COLUMNS = ('name', 'creator_username', 'visibility', 'difficulty', 'status')
+
+
+def backfill_creator_username(apps, schema_editor):
+    """Copy the username of the creator onto the existing tasks by ranges of pk, see 0006."""
+    Task = apps.get_model('tasks', 'Task')
+    last_pk = Task.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+    with schema_editor.connection.cursor() as cursor:
+        for start in range(0, last_pk + 1, BATCH_SIZE):
+            cursor.execute(
+                "UPDATE tasks_task SET creator_username = ("
+                "    SELECT username FROM users_user WHERE users_user.id = tasks_task.creator_id"
+                ") WHERE id >= %s AND id < %s",
+                [start, start + BATCH_SIZE]
+            )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('tasks', '0011_task_search'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='creator_username',
+            field=models.CharField(blank=True, default='', editable=False, max_length=150),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_creator_username, migrations.RunPython.noop),
+    ] + [
+        migrations.RunSQL(
+            sql=["CREATE INDEX tasks_task_{0}_live ON tasks_task ({0}, id) WHERE NOT is_removed".format(column)],
+            reverse_sql=["DROP INDEX tasks_task_{0}_live".format(column)],
+        )
+        for column in ORDERED_COLUMNS
+    ]
@@ -2,10 +2,17 @@
 
 """Models for tasks app: Team, Profile, Tasks."""
 
+import re
+
+from django.db import connections
 from django.db.models import (
-    Model, ForeignKey, CharField, BooleanField, OneToOneField, DateTimeField,
-    ManyToManyField, PositiveIntegerField, PositiveSmallIntegerField,
+    Model, ForeignKey, CharField, BooleanField, OneToOneField, DateField,
+    DateTimeField, FloatField, IntegerField, ManyToManyField, PositiveIntegerField,
+    PositiveSmallIntegerField, Q, QuerySet, Case, When, Value,
 )
+from django.db.models.expressions import RawSQL
+from django.db.models.query import ValuesListIterable
+from django.db.models.sql.datastructures import EmptyResultSet
 
 from model_utils import Choices
 from django.utils.translation import ugettext_lazy as _
@@ -65,6 +72,145 @@ task_choices = Choices(
 )
 
 
+# Whether the pg_trgm extension is installed, by database alias
+_trigram_installed = {}
+
+
+def trigram_installed(alias):
+    """Return whether the pg_trgm extension is installed in the PostgreSQL database alias."""
+    if alias not in _trigram_installed:
+        with connections[alias].cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_installed[alias] = cursor.fetchone() is not None
+    return _trigram_installed[alias]
+
+
+# Fields of the tasks counted by value next to the choices of the TaskFilter
+FACET_FIELDS = ('status', 'visibility', 'difficulty')
+
+
+class TaskQuerySet(QuerySet):
+    """QuerySet gathering the filters on tasks shared by the views."""
+
+    def visible_to(self, user, team_id=None):
+        """
+        Return the tasks which have not been removed and are visible by the
+        user: the public ones, the ones she created and the team_only ones
+        created by a member of her team.
+        The rule is expressed as a single SQL predicate on tasks_task only,
+        served by the partial index on (visibility, creator_team_id) and the
+        index on creator_id. If team_id is not given, the team of the user is
+        looked up in a subquery rather than in an extra query.
+        """
+        VIZ = Task.VISIBILITIES
+        if team_id is None:
+            team_filter = Q(creator_team_id__in=Profile.objects.filter(user_id=user.pk).values('team_id'))
+        else:
+            team_filter = Q(creator_team_id=team_id)
+        return self.filter(is_removed=False).filter(
+            Q(visibility=VIZ.public) | Q(creator_id=user.pk) |
+            (Q(visibility=VIZ.team_only) & team_filter)
+        )
+
+    def search(self, text):
+        """
+        Return the tasks matching the text, annotated with their search_rank
+        and the most relevant first. On PostgreSQL, these are the tasks whose
+        search_vector (see migration 0011) holds all its words -- the last one
+        as a prefix -- or, if pg_trgm is installed, whose name is close to the
+        text by trigram word similarity, ranked by both; elsewhere, those
+        containing the text, ranked by whether their name does.
+        All the matches are ranked unless settings.TASKS_SEARCH_WINDOW is set,
+        opting in to rank only that number of the latest ones, see
+        search_window.
+        """
+        words = re.findall(r'\w+', text.lower())
+        if not words:
+            return self.none()
+        if connections[self.db].vendor != 'postgresql':
+            matching = self.filter(Q(name__icontains=text) | Q(description__icontains=text))
+            rank = Case(When(name__icontains=text, then=Value(1.0)), default=Value(0.0), output_field=FloatField())
+        else:
+            query, text = ' & '.join(words) + ':*', ' '.join(words)
+            matches = "tasks_task.search_vector @@ to_tsquery('english', %s)"
+            rank = "ts_rank(tasks_task.search_vector, to_tsquery('english', %s))"
+            params = (query,)
+            if trigram_installed(self.db):
+                matches += " OR %s <%% tasks_task.name"
+                rank += " + word_similarity(%s, tasks_task.name)"
+                params += (text,)
+            matching = self.annotate(search_matches=RawSQL(matches, params, output_field=BooleanField())).filter(
+                search_matches=True)
+            # search_rank is a double precision, which round-trips exactly
+            # through the cursors of the KeysetPaginator
+            rank = RawSQL('({0})::double precision'.format(rank), params, output_field=FloatField())
+        if settings.TASKS_SEARCH_WINDOW:
+            matching = self.filter(pk__in=self.search_window(matching))
+        return matching.annotate(search_rank=rank).order_by('-search_rank', '-pk')
+
+    def search_window(self, matching):
+        """
+        Return the pks of the settings.TASKS_SEARCH_WINDOW latest tasks of
+        the matching queryset, the latest first. They are looked for in ranges
+        of pks a hundred times wider at each step, starting from the latest ones: a
+        frequent word is found in the first range, and a rare one is looked
+        up in the index of the few wide ranges -- whereas ordering all the
+        matches by pk would cost as many rows as the word has matches, and
+        walking the pk index backwards as many as the table has for a rare
+        word, the planner not telling them apart for the prefixes.
+        """
+        size = settings.TASKS_SEARCH_WINDOW
+        high = self.model._default_manager.using(self.db).order_by('-pk').values_list('pk', flat=True).first()
+        pks, span = [], size * 10
+        while high is not None and high > 0 and len(pks) < size:
+            low = high - span
+            pks += sorted(matching.filter(pk__gt=low, pk__lte=high).values_list('pk', flat=True), reverse=True)
+            high, span = low, span * 100
+        return pks[:size]
+
+    def facets(self, fields=FACET_FIELDS):
+        """
+        Return the number of tasks by value of each of the fields, as
+        {field: {value: count}}, counted in a single query: GROUP BY GROUPING
+        SETS on PostgreSQL, a UNION ALL of GROUP BYs elsewhere. The fields
+        can't be null -- a null tells the counts of the other fields apart.
+        """
+        facets = {field: {} for field in fields}
+        try:
+            sql, params = self.order_by().values(*fields).query.sql_with_params()
+        except EmptyResultSet:
+            return facets
+        if connections[self.db].vendor == 'postgresql':
+            query = 'SELECT {0}, COUNT(*) FROM ({1}) AS tasks GROUP BY GROUPING SETS ({2})'.format(
+                ', '.join(fields), sql, ', '.join('({0})'.format(field) for field in fields))
+        else:
+            query = ' UNION ALL '.join(
+                'SELECT {0}, COUNT(*) FROM ({1}) AS tasks GROUP BY {2}'.format(
+                    ', '.join(f if f == field else 'NULL' for f in fields), sql, field)
+                for field in fields
+            )
+            params *= len(fields)
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(query, params)
+            for row in cursor.fetchall():
+                for field, value in zip(fields, row):
+                    if value is not None:
+                        facets[field][value] = row[-1]
+        return facets
+
+    def listing(self):
+        """
+        Return the tasks as TaskRow records, fetching only the columns shown
+        in the TaskTable -- the username of the creator is denormalised, no
+        table is joined and no Task nor User instance is built. The
+        search_rank is fetched as well if annotated.
+        """
+        lookups = TaskRow.lookups + (('search_rank',) if 'search_rank' in self.query.annotations else ())
+        clone = self.values_list(*lookups)
+        clone._iterable_class = TaskRowIterable
+        return clone
+
+
 class Task(Model):
     """
     Model for the tasks of the to_do_list
@@ -84,7 +230,13 @@ class Task(Model):
         choices=VISIBILITIES, default=VISIBILITIES.public
     )
     created_at = DateTimeField(default=timezone.now, blank=True, null=True)
+    modified_at = DateTimeField(auto_now=True)
     creator = ForeignKey(USER_MODEL, related_name='created_tasks')
+    # Denormalised team of the creator -- teams can't be changed once chosen
+    creator_team = ForeignKey(Team, null=True, blank=True, editable=False)
+    # Denormalised username of the creator, the tasks are sorted by it without
+    # joining users_user -- kept current by signals.rename_creator
+    creator_username = CharField(max_length=150, blank=True, editable=False)
     followers = ManyToManyField(USER_MODEL)
     is_removed = BooleanField(default=False)
     assigned_to = ForeignKey(USER_MODEL, null=True, blank=True, related_name='assigned_tasks')
@@ -99,9 +251,29 @@ class Task(Model):
         choices=DIFFICULTIES, default=DIFFICULTIES.OK
     )
 
+    objects = TaskQuerySet.as_manager()
+    # Visibility of the task when it was loaded from the database
+    loaded_visibility = None
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the visibility, the cache of its former scopes is invalidated on save."""
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_visibility = instance.__dict__.get('visibility')
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Copy the team and the username of the creator when the task is created."""
+        if self._state.adding and self.creator_team_id is None:
+            self.creator_team_id = Profile.objects.filter(
+                user_id=self.creator_id).values_list('team_id', flat=True).first()
+        if self._state.adding and not self.creator_username:
+            self.creator_username = self.creator.username
+        super().save(*args, **kwargs)
+
     def is_new(self):
         """Shortcut function - returns a Boolean True if status is new."""
         return self.status == Task.STATUS.new
@@ -111,22 +283,115 @@ class Task(Model):
         VIZ = Task.VISIBILITIES
         return (
             self.visibility == VIZ.public or self.creator == user or
-            (self.visibility == VIZ.team_only and self.creator.profile.team_id == user.profile.team_id)
+            (self.visibility == VIZ.team_only and self.creator_team_id == user.profile.team_id)
         )
 
 
-# class TaskStatusHistory(Model):
-#     """
-#     Feature to add: class keeping track of the status history for a task
-#     """
-#     STATUS = task_choices
-#     task = ForeignKey(Task)
-#     status = PositiveSmallIntegerField(choices=STATUS)
-#     modified_at = DateTimeField(default=timezone.now, blank=True, null=True)
-#
-#     def __str__(self):
-#         return "{1} {0} for {2}".format(self.amount, self.currency,
-#                                         self.business)
-#
-#     class Meta:
-#         verbose_name_plural = "task_status_histories"
+class TaskRow:
+    """
+    Lightweight record of a task as listed in the TaskTable, see
+    TaskQuerySet.listing. creator is the username of the creator.
+    """
+
+    __slots__ = ('pk', 'name', 'creator_id', 'creator', 'visibility', 'difficulty', 'status', 'search_rank')
+    lookups = ('pk', 'name', 'creator_id', 'creator_username', 'visibility', 'difficulty', 'status')
+
+    def __init__(self, *values):
+        self.search_rank = None
+        for attr, value in zip(self.__slots__, values):
+            setattr(self, attr, value)
+
+    def __repr__(self):
+        return '<TaskRow: {0}>'.format(self.pk)
+
+    @property
+    def creator_username(self):
+        # The field the creator column is sorted by, for the cursors
+        return self.creator
+
+    def get_visibility_display(self):
+        return Task.VISIBILITIES[self.visibility]
+
+    def get_difficulty_display(self):
+        return Task.DIFFICULTIES[self.difficulty]
+
+    def get_status_display(self):
+        return Task.STATUS[self.status]
+
+
+class TaskRowIterable(ValuesListIterable):
+    """Yield a TaskRow for each row of a values_list queryset."""
+
+    def __iter__(self):
+        for values in super().__iter__():
+            yield TaskRow(*values)
+
+
+# ----------------------------------------------------------------------------
+#                           Reputation
+# ----------------------------------------------------------------------------
+
+
+class ReputationEvent(Model):
+    """
+    Entry of the append-only ledger of the reputation: the amount earned by a
+    user for a task -- or her opening balance, without task. The pending
+    events are folded into Profile.reputation by reputation.aggregate_events,
+    which only sets their applied_at.
+    """
+
+    user = ForeignKey(USER_MODEL, related_name='reputation_events')
+    task = ForeignKey(Task, null=True, blank=True, related_name='reputation_events')
+    amount = IntegerField()
+    created_at = DateTimeField(default=timezone.now)
+    applied_at = DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return "{0:+d} for {1}".format(self.amount, self.user_id)
+
+
+# ----------------------------------------------------------------------------
+#                           Task history
+# ----------------------------------------------------------------------------
+
+
+class TaskStatusHistory(Model):
+    """
+    Append-only log of the transitions of the tasks: the status reached or the
+    removal, by whom and when. Written by the transitions, one INSERT each.
+    On PostgreSQL 11 or later the table is range-partitioned by month on
+    modified_at, see history.py, so old months are dropped rather than
+    deleted.
+    """
+
+    STATUS = task_choices
+    task = ForeignKey(Task, related_name='history', db_index=False)
+    status = PositiveSmallIntegerField(choices=STATUS)
+    is_removed = BooleanField(default=False)
+    user = ForeignKey(USER_MODEL, null=True, blank=True, related_name='+', db_index=False)
+    modified_at = DateTimeField(default=timezone.now)
+
+    class Meta:
+        index_together = [('task', 'modified_at')]
+
+    def __str__(self):
+        return "{0} {1} at {2}".format(self.task_id, self.get_status_display(), self.modified_at)
+
+
+class TaskStatusRollup(Model):
+    """
+    Number of transitions per month and outcome, kept once the history of the
+    month is past the retention period, see history.rollup_history.
+    """
+
+    STATUS = task_choices
+    month = DateField()
+    status = PositiveSmallIntegerField(choices=STATUS)
+    is_removed = BooleanField(default=False)
+    count = PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [('month', 'status', 'is_removed')]
+
+    def __str__(self):
+        return "{0} {1}: {2}".format(self.month, self.get_status_display(), self.count)
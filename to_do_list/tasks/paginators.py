@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+"""
+Paginators for the TaskTable: EstimatedCountPaginator relies on the planner
+statistics of PostgreSQL rather than on COUNT(*) for large lists, and
+KeysetPaginator walks through the tasks with opaque cursors instead of OFFSET,
+so that deep pages cost the same as the first one.
+"""
+
+import base64
+import json
+from functools import reduce
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django_tables2.rows import BoundRows
+
+
+def queryset_of(object_list):
+    """Return the queryset underlying the BoundRows given by django_tables2."""
+    data = getattr(object_list, 'data', object_list)
+    return data.data if hasattr(data, 'data') else data
+
+
+def planner_estimate(queryset):
+    """Return the number of rows of the queryset estimated by PostgreSQL."""
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def estimate_count(queryset, threshold):
+    """
+    Count the rows of the queryset exactly up to threshold, with a LIMIT
+    bounding the cost of the COUNT(*). Above it, return the estimate of the
+    planner rounded to two significant digits, on PostgreSQL only.
+    Return a tuple (count, is_estimated).
+    """
+    capped = queryset.order_by()[:threshold + 1].count()
+    if capped <= threshold:
+        return capped, False
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.count(), False
+    estimate = max(planner_estimate(queryset), capped)
+    return round(estimate, 2 - len(str(estimate))), True
+
+
+class EstimatedCountMixin:
+    """
+    Provide the count and is_estimated attributes of a paginator, see
+    estimate_count. The threshold defaults to
+    settings.TASKS_EXACT_COUNT_THRESHOLD.
+    """
+
+    count_threshold = None
+
+    @cached_property
+    def _estimated_count(self):
+        threshold = self.count_threshold
+        if threshold is None:
+            threshold = settings.TASKS_EXACT_COUNT_THRESHOLD
+        return estimate_count(queryset_of(self.object_list), threshold)
+
+    @property
+    def count(self):
+        return self._estimated_count[0]
+
+    @property
+    def is_estimated(self):
+        return self._estimated_count[1]
+
+
+class EstimatedCountPaginator(EstimatedCountMixin, Paginator):
+    """Page number based paginator whose count may be an estimate."""
+
+    def __init__(self, object_list, per_page, count_threshold=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_threshold = count_threshold
+
+
+def encode_cursor(values):
+    """Return an opaque, url-safe token from a list of json-able values."""
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Reverse encode_cursor, return None if the token is not valid."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (TypeError, ValueError, UnicodeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+class KeysetPage:
+    """
+    Page returned by KeysetPaginator -- only knows whether there are tasks
+    before and after it, and the cursors to reach them.
+    """
+
+    def __init__(self, object_list, records, paginator, has_previous, has_next):
+        self.object_list = object_list
+        self.records = records
+        self.paginator = paginator
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            return self.paginator.cursor_for(self.records[0], backward=True)
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return self.paginator.cursor_for(self.records[-1], backward=False)
+
+
+class KeysetPaginator(EstimatedCountMixin):
+    """
+    Paginator for django_tables2 tables backed by a queryset. Pages are
+    reached with a cursor holding the values of the active ordering column and
+    the pk of the first or last row of the neighbouring page, so each page is a
+    single `WHERE (column, pk) > (value, pk) ORDER BY column, pk LIMIT n`
+    query: there is neither COUNT(*) nor OFFSET.
+    A cursor built for another ordering, or whose values don't fit it, is
+    ignored and the first page shown.
+    The count is only computed if displayed, and may be an estimate.
+
+    Meant to be used through RequestConfig, e.g.
+    ``paginate={'klass': KeysetPaginator, 'per_page': 10, 'cursor': token}``,
+    the page number given by django_tables2 is ignored. A queryset may be
+    paginated as well, the page then holds its records rather than BoundRows.
+    """
+
+    is_keyset = True
+    cursor_field = 'cursor'
+
+    def __init__(self, object_list, per_page, cursor=None, count_threshold=None, **kwargs):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.cursor = cursor
+        self.count_threshold = count_threshold
+
+    @cached_property
+    def queryset(self):
+        return queryset_of(self.object_list)
+
+    @cached_property
+    def ordering(self):
+        """
+        Return (lookup, descending) for the column -- or annotation -- the
+        queryset is ordered by, the pk being always used as tie-breaker in the
+        same direction.
+        """
+        order_by = self.queryset.query.order_by
+        lookup = order_by[0] if order_by else 'pk'
+        descending = lookup.startswith('-')
+        lookup = lookup.lstrip('-')
+        if lookup in ('pk', 'id'):
+            return None, descending
+        if '__' not in lookup and lookup not in self.queryset.query.annotations:
+            # Ordering by a foreign key means ordering by the related pk
+            lookup = self.queryset.model._meta.get_field(lookup).attname
+        return lookup, descending
+
+    @property
+    def order_key(self):
+        lookup, descending = self.ordering
+        return '{0}{1}'.format('-' if descending else '', lookup or 'pk')
+
+    def cursor_for(self, record, backward):
+        lookup, _ = self.ordering
+        value = reduce(getattr, lookup.split('__'), record) if lookup else None
+        if hasattr(value, 'isoformat'):
+            # Dates and datetimes are compared to their ISO format in the SQL
+            value = value.isoformat()
+        return encode_cursor([self.order_key, int(backward), value, record.pk])
+
+    def ordering_field(self):
+        """Return the field -- or output field of the annotation -- of the ordering lookup."""
+        lookup, _ = self.ordering
+        annotations = self.queryset.query.annotations
+        if lookup in annotations:
+            return annotations[lookup].output_field
+        model, path = self.queryset.model, lookup.split('__')
+        for name in path[:-1]:
+            model = model._meta.get_field(name).related_model
+        return model._meta.get_field(path[-1])
+
+    def cursor_values(self):
+        """
+        Return the [order key, backward, value, pk] of the cursor, the value
+        and the pk converted as the ordering expects them, or None if there is
+        no cursor or it doesn't fit the ordering.
+        """
+        values = decode_cursor(self.cursor) if self.cursor else None
+        if not values or len(values) != 4 or values[0] != self.order_key:
+            return None
+        lookup, _ = self.ordering
+        try:
+            if lookup:
+                values[2] = self.ordering_field().to_python(values[2])
+            values[3] = int(values[3])
+        except (TypeError, ValueError, ValidationError):
+            return None
+        return values
+
+    def _order_by(self, descending):
+        lookup, _ = self.ordering
+        fields = [lookup, 'pk'] if lookup else ['pk']
+        return ['-' + f if descending else f for f in fields]
+
+    def _after(self, value, pk, descending):
+        """Q object selecting the rows after (value, pk) in the given direction."""
+        lookup, _ = self.ordering
+        op = 'lt' if descending else 'gt'
+        after_pk = Q(**{'pk__' + op: pk})
+        if lookup is None:
+            return after_pk
+        return Q(**{'{0}__{1}'.format(lookup, op): value}) | (Q(**{lookup: value}) & after_pk)
+
+    def page(self, number=1):
+        """Return the page pointed at by the cursor, the number is ignored."""
+        lookup, descending = self.ordering
+        values = self.cursor_values()
+
+        queryset = self.queryset
+        backward = bool(values and values[1])
+        if values:
+            queryset = queryset.filter(self._after(values[2], values[3], descending != backward))
+        records = list(queryset.order_by(*self._order_by(descending != backward))[:self.per_page + 1])
+        has_more = len(records) > self.per_page
+        records = records[:self.per_page]
+        if backward:
+            records.reverse()
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = values is not None, has_more
+        table = getattr(self.object_list, 'table', None)
+        rows = BoundRows(records, table=table) if table else records
+        return KeysetPage(rows, records, self, has_previous, has_next)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""
+Instrumentation of the SQL queries of the views. QueryBudgetMiddleware
+records, by resolved URL name -- e.g. tasks:home -- the number of queries of
+the requests, their total time and the slowest statements, see query_stats.
+It checks the number
+against settings.TASKS_QUERY_BUDGETS: a view exceeding its budget is logged
+or, if settings.TASKS_QUERY_BUDGET_ACTION is 'raise' as in the tests, fails
+with QueryBudgetExceeded. The savepoints are not counted, the budgets hold in
+the test cases -- whose requests run in savepoints -- as in production. The
+tests check a view against its budget with query_budget.
+"""
+
+import logging
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+from django.test.utils import override_settings
+
+logger = logging.getLogger(__name__)
+
+# Statements of the transaction management, not counted
+SAVEPOINT_PREFIXES = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+_lock = threading.Lock()
+# Stats of the views in the process: {view name: {requests, queries, seconds, slowest}}
+_stats = {}
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised by a view running more queries than its budget, see TASKS_QUERY_BUDGET_ACTION."""
+
+
+class QueryRecorder:
+    """
+    Context manager recording the queries run on all the connections of the
+    thread in the block as the (sql, seconds) of queries, read from the
+    queries_log of the connections -- filled as with DEBUG.
+    """
+
+    def __enter__(self):
+        self.starts = {}
+        for connection in connections.all():
+            self.starts[connection.alias] = (connection.force_debug_cursor, len(connection.queries_log))
+            connection.force_debug_cursor = True
+        return self
+
+    def __exit__(self, *exc_info):
+        self.queries = []
+        for connection in connections.all():
+            forced, start = self.starts.get(connection.alias, (False, 0))
+            connection.force_debug_cursor = forced
+            self.queries += [
+                (query['sql'], float(query['time'])) for query in list(connection.queries_log)[start:]
+                if not query['sql'].startswith(SAVEPOINT_PREFIXES)
+            ]
+
+
+def record_queries(view_name, queries):
+    """Add the (sql, seconds) of the queries of a request of the view to its stats."""
+    slowest = settings.TASKS_QUERY_SLOWEST
+    with _lock:
+        stats = _stats.setdefault(view_name, {'requests': 0, 'queries': 0, 'seconds': 0.0, 'slowest': []})
+        stats['requests'] += 1
+        stats['queries'] += len(queries)
+        stats['seconds'] += sum(seconds for _, seconds in queries)
+        stats['slowest'] = sorted(
+            stats['slowest'] + [(seconds, sql) for sql, seconds in queries], reverse=True,
+        )[:slowest]
+
+
+def query_stats():
+    """Return a copy of the stats of the views of the process, by view name."""
+    with _lock:
+        return {name: dict(stats, slowest=list(stats['slowest'])) for name, stats in _stats.items()}
+
+
+def check_budget(view_name, queries):
+    """Log or raise, see TASKS_QUERY_BUDGET_ACTION, if the queries of a request exceed the budget of the view."""
+    budget = settings.TASKS_QUERY_BUDGETS.get(view_name)
+    if budget is None or len(queries) <= budget:
+        return
+    message = "{0} ran {1} queries, its budget is {2}:\n{3}".format(
+        view_name, len(queries), budget, '\n'.join(sql for sql, _ in queries),
+    )
+    if settings.TASKS_QUERY_BUDGET_ACTION == 'raise':
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+def query_budget(view_name, queries=None):
+    """
+    Decorator of a test failing if a request of the view runs more queries
+    than its budget -- the one of settings.TASKS_QUERY_BUDGETS unless given
+    -- or if the test requests no page of the view.
+    """
+    def decorator(test):
+        @wraps(test)
+        def wrapped(self, *args, **kwargs):
+            budgets = dict(settings.TASKS_QUERY_BUDGETS)
+            if queries is not None:
+                budgets[view_name] = queries
+            requests = query_stats().get(view_name, {}).get('requests', 0)
+            with override_settings(TASKS_QUERY_STATS=True, TASKS_QUERY_BUDGETS=budgets,
+                                   TASKS_QUERY_BUDGET_ACTION='raise'):
+                result = test(self, *args, **kwargs)
+            self.assertGreater(query_stats().get(view_name, {}).get('requests', 0), requests,
+                               "{0} wasn't requested".format(view_name))
+            return result
+        return wrapped
+    return decorator
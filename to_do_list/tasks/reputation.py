@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+"""
+Aggregation of the reputation ledger into Profile.reputation. Closing a task
+only appends ReputationEvent rows, so that the profile of a popular user is
+not locked by every request rewarding her. aggregate_events, run
+periodically by the aggregate_reputation command, folds the pending events
+in by batches with one UPDATE ... FROM per batch, then increments the
+leaderboards. check_reputation verifies that the ledger and the profiles
+agree.
+"""
+
+from django.db import connections, router, transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+
+from .cache import forget_profiles
+from .leaderboards import add_reputation
+from .models import Profile, ReputationEvent
+
+# Reputation of a profile before any event
+INITIAL_REPUTATION = Profile._meta.get_field('reputation').default
+# Number of events folded in per transaction
+BATCH_SIZE = 10000
+
+
+def aggregate_batch(batch_size=BATCH_SIZE):
+    """
+    Fold the oldest batch_size pending events into the profiles and mark them
+    applied, in one transaction. The events are locked first so that
+    concurrent aggregations never apply them twice. Once it is committed, the
+    leaderboards are incremented by the gains of the users and their cached
+    profiles forgotten. Return the number of events.
+    """
+    alias = router.db_for_write(ReputationEvent)
+    connection = connections[alias]
+    with transaction.atomic(using=alias):
+        pending = ReputationEvent.objects.using(alias).filter(applied_at__isnull=True)
+        ids = list(pending.order_by('pk').select_for_update().values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return 0
+        totals = ReputationEvent.objects.using(alias).filter(pk__in=ids).values('user_id').annotate(
+            total=Sum('amount')).order_by()
+        totals_sql, params = totals.query.sql_with_params()
+        gains = list(totals.values_list('user_id', 'user__profile__team_id', 'total'))
+        profile = connection.ops.quote_name(Profile._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE {0} SET reputation = {0}.reputation + totals.total '
+                'FROM ({1}) AS totals WHERE {0}.user_id = totals.user_id'.format(profile, totals_sql),
+                params,
+            )
+        ReputationEvent.objects.using(alias).filter(pk__in=ids).update(applied_at=timezone.now())
+        transaction.on_commit(lambda: add_reputation(gains), using=alias)
+        transaction.on_commit(lambda: forget_profiles(*[user_id for user_id, _t, _g in gains]), using=alias)
+    return len(ids)
+
+
+def aggregate_events(batch_size=BATCH_SIZE):
+    """Fold all the pending events into the profiles. Return the number of events applied."""
+    applied = 0
+    while True:
+        count = aggregate_batch(batch_size)
+        applied += count
+        if count < batch_size:
+            return applied
+
+
+def check_reputation():
+    """
+    Return the (user_id, reputation, ledger) of the profiles whose reputation
+    is not INITIAL_REPUTATION plus the sum of their applied events, ledger
+    being the sum.
+    """
+    applied = Case(
+        When(user__reputation_events__applied_at__isnull=False, then=F('user__reputation_events__amount')),
+        default=Value(0), output_field=IntegerField(),
+    )
+    profiles = Profile.objects.annotate(ledger=Sum(applied)).exclude(reputation=F('ledger') + INITIAL_REPUTATION)
+    return list(profiles.values_list('user_id', 'reputation', 'ledger').order_by('user_id'))
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+"""
+Routing of the reads of the read-only views to the replicas of the database,
+the aliases of settings.DATABASE_REPLICAS. The views opt in with
+replica_reads: while they run -- and only then -- the reads of the thread go
+to a replica, chosen round-robin or as the least lagging one according to
+settings.TASKS_REPLICA_SELECTION. The writes always go to the primary, and so
+do the reads of a user who wrote in the last TASKS_PRIMARY_STICKINESS
+seconds, as told by the cookie PrimaryStickinessMiddleware sets, so that she
+reads her writes.
+"""
+
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+# Cookie holding the time of the last write of the user
+PRIMARY_COOKIE = 'tasks_wrote_at'
+
+_state = threading.local()
+_turns = itertools.count()
+# Lag of the replicas measured by the process: {alias: (measured at, lag)}
+_lags = {}
+
+
+def current_replica():
+    """Return the alias of the replica the thread reads from, None for the primary."""
+    return getattr(_state, 'replica', None)
+
+
+@contextmanager
+def use_replica(alias):
+    """Read from the replica alias -- None for the primary -- in the block."""
+    previous, _state.replica = current_replica(), alias
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def measure_lag(connection):
+    """
+    Return the replication lag of a database in seconds, 0 if it isn't a
+    replica or not a PostgreSQL one, None if it can't be reached.
+    """
+    if connection.vendor != 'postgresql':
+        return 0.0
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT CASE WHEN pg_is_in_recovery() "
+                "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) ELSE 0 END"
+            )
+            return float(cursor.fetchone()[0])
+    except DatabaseError:
+        return None
+
+
+def replica_lag(alias):
+    """Return the lag of the replica, measured at most every TASKS_REPLICA_LAG_INTERVAL seconds."""
+    now = time.monotonic()
+    measured_at, lag = _lags.get(alias, (None, None))
+    if measured_at is None or now - measured_at > settings.TASKS_REPLICA_LAG_INTERVAL:
+        lag = measure_lag(connections[alias])
+        _lags[alias] = (now, lag)
+    return lag
+
+
+def round_robin(aliases):
+    return aliases[next(_turns) % len(aliases)]
+
+
+def least_lag(aliases):
+    """Return the least lagging replica, None if all of them lag more than TASKS_REPLICA_MAX_LAG."""
+    lags = [(replica_lag(alias), alias) for alias in aliases]
+    lags = [(lag, alias) for lag, alias in lags if lag is not None and lag <= settings.TASKS_REPLICA_MAX_LAG]
+    return min(lags)[1] if lags else None
+
+
+# Choice of the replica by settings.TASKS_REPLICA_SELECTION
+SELECTIONS = {'round_robin': round_robin, 'least_lag': least_lag}
+
+
+def choose_replica():
+    """Return the alias of the replica to read from, None for the primary."""
+    aliases = settings.DATABASE_REPLICAS
+    if not aliases:
+        return None
+    return SELECTIONS[settings.TASKS_REPLICA_SELECTION](aliases)
+
+
+def wrote_recently(request):
+    """Return whether the user wrote in the last TASKS_PRIMARY_STICKINESS seconds."""
+    try:
+        wrote_at = float(request.COOKIES.get(PRIMARY_COOKIE, ''))
+    except ValueError:
+        return False
+    return time.time() - wrote_at < settings.TASKS_PRIMARY_STICKINESS
+
+
+def replica_reads(view):
+    """
+    Decorator making the reads of a read-only view go to a replica, unless
+    the user wrote recently. Template responses are rendered in the view.
+    """
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        alias = None if wrote_recently(request) else choose_replica()
+        if alias is None:
+            return view(request, *args, **kwargs)
+        with use_replica(alias):
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
+    return wrapped
+
+
+class ReplicaRouter:
+    """Route the reads to the replica of the thread, if any, and all the writes to the primary."""
+
+    def db_for_read(self, model, **hints):
+        return current_replica()
+
+    def db_for_write(self, model, **hints):
+        # Also for the instances read from a replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return False if db in settings.DATABASE_REPLICAS else None
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+"""Signal receivers of the tasks app, connected in TasksConfig.ready."""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import bump_task_versions, forget_profiles, forget_teams, task_scopes
+from .leaderboards import add_reputation
+from .models import Profile, Task, Team
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def bump_versions_of_task(sender, instance, **kwargs):
+    """
+    Invalidate the cached tables which may show the task, as it was loaded
+    and as it is now, once the transaction is committed: a table rebuilt by a
+    concurrent request before the commit would be cached as current.
+    """
+    scopes = task_scopes(instance)
+    if instance.loaded_visibility is not None:
+        scopes += task_scopes(instance, instance.loaded_visibility)
+    transaction.on_commit(lambda: bump_task_versions(*scopes))
+    instance.loaded_visibility = instance.visibility
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def rename_creator(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Copy a new username of a user onto the tasks she created, see
+    Task.creator_username, touching their modified_at for the validators of
+    the detail pages, and invalidate the cached tables showing them once
+    committed.
+    """
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+    tasks = Task.objects.filter(creator_id=instance.pk).exclude(creator_username=instance.username)
+    scopes = set()
+    for visibility, team_id in tasks.values_list('visibility', 'creator_team_id').distinct():
+        scopes.update(task_scopes(Task(creator_id=instance.pk, creator_team_id=team_id), visibility))
+    if scopes:
+        tasks.update(creator_username=instance.username, modified_at=timezone.now())
+        transaction.on_commit(lambda: bump_task_versions(*scopes))
+
+
+@receiver(post_save, sender=Profile)
+def rank_new_profile(sender, instance, created, **kwargs):
+    """Add a new profile to the leaderboards, with its initial reputation."""
+    if created:
+        gains = [(instance.user_id, instance.team_id, instance.reputation)]
+        transaction.on_commit(lambda: add_reputation(gains))
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def forget_cached_profile(sender, instance, **kwargs):
+    """
+    Remove the cached profile, see cache.cached_profile, once committed: a
+    concurrent request could cache the former profile again before.
+    """
+    user_id = instance.user_id
+    transaction.on_commit(lambda: forget_profiles(user_id))
+
+
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+def forget_cached_teams(sender, instance, **kwargs):
+    """Remove the cached teams, see cache.cached_teams, once committed."""
+    transaction.on_commit(forget_teams)
@@ -10,19 +10,58 @@ from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Field, Submit, Div, HTML
 from django.template.loader import render_to_string
 from django.core.urlresolvers import reverse
-from django.utils.translation import ugettext as _
-from django.utils.html import mark_safe, format_html
+from django.utils.functional import cached_property
+from django.utils.translation import ugettext as _, ugettext_lazy as _lazy
+from django.utils.html import conditional_escape, mark_safe
 from .models import Task
 
+# Stands for the pk when rendering a cell once for all the rows of a table
+PK_PLACEHOLDER = 987654321987
+# Fields the columns of the TaskTable are sorted by -- only those indexed
+# with the pk as tie-breaker, see migration 0012
+ORDERINGS = {
+    'pk': 'pk', 'name': 'name', 'creator': 'creator_username', 'visibility': 'visibility',
+    'difficulty': 'difficulty', 'status': 'status',
+}
+
+
+class ActionCell:
+    """Record passed to actions_cell.html, with its shortcut attributes."""
+
+    # Bits of the flags of the allowed actions
+    EDIT, CLOSE, COMPLETE = 1, 2, 4
+
+    def __init__(self, pk, is_owner, status):
+        self.pk = pk
+        self.is_editable = is_owner and status == Task.STATUS.new
+        self.can_be_closed = is_owner and status == Task.STATUS.completed
+        self.can_be_completed = status == Task.STATUS.new
+
+    @property
+    def flags(self):
+        """The allowed actions as an int, e.g. EDIT | COMPLETE."""
+        return (
+            (self.EDIT if self.is_editable else 0) | (self.CLOSE if self.can_be_closed else 0) |
+            (self.COMPLETE if self.can_be_completed else 0)
+        )
+
 
 class TaskTable(tables.Table):
     """
     Class dealing with the creation of the tasks table located on the task home
     page.
+    The URLs and the action cells are rendered once per table with a
+    placeholder standing for the pk, each row then only joins the pieces.
     """
 
+    select = tables.CheckBoxColumn(accessor='pk', orderable=False)
     action = tables.Column(empty_values=(), orderable=False)
-    pk = tables.Column(visible=False)
+    pk = tables.Column(visible=False, orderable=True)
+    name = tables.Column(orderable=True)
+    creator = tables.Column(orderable=True, order_by=(ORDERINGS['creator'],))
+    visibility = tables.Column(orderable=True)
+    difficulty = tables.Column(orderable=True)
+    status = tables.Column(orderable=True)
 
     def __init__(self, *args, **kwargs):
         """
@@ -32,6 +71,12 @@ class TaskTable(tables.Table):
 
         self.user = kwargs.pop('user')
         super().__init__(*args, **kwargs)
+        self._action_cells = {}
+
+    @cached_property
+    def _detail_url(self):
+        url = reverse('tasks:detail_task', kwargs={'pk': PK_PLACEHOLDER})
+        return conditional_escape(url).split(str(PK_PLACEHOLDER))
 
     def render_name(self, record, value):
         """
@@ -39,36 +84,60 @@ class TaskTable(tables.Table):
         boldface if current user is the creator.
         """
 
-        detail_url = reverse('tasks:detail_task', kwargs={'pk': record.pk})
-        value = format_html('<a href="{}">{}</a>', detail_url, value)
-        if record.creator == self.user:
-            value = format_html("<b>{}</b>", value)
+        value = '<a href="{0}">{1}</a>'.format(str(record.pk).join(self._detail_url), conditional_escape(value))
+        if record.creator_id == self.user.pk:
+            value = "<b>{0}</b>".format(value)
         if record.status == Task.STATUS.completed or record.status == Task.STATUS.closed:
-            value = format_html("<del>{}</del>", value)
-        return value
+            value = "<del>{0}</del>".format(value)
+        return mark_safe(value)
 
     def render_action(self, record):
         """
-        Provide a few shortcut attributes and pass it to actions_cell for
-        formatting.
+        Render actions_cell once per (is_owner, status) and fill in the pk of
+        the record.
         """
-        record.is_editable = record.creator == self.user and record.status == Task.STATUS.new
-        record.can_be_closed = record.creator == self.user and record.status == Task.STATUS.completed
-        record.can_be_completed = record.status == Task.STATUS.new
-        return render_to_string('tasks/actions_cell.html', {'record': record})
+        key = (record.creator_id == self.user.pk, record.status)
+        if key not in self._action_cells:
+            html = render_to_string('tasks/actions_cell.html', {'record': ActionCell(PK_PLACEHOLDER, *key)})
+            self._action_cells[key] = html.split(str(PK_PLACEHOLDER))
+        return mark_safe(str(record.pk).join(self._action_cells[key]))
+
+    # The records may be TaskRow rather than Task instances, for which
+    # django_tables2 doesn't look the label of the choices up
+    def render_visibility(self, record):
+        return record.get_visibility_display()
+
+    def render_difficulty(self, record):
+        return record.get_difficulty_display()
+
+    def render_status(self, record):
+        return record.get_status_display()
 
     class Meta:
         model = Task
         fields = ['pk', 'name', 'creator', 'visibility', 'difficulty', 'status']
+        sequence = ('select', '...')
+        template = 'tasks/table.html'
         empty_text = _("There are no task matching the search criteria...")
+        # Only the columns of ORDERINGS are orderable, each one backed by an
+        # index: they override this default with orderable=True
+        orderable = False
 
 
 class TaskFilter(django_filters.FilterSet):
-    """A filterset to filter tasks by visibility and status."""
+    """
+    A filterset to filter tasks by visibility, status and difficulty, and to
+    search them by text, the most relevant first, see TaskQuerySet.search.
+    """
+
+    q = django_filters.CharFilter(method='search', label=_lazy('Search'))
 
     class Meta:
         model = Task
-        fields = ['visibility', 'status']
+        fields = ['q', 'visibility', 'status', 'difficulty']
+
+    def search(self, queryset, name, value):
+        return queryset.search(value)
 
 
 class TaskFilterFormHelper(FormHelper):
@@ -79,8 +148,22 @@ class TaskFilterFormHelper(FormHelper):
     form_class = 'form-inline'
     form_method = 'GET'
     layout = Layout(
+           Field('q'),
            Field('visibility'),
            Field('status'),
+           Field('difficulty'),
            Submit('submit', _('Filter'), css_class='btn btn-default'),
     )
     form_id = 'filter-form'
+
+    def show_facets(self, form, facets):
+        """
+        Append to the label of each choice of the form the number of tasks
+        with that value, facets being returned by TaskQuerySet.facets.
+        """
+        for name, counts in facets.items():
+            field = form.fields[name]
+            field.choices = [
+                (value, '{0} ({1})'.format(label, counts.get(value, 0)) if value != '' else label)
+                for value, label in field.choices
+            ]
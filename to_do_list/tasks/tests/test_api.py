@@ -0,0 +1,140 @@
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.http import QueryDict
+from django.test.utils import override_settings
+from django.utils.six import StringIO
+from test_plus.test import TestCase
+
+from to_do_list.users.tests.factories import UserFactory
+from .factories import ProfileFactory, TaskFactory
+from ..api import COLUMNS
+from ..models import Task
+from ..tables import PK_PLACEHOLDER, ActionCell
+from .utils import run_on_commit
+
+
+class TestTasksApi(TestCase):
+    """ The JSON API serves the rows of the home table """
+
+    def setUp(self):
+        UserFactory.reset_sequence()
+        self.user = UserFactory()
+        self.client.login(username=self.user.username, password='password')
+        self.profile = ProfileFactory(user=self.user)
+        self.other = ProfileFactory(team=self.profile.team).user
+        self.url = reverse('tasks:api_tasks')
+        for i in range(25):
+            TaskFactory(creator=(self.user, self.other)[i % 2], name='task {0:02d}'.format(i // 2),
+                        status=i % 4, visibility=Task.VISIBILITIES.team_only)
+        TaskFactory(creator=self.other, name='hidden')
+
+    def walk(self, query='?'):
+        pks = []
+        while query:
+            response = self.client.get(self.url, QueryDict(query[1:]))
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            pks += [row[0] for row in data['rows']]
+            query = data['next']
+        return pks, data
+
+    def test_rows(self):
+        data = self.client.get(self.url, {'sort': '-name'}).json()
+        self.assertEqual(data['columns'], list(COLUMNS))
+        self.assertEqual(data['count'], 25)
+        pk, name, creator, visibility, difficulty, status, is_owner, actions = data['rows'][0]
+        task = Task.objects.get(pk=pk)
+        self.assertEqual(
+            [name, creator, visibility, difficulty, status],
+            [task.name, task.creator.username, task.visibility, task.difficulty, task.status]
+        )
+        self.assertEqual(is_owner, int(task.creator == self.user))
+        self.assertEqual(actions, ActionCell(pk, is_owner, status).flags)
+
+    def test_walk(self):
+        expected = list(Task.objects.exclude(name='hidden').order_by('-name', '-pk').values_list('pk', flat=True))
+        self.assertEqual(self.walk('?sort=-name')[0], expected)
+        with self.settings(TASKS_KEYSET_PAGINATION=True):
+            pks, data = self.walk('?sort=-name')
+            self.assertEqual(pks, expected)
+            # and back to the first page
+            pks = []
+            while data['previous']:
+                data = self.client.get(self.url, QueryDict(data['previous'][1:])).json()
+                pks = [row[0] for row in data['rows']] + pks
+            self.assertEqual(pks, expected[:20])
+
+    def test_filter(self):
+        pks, _ = self.walk('?status={0}&sort=name'.format(Task.STATUS.closed))
+        self.assertEqual(pks, list(
+            Task.objects.filter(status=Task.STATUS.closed).order_by('name', 'pk').values_list('pk', flat=True)
+        ))
+
+    def test_profile_required(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_smaller_than_html(self):
+        """ the JSON payload is an order of magnitude smaller than the HTML one """
+        html = self.client.get(reverse('tasks:home'), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertLess(len(self.client.get(self.url).content) * 10, len(html.content))
+
+    @override_settings(TASKS_CACHE_ALIAS='default')
+    def test_conditional_get(self):
+        caches['default'].clear()
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with run_on_commit():
+            TaskFactory(creator=self.user)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_table_config(self):
+        config = self.client.get(reverse('tasks:api_table_config')).json()
+        self.assertEqual(config['url'], self.url)
+        self.assertEqual(config['labels']['status'][str(Task.STATUS.closed)], 'closed')
+        flags = ActionCell.EDIT | ActionCell.COMPLETE
+        html = str(42).join(config['actions'][str(flags)])
+        self.assertIn(reverse('tasks:update_task', kwargs={'pk': 42}), html)
+        self.assertNotIn(str(PK_PLACEHOLDER), html)
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('benchmark', 'home_payload', size=8, repeat=1, stdout=out)
+        self.assertIn('json, payload', out.getvalue())
+
+
+class TestBulkActionApi(TestCase):
+    """ The bulk action endpoint applies a transition to many tasks at once """
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.client.login(username=self.user.username, password='password')
+        self.profile = ProfileFactory(user=self.user)
+        self.other = ProfileFactory(team=self.profile.team).user
+        self.url = reverse('tasks:api_bulk_action')
+
+    def test_outcomes(self):
+        visible = [TaskFactory(creator=self.other, visibility=Task.VISIBILITIES.team_only) for _ in range(3)]
+        hidden = TaskFactory(creator=self.other)
+        pks = [t.pk for t in visible] + [hidden.pk]
+        response = self.client.post(self.url, {'action': 'complete', 'pks': pks})
+        self.assertEqual(response.status_code, 200)
+        outcomes = response.json()['outcomes']
+        self.assertEqual(outcomes, dict(
+            [(str(t.pk), 'applied') for t in visible] + [(str(hidden.pk), 'not_found')]
+        ))
+        self.assertEqual(Task.objects.filter(completed_by=self.user).count(), 3)
+        # completed already
+        outcomes = self.client.post(self.url, {'action': 'complete', 'pks': pks[:1]}).json()['outcomes']
+        self.assertEqual(outcomes, {str(pks[0]): 'forbidden'})
+
+    def test_invalid(self):
+        task = TaskFactory(creator=self.user)
+        for data in ({'action': 'complete'}, {'action': 'destroy', 'pks': [task.pk]},
+                     {'action': 'delete', 'pks': ['one']}):
+            self.assertEqual(self.client.post(self.url, data).status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+        self.client.logout()
+        self.assertEqual(self.client.post(self.url, {'action': 'delete', 'pks': [task.pk]}).status_code, 403)
+        self.assertFalse(Task.objects.get(pk=task.pk).is_removed)
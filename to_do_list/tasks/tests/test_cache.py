@@ -0,0 +1,185 @@
+from django.core.cache import caches
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from test_plus.test import TestCase
+
+from to_do_list.users.tests.factories import UserFactory
+from .factories import ProfileFactory, TaskFactory, TeamFactory
+from ..cache import TwoLevelCache, cached_teams, version_token
+from ..models import Task
+from .utils import run_on_commit
+
+
+@override_settings(TASKS_CACHE_ALIAS='default')
+class TestHomeTableCache(TestCase):
+    """
+    The home table is served from the cache until a task visible by the user
+    is saved or deleted.
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+        UserFactory.reset_sequence()
+        self.user = UserFactory()
+        self.client.login(username=self.user.username, password='password')
+        self.profile = ProfileFactory(user=self.user)
+        self.team_mate = ProfileFactory(team=self.profile.team).user
+        self.other = ProfileFactory(team=TeamFactory(name='the Others')).user
+        self.url = reverse('tasks:home')
+        self.task = TaskFactory(creator=self.team_mate, name='shared', visibility=Task.VISIBILITIES.team_only)
+
+    def get(self, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        hits_tasks = any('tasks_task' in q['sql'] for q in context.captured_queries)
+        return response, hits_tasks
+
+    def test_cached(self):
+        response, hits_tasks = self.get()
+        self.assertTrue(hits_tasks)
+        cached, hits_tasks = self.get()
+        self.assertFalse(hits_tasks)
+        self.assertIsNone(cached.context['table'])
+        self.assertContains(cached, 'shared')
+        # other filters, orderings or pages are cached apart
+        _, hits_tasks = self.get(data={'sort': 'name'})
+        self.assertTrue(hits_tasks)
+
+    def test_ajax_cached(self):
+        response, _ = self.get(HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        cached, hits_tasks = self.get(HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertFalse(hits_tasks)
+        self.assertEqual(cached.json(), response.json())
+
+    def test_invalidated(self):
+        """ tasks saved or deleted in a scope of the user are shown at once """
+        self.get()
+        with run_on_commit():
+            TaskFactory(creator=self.other, name='new public', visibility=Task.VISIBILITIES.public)
+        response, hits_tasks = self.get()
+        self.assertTrue(hits_tasks)
+        self.assertContains(response, 'new public')
+
+        # the former visibility of the task is invalidated as well
+        task = Task.objects.get(pk=self.task.pk)
+        task.visibility = Task.VISIBILITIES.private
+        with run_on_commit():
+            task.save()
+        response, _ = self.get()
+        self.assertNotContains(response, 'shared')
+
+        with run_on_commit():
+            TaskFactory(creator=self.user, name='mine')
+        self.assertContains(self.get()[0], 'mine')
+        with run_on_commit():
+            Task.objects.get(name='mine').delete()
+        self.assertNotContains(self.get()[0], 'mine')
+
+    def test_other_scopes_not_invalidated(self):
+        """ private tasks of others or team_only tasks of other teams keep the cache """
+        token = version_token(self.user.pk, self.profile.team_id)
+        with run_on_commit():
+            TaskFactory(creator=self.other, visibility=Task.VISIBILITIES.team_only)
+            TaskFactory(creator=self.team_mate, visibility=Task.VISIBILITIES.private)
+        self.assertEqual(version_token(self.user.pk, self.profile.team_id), token)
+
+
+@override_settings(TASKS_CACHE_ALIAS='default')
+class TestVersionsBumpedOnCommit(TransactionTestCase):
+    """
+    The versions change once the writes are committed, else a concurrent
+    request could cache a table of the former tasks as current.
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+        self.profile = ProfileFactory()
+        self.user = self.profile.user
+
+    def token(self):
+        return version_token(self.user.pk, self.profile.team_id)
+
+    def test_task_saved(self):
+        token = self.token()
+        with transaction.atomic():
+            task = TaskFactory(creator=self.user)
+            self.assertEqual(self.token(), token)
+        self.assertNotEqual(self.token(), token)
+
+        token = self.token()
+        with self.assertRaises(ZeroDivisionError), transaction.atomic():
+            task.delete()
+            1 / 0
+        self.assertEqual(self.token(), token)
+
+    def test_creator_renamed(self):
+        TaskFactory(creator=self.user)
+        token = self.token()
+        with transaction.atomic():
+            self.user.username = 'renamed'
+            self.user.save()
+            self.assertEqual(self.token(), token)
+        self.assertNotEqual(self.token(), token)
+
+
+@override_settings(TASKS_CACHE_ALIAS='default', TASKS_LOCAL_CACHE_SIZE=2)
+class TestTwoLevelCache(TestCase):
+    """
+    The objects are served by the process, else by the shared backend, else
+    loaded, until invalidated in any process.
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+        self.loads = []
+        # two processes sharing the backend
+        self.cache, self.other = [TwoLevelCache('things', 'TASKS_PROFILE_CACHE_TIMEOUT') for _ in range(2)]
+
+    def load(self, value):
+        def load():
+            self.loads.append(value)
+            return value
+        return load
+
+    def test_tiers(self):
+        self.assertEqual(self.cache.get(1, self.load('one')), 'one')
+        self.assertEqual(self.cache.get(1, self.load('other')), 'one')
+        self.assertEqual(self.other.get(1, self.load('other')), 'one')
+        self.assertEqual(self.loads, ['one'])
+        self.assertEqual(self.cache.stats, {'hits': 1, 'shared_hits': 0, 'misses': 1, 'evictions': 0})
+        self.assertEqual(self.other.stats['shared_hits'], 1)
+
+    def test_evictions(self):
+        for key in (1, 2, 1, 3):
+            self.cache.get(key, self.load(key))
+        self.assertEqual(list(self.cache.entries), [1, 3])
+        self.assertEqual(self.cache.stats['evictions'], 1)
+
+    def test_invalidated_in_every_process(self):
+        self.cache.get(1, self.load('one'))
+        self.other.get(1, self.load('one'))
+        self.cache.invalidate(1)
+        self.assertEqual(self.other.get(1, self.load('new')), 'new')
+        self.assertEqual(self.cache.get(1, self.load('newer')), 'new')
+
+    def test_version_checked_once_per_request(self):
+        self.other.get(1, self.load('one'))
+        self.other.begin_request()
+        self.other.get(1, self.load('one'))
+        self.cache.invalidate(1)
+        # the request goes on with the version it started with
+        self.assertEqual(self.other.get(1, self.load('new')), 'one')
+        self.other.end_request()
+        self.assertEqual(self.other.get(1, self.load('new')), 'new')
+
+    def test_teams(self):
+        team = TeamFactory(name='B')
+        self.assertEqual(cached_teams(), [(team.pk, 'B')])
+        with self.assertNumQueries(0):
+            cached_teams()
+        with run_on_commit():
+            other = TeamFactory(name='A')
+        self.assertEqual(cached_teams(), [(other.pk, 'A'), (team.pk, 'B')])
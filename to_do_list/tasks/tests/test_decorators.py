@@ -0,0 +1,63 @@
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.core.urlresolvers import resolve, reverse
+from django.db import DatabaseError, connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase
+from django.test.utils import override_settings
+from django.utils.six import StringIO
+from test_plus.test import TestCase
+
+from .factories import TeamFactory
+from ..decorators import read_only_requests
+from ..models import Team
+
+
+def depth(request):
+    """View answering the number of atomic blocks it runs in."""
+    return HttpResponse(len(connection.savepoint_ids))
+
+
+class TestReadOnlyRequests(TestCase):
+
+    def call(self, method, **settings):
+        view = read_only_requests(depth)
+        with override_settings(**settings):
+            return int(view(getattr(RequestFactory(), method)('/')).content) - len(connection.savepoint_ids)
+
+    def test_views_exempted(self):
+        for url in (reverse('tasks:home'), reverse('tasks:detail_task', kwargs={'pk': 1}),
+                    reverse('tasks:api_tasks'), reverse('tasks:leaderboard')):
+            self.assertIn('default', getattr(resolve(url).func, '_non_atomic_requests', set()), url)
+        self.assertFalse(hasattr(resolve(reverse('tasks:create_task')).func, '_non_atomic_requests'))
+
+    def test_safe_methods(self):
+        self.assertEqual(self.call('get'), 0)
+        self.assertEqual(self.call('head'), 0)
+        self.assertEqual(self.call('get', TASKS_READ_ONLY_TRANSACTION=True), 1)
+
+    def test_writes_atomic(self):
+        self.assertEqual(self.call('post'), 1)
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('benchmark', 'request_transactions', size=8, repeat=1, stdout=out)
+        self.assertIn('detail, autocommit, connection held', out.getvalue())
+
+
+@skipUnless(connection.vendor == 'postgresql', "READ ONLY transactions are PostgreSQL ones")
+@override_settings(TASKS_READ_ONLY_TRANSACTION=True)
+class TestReadOnlyTransaction(TransactionTestCase):
+
+    def test_writes_refused(self):
+        @read_only_requests
+        def view(request):
+            TeamFactory(name='written')
+            return HttpResponse()
+
+        with self.assertRaises(DatabaseError):
+            view(RequestFactory().get('/'))
+        self.assertFalse(transaction.get_connection().in_atomic_block)
+        view(RequestFactory().post('/'))
+        self.assertTrue(Team.objects.filter(name='written').exists())
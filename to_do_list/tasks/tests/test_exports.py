@@ -0,0 +1,100 @@
+import csv
+import gc
+import io
+import json
+from unittest import skipUnless
+
+from django.core.urlresolvers import reverse
+from django.db import connection
+from test_plus.test import TestCase
+
+from to_do_list.users.tests.factories import UserFactory
+from .factories import ProfileFactory, TaskFactory, TeamFactory
+from ..exports import COLUMNS
+from ..models import Task
+
+
+def rss():
+    """Resident set size of the process, in bytes."""
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * 4096
+
+
+class TestExport(TestCase):
+
+    def setUp(self):
+        UserFactory.reset_sequence()
+        self.user = UserFactory()
+        self.client.login(username=self.user.username, password='password')
+        self.profile = ProfileFactory(user=self.user)
+        other = ProfileFactory(team=TeamFactory(name='the Others')).user
+        for status, _ in Task.STATUS:
+            TaskFactory(creator=self.user, status=status, name='mine, "{0}"'.format(status))
+            TaskFactory(creator=other, status=status, visibility=Task.VISIBILITIES.public)
+            TaskFactory(creator=other, status=status, visibility=Task.VISIBILITIES.team_only)
+
+    def export(self, format, **data):
+        response = self.client.get(reverse('tasks:export_tasks', kwargs={'format': format}), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv(self):
+        rows = list(csv.reader(io.StringIO(self.export('csv'))))
+        self.assertEqual(tuple(rows[0]), COLUMNS)
+        expected = Task.objects.visible_to(self.user).order_by('pk')
+        self.assertEqual([int(row[0]) for row in rows[1:]], [t.pk for t in expected])
+        task = expected[0]
+        self.assertEqual(rows[1][1:7], [
+            task.name, task.description, self.user.username, task.get_visibility_display(),
+            task.get_difficulty_display(), task.get_status_display(),
+        ])
+
+    def test_ndjson_filtered(self):
+        lines = self.export('ndjson', status=Task.STATUS.closed).splitlines()
+        objects = [json.loads(line) for line in lines]
+        expected = Task.objects.visible_to(self.user).filter(status=Task.STATUS.closed).order_by('pk')
+        self.assertEqual([o['id'] for o in objects], [t.pk for t in expected])
+        self.assertEqual(objects[0]['status'], 'closed')
+        self.assertEqual(objects[0]['modified_at'], expected[0].modified_at.isoformat())
+
+    def test_profile_required(self):
+        self.profile.delete()
+        response = self.client.get(reverse('tasks:export_tasks', kwargs={'format': 'csv'}))
+        self.assertRedirects(response, reverse('tasks:home'))
+
+
+@skipUnless(connection.vendor == 'postgresql', "rows are streamed from a server-side cursor on PostgreSQL only")
+class TestExportMemory(TestCase):
+    """ Exporting a million tasks doesn't grow the memory of the process """
+
+    SEED_ROWS = 10 ** 6
+    # Far below the hundreds of MB the rows would take if fetched at once
+    RSS_CEILING = 50 * 1024 * 1024
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.client.login(username=self.user.username, password='password')
+        ProfileFactory(user=self.user)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO tasks_task (name, description, visibility, created_at, modified_at, creator_id,
+                                        creator_username, is_removed, status, difficulty)
+                SELECT 'task ' || i, 'seeded', 0, now(), now(), %s, %s, false, i %% 4, 2
+                FROM generate_series(1, %s) AS i
+                """,
+                [self.user.pk, self.user.username, self.SEED_ROWS]
+            )
+
+    def test_rss_ceiling(self):
+        gc.collect()
+        baseline = peak = rss()
+        response = self.client.get(reverse('tasks:export_tasks', kwargs={'format': 'csv'}))
+        lines = 0
+        for i, chunk in enumerate(response.streaming_content):
+            lines += chunk.count(b'\n')
+            if i % 50 == 0:
+                peak = max(peak, rss())
+        self.assertEqual(lines, self.SEED_ROWS + 1)
+        self.assertLess(peak - baseline, self.RSS_CEILING)
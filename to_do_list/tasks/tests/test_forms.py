@@ -1,3 +1,5 @@
+from django.core.cache import caches
+from django.test.utils import override_settings
 from test_plus.test import TestCase
 from ..forms import ProfileForm, UserUpdateForm, UserProfileForm
 from to_do_list.tasks.tests.factories import TaskFactory, ProfileFactory, TeamFactory
@@ -15,6 +17,14 @@ class TestProfileForm(TestCase):
             'team': self.team.pk
         }
 
+    @override_settings(TASKS_CACHE_ALIAS='default')
+    def test_teams_cached(self):
+        """ the choices of teams are read from the cache """
+        caches['default'].clear()
+        str(ProfileForm(user=self.user)['team'])
+        with self.assertNumQueries(0):
+            self.assertIn('Test Team', str(ProfileForm(user=self.user)['team']))
+
     def test_all_valid(self):
         """ self.valid_data should yield a valid form """
         form = ProfileForm(data=self.valid_data, user=self.user)
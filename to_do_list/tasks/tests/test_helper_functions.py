@@ -4,6 +4,7 @@ from .factories import ProfileFactory, TaskFactory, TeamFactory
 from to_do_list.users.tests.factories import UserFactory
 
 from ..helper_functions import calculate_reputation_gain, give_reputation_reward
+from ..reputation import aggregate_events
 from mock import patch
 
 
@@ -70,7 +71,8 @@ class TestProfile(TestCase):
     def test_give_reputation(self):
         """
         should increase the reputation of the user who completed the task by the
-        gain calculated (here patched to always return 42)
+        gain calculated (here patched to always return 42), once the ledger is
+        aggregated
         """
         task = TaskFactory(
             creator=self.user1, visibility=Task.VISIBILITIES.public,
@@ -78,4 +80,7 @@ class TestProfile(TestCase):
         )
         give_reputation_reward(task)
         self.profile2.refresh_from_db()
+        self.assertEqual(self.profile2.reputation, 1)
+        aggregate_events()
+        self.profile2.refresh_from_db()
         self.assertEqual(self.profile2.reputation, 1 + 42)
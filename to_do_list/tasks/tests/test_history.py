@@ -0,0 +1,130 @@
+from datetime import timedelta
+from importlib import import_module
+from unittest import skipUnless
+
+from django.apps import apps
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.utils import timezone
+from django.utils.six import StringIO
+from mock import Mock
+from test_plus.test import TestCase
+
+from to_do_list.users.tests.factories import UserFactory
+from .factories import ProfileFactory, TaskFactory
+from .. import transitions
+from ..history import (
+    add_months, create_partitions, ensure_partitions, is_partitioned, month_bounds, month_start, partitions,
+    rollup_history,
+)
+from ..models import Task, TaskStatusHistory, TaskStatusRollup
+
+
+def partition_of(event):
+    """Name of the partition holding the row of an event."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT tableoid::regclass::text FROM tasks_taskstatushistory WHERE id = %s', [event.pk])
+        return cursor.fetchone()[0]
+
+
+class TestHistory(TestCase):
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.client.login(username=self.user.username, password='password')
+        self.profile = ProfileFactory(user=self.user)
+        self.other = ProfileFactory(team=self.profile.team).user
+
+    def test_transitions_recorded(self):
+        task = TaskFactory(creator=self.other, visibility=Task.VISIBILITIES.team_only)
+        own = TaskFactory(creator=self.user)
+        transitions.COMPLETE.apply(task.pk, self.user)
+        transitions.CLOSE.apply(task.pk, self.other)
+        transitions.DELETE.apply_many([own.pk], self.user)
+        task.refresh_from_db()
+        self.assertEqual(
+            list(task.history.order_by('pk').values_list('status', 'is_removed', 'user_id', 'modified_at')),
+            [(Task.STATUS.completed, False, self.user.pk, task.history.first().modified_at),
+             (Task.STATUS.closed, False, self.other.pk, task.modified_at)]
+        )
+        self.assertEqual(list(own.history.values_list('status', 'is_removed')), [(Task.STATUS.new, True)])
+        # refused transitions are not recorded
+        transitions.CLOSE.apply(task.pk, self.other)
+        self.assertEqual(task.history.count(), 2)
+
+    def test_detail_panel(self):
+        task = TaskFactory(creator=self.user)
+        start = timezone.now()
+        TaskStatusHistory.objects.bulk_create([
+            TaskStatusHistory(task=task, status=i % 4, user=self.user, modified_at=start - timedelta(minutes=i))
+            for i in range(25)
+        ])
+        url = reverse('tasks:detail_task', kwargs={'pk': task.pk})
+        seen, query = [], {}
+        while True:
+            history = self.client.get(url, query).context['history']
+            seen += [event.modified_at for event in history]
+            if not history.has_next():
+                break
+            query = {'history': history.next_cursor}
+        self.assertEqual(seen, [start - timedelta(minutes=i) for i in range(25)])
+        response = self.client.get(url, {'history': history.previous_cursor})
+        self.assertEqual(len(response.context['history']), 10)
+
+    def test_rollup(self):
+        task = TaskFactory(creator=self.user)
+        old = add_months(month_start(timezone.now()), -14)
+        at = month_bounds(old)[0] + timedelta(days=3)
+        TaskStatusHistory.objects.bulk_create(
+            [TaskStatusHistory(task=task, status=Task.STATUS.completed, modified_at=at) for _ in range(3)] +
+            [TaskStatusHistory(task=task, status=Task.STATUS.closed, modified_at=at)]
+        )
+        recent = TaskStatusHistory.objects.create(task=task, status=Task.STATUS.new, is_removed=True)
+        self.assertEqual(rollup_history(keep_months=12), 4)
+        self.assertEqual(list(task.history.values_list('pk', flat=True)), [recent.pk])
+        self.assertEqual(
+            sorted(TaskStatusRollup.objects.values_list('month', 'status', 'count')),
+            [(old, Task.STATUS.completed, 3), (old, Task.STATUS.closed, 1)]
+        )
+        # rolling up the same month again adds to its counts
+        TaskStatusHistory.objects.create(task=task, status=Task.STATUS.closed, modified_at=at)
+        call_command('rollup_task_history', stdout=StringIO())
+        self.assertEqual(TaskStatusRollup.objects.get(status=Task.STATUS.closed).count, 2)
+
+    def test_plain_table_before_postgresql_11(self):
+        """ PostgreSQL 10 has neither DEFAULT partitions nor primary keys on partitioned tables """
+        migration = import_module('to_do_list.tasks.migrations.0010_partition_taskstatushistory')
+        schema_editor = Mock(connection=Mock(vendor='postgresql', pg_version=100012))
+        migration.partition_history(apps, schema_editor)
+        self.assertFalse(schema_editor.execute.called)
+
+
+@skipUnless(connection.vendor == 'postgresql', "the history is partitioned on PostgreSQL only")
+class TestHistoryPartitions(TestCase):
+
+    def setUp(self):
+        self.task = TaskFactory(creator=ProfileFactory().user)
+
+    def test_partitioned(self):
+        self.assertTrue(is_partitioned(connection))
+        self.assertEqual(ensure_partitions(), [])
+        event = TaskStatusHistory.objects.create(task=self.task, status=Task.STATUS.completed)
+        self.assertEqual(partition_of(event), 'tasks_taskstatushistory_{0:%Y%m}'.format(event.modified_at))
+
+    def test_rows_moved_out_of_default(self):
+        month = add_months(month_start(timezone.now()), 6)
+        event = TaskStatusHistory.objects.create(
+            task=self.task, status=Task.STATUS.completed, modified_at=month_bounds(month)[0])
+        self.assertEqual(partition_of(event), 'tasks_taskstatushistory_default')
+        self.assertEqual(ensure_partitions(months_ahead=6), [add_months(month, -3 + i) for i in range(4)])
+        self.assertEqual(partition_of(event), 'tasks_taskstatushistory_{0:%Y%m}'.format(month))
+
+    def test_old_partitions_dropped(self):
+        old = add_months(month_start(timezone.now()), -14)
+        self.assertEqual(create_partitions(old, 2), [old, add_months(old, 1)])
+        TaskStatusHistory.objects.create(task=self.task, status=Task.STATUS.closed, modified_at=month_bounds(old)[0])
+        self.assertEqual(rollup_history(keep_months=12), 1)
+        self.assertNotIn(old, partitions(connection))
+        self.assertNotIn(add_months(old, 1), partitions(connection))
+        self.assertIn(month_start(timezone.now()), partitions(connection))
@@ -0,0 +1,146 @@
+import io
+import json
+from unittest import skipUnless
+
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils.six import StringIO
+from test_plus.test import TestCase
+
+from to_do_list.users.tests.factories import UserFactory
+from .factories import ProfileFactory, TaskFactory
+from ..cache import version_token
+from ..imports import import_tasks, read_csv, read_ndjson
+from ..models import Task
+from .utils import run_on_commit
+
+CSV = '''name,description,visibility,difficulty
+first,"with a comma, and ""quotes""",2,1
+second,team task,team only,hard
+,no name,2,1
+third,bad choices,7,easy
+'''
+
+
+class TestImport(TestCase):
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.profile = ProfileFactory(user=self.user)
+
+    def test_csv(self):
+        report = import_tasks(read_csv(io.StringIO(CSV)), self.user.pk, self.profile.team_id, copy=False)
+        self.assertEqual((report.created, report.invalid), (2, 2))
+        self.assertEqual([e['row'] for e in report.errors], [3, 4])
+        self.assertEqual(set(report.errors[0]['errors']), {'name'})
+        self.assertEqual(set(report.errors[1]['errors']), {'visibility'})
+        first, second = Task.objects.order_by('pk')
+        self.assertEqual(
+            (first.description, first.visibility, first.difficulty, first.creator_team_id),
+            ('with a comma, and "quotes"', Task.VISIBILITIES.public, Task.DIFFICULTIES.easy, self.profile.team_id)
+        )
+        self.assertEqual((second.visibility, second.difficulty), (Task.VISIBILITIES.team_only, Task.DIFFICULTIES.hard))
+
+    def test_ndjson(self):
+        lines = [
+            json.dumps({'name': 'task', 'description': 'from json', 'visibility': 0, 'difficulty': 3}),
+            '', '[1, 2]', '{not json',
+            json.dumps({'name': 'x' * 65, 'description': 'too long', 'visibility': 0, 'difficulty': 3}),
+        ]
+        report = import_tasks(read_ndjson(lines), self.user.pk, self.profile.team_id)
+        self.assertEqual((report.created, report.invalid), (1, 3))
+        self.assertEqual(Task.objects.get().visibility, Task.VISIBILITIES.private)
+
+    def test_values_not_scalar(self):
+        """ lists and objects are reported as invalid values rather than failing the import """
+        lines = [
+            json.dumps({'name': 'list', 'description': 'd', 'visibility': [0], 'difficulty': 3}),
+            json.dumps({'name': 'object', 'description': 'd', 'visibility': 0, 'difficulty': {'a': 1}}),
+            json.dumps({'name': ['named'], 'description': 'd', 'visibility': 0, 'difficulty': 3}),
+        ]
+        report = import_tasks(read_ndjson(lines), self.user.pk, self.profile.team_id)
+        self.assertEqual((report.created, report.invalid), (0, 3))
+        self.assertEqual([list(error['errors']) for error in report.errors], [['visibility'], ['difficulty'], ['name']])
+        self.client.login(username=self.user.username, password='password')
+        upload = SimpleUploadedFile('tasks.ndjson', '\n'.join(lines).encode('utf-8'))
+        response = self.client.post(reverse('tasks:api_import_tasks'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['invalid'], 3)
+
+    def test_batches(self):
+        rows = [{'name': str(i), 'description': 'batch', 'visibility': '2', 'difficulty': '2'} for i in range(25)]
+        # the username of the creator, then the batches in a savepoint
+        with self.assertNumQueries(6):
+            report = import_tasks(iter(rows), self.user.pk, self.profile.team_id, batch_size=10, copy=False)
+        self.assertEqual(report.created, Task.objects.count())
+        self.assertEqual(report.created, 25)
+
+    @skipUnless(connection.vendor == 'postgresql', "COPY is PostgreSQL only")
+    def test_copy(self):
+        rows = [{'name': str(i), 'description': 'copied\nline', 'visibility': 'public', 'difficulty': '2'}
+                for i in range(5000)]
+        report = import_tasks(iter(rows), self.user.pk, self.profile.team_id, batch_size=1000)
+        self.assertEqual(report.created, 5000)
+        task = Task.objects.order_by('-pk').first()
+        self.assertEqual((task.name, task.description, task.status, task.is_removed, task.creator_team_id),
+                         ('4999', 'copied\nline', Task.STATUS.new, False, self.profile.team_id))
+        self.assertIsNotNone(task.created_at)
+
+    @override_settings(TASKS_CACHE_ALIAS='default')
+    def test_bumps_versions(self):
+        caches['default'].clear()
+        token = version_token(self.user.pk, self.profile.team_id)
+        with run_on_commit():
+            import_tasks(read_csv(io.StringIO(CSV)), self.user.pk, self.profile.team_id)
+            self.assertEqual(version_token(self.user.pk, self.profile.team_id), token)
+        self.assertNotEqual(version_token(self.user.pk, self.profile.team_id), token)
+
+    def test_exported_tasks(self):
+        """ an export is imported back """
+        TaskFactory(creator=self.user, visibility=Task.VISIBILITIES.team_only, difficulty=Task.DIFFICULTIES.heroic)
+        self.client.login(username=self.user.username, password='password')
+        response = self.client.get(reverse('tasks:export_tasks', kwargs={'format': 'csv'}))
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        report = import_tasks(read_csv(lines), self.user.pk, self.profile.team_id)
+        self.assertEqual(report.created, 1)
+        self.assertEqual(
+            list(Task.objects.values_list('visibility', 'difficulty').distinct()),
+            [(Task.VISIBILITIES.team_only, Task.DIFFICULTIES.heroic)]
+        )
+
+    def test_command(self):
+        out, err = StringIO(), StringIO()
+        path = '/tmp/test_import_tasks.csv'
+        with open(path, 'w') as f:
+            f.write(CSV)
+        call_command('import_tasks', path, user=self.user.username, stdout=out, stderr=err)
+        self.assertIn('2 tasks created, 2 invalid rows skipped', out.getvalue())
+        self.assertIn('Row 3', err.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('import_tasks', '/tmp/tasks.txt', user=self.user.username)
+        with self.assertRaises(CommandError):
+            call_command('import_tasks', path, user='nobody')
+
+    def test_upload(self):
+        self.client.login(username=self.user.username, password='password')
+        url = reverse('tasks:api_import_tasks')
+        upload = SimpleUploadedFile('tasks.csv', CSV.encode('utf-8'))
+        response = self.client.post(url, {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual(Task.objects.filter(creator=self.user).count(), 2)
+        upload = SimpleUploadedFile('tasks.txt', CSV.encode('utf-8'))
+        self.assertEqual(self.client.post(url, {'file': upload}).status_code, 400)
+        upload = SimpleUploadedFile('tasks.txt', b'\xff\xfe' + CSV.encode('utf-16-le'))
+        self.assertEqual(self.client.post(url, {'file': upload, 'format': 'csv'}).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.post(url, {'file': upload}).status_code, 403)
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('benchmark', 'task_import', size=50, stdout=out)
+        self.assertIn('bulk_create, rows per second', out.getvalue())
@@ -0,0 +1,137 @@
+import os
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TransactionTestCase
+from django.utils.six import StringIO
+from test_plus.test import TestCase
+
+from to_do_list.users.tests.factories import UserFactory
+from .factories import ProfileFactory, TaskFactory, TeamFactory
+from .. import transitions
+from ..leaderboards import (
+    GLOBAL, TEAMS, LocalRankings, RedisError, RedisRankings, rankings, rebuild_leaderboards, team_board,
+)
+from ..models import Profile, Task
+from ..reputation import aggregate_events
+
+
+def redis_client():
+    """Client of the Redis server of REDIS_URL, None if there is none."""
+    if not os.environ.get('REDIS_URL'):
+        return None
+    try:
+        import redis
+        client = redis.StrictRedis.from_url(os.environ['REDIS_URL'])
+        client.ping()
+    except (ImportError, RedisError):
+        return None
+    return client
+
+
+class RankingTiesMixin:
+    """ Both stores order the ties as ZREVRANGE: by descending member, compared as strings """
+
+    def store(self):
+        raise NotImplementedError
+
+    def test_ties(self):
+        store = self.store()
+        store.replace({GLOBAL: {9: 5, 10: 5, 2: 5, 1: 7}})
+        self.addCleanup(store.replace, {})
+        self.assertEqual(store.top(GLOBAL, 4), [(1, 7), (9, 5), (2, 5), (10, 5)])
+        self.assertEqual([store.rank(GLOBAL, m) for m in (1, 9, 2, 10)], [1, 2, 3, 4])
+        store.increment({(GLOBAL, 3): 5, (GLOBAL, 1): -2})
+        self.assertEqual(store.top(GLOBAL, 5), [(9, 5), (3, 5), (2, 5), (10, 5), (1, 5)])
+        self.assertEqual([store.rank(GLOBAL, m) for m in (9, 3, 2, 10, 1)], [1, 2, 3, 4, 5])
+
+
+class TestLocalRankingTies(RankingTiesMixin, TestCase):
+
+    def store(self):
+        return LocalRankings()
+
+
+@skipUnless(redis_client(), "needs a Redis server at REDIS_URL")
+class TestRedisRankingTies(RankingTiesMixin, TestCase):
+
+    def store(self):
+        return RedisRankings(redis_client())
+
+
+class TestLocalRankings(TestCase):
+
+    def test_rankings(self):
+        store = LocalRankings()
+        store.increment({(GLOBAL, 1): 10, (GLOBAL, 2): 30, (GLOBAL, 3): 20})
+        self.assertEqual(store.top(GLOBAL, 2), [(2, 30), (3, 20)])
+        self.assertEqual([store.rank(GLOBAL, m) for m in (1, 2, 3, 4)], [3, 1, 2, None])
+        store.increment({(GLOBAL, 1): 25})
+        self.assertEqual(store.top(GLOBAL, 3), [(1, 35), (2, 30), (3, 20)])
+        self.assertEqual(store.count(GLOBAL), 3)
+        store.replace({TEAMS: {7: 1}})
+        self.assertEqual((store.count(GLOBAL), store.top(TEAMS, 5)), (0, [(7, 1)]))
+
+
+class TestLeaderboards(TestCase):
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.client.login(username=self.user.username, password='password')
+        self.profile = ProfileFactory(user=self.user, reputation=50)
+        self.others = TeamFactory(name='the Others')
+        for reputation in (10, 100, 20):
+            ProfileFactory(team=self.others, reputation=reputation)
+        ProfileFactory(team=self.profile.team, reputation=70)
+        rebuild_leaderboards()
+
+    def test_rebuild(self):
+        store = rankings()
+        self.assertEqual([s for _m, s in store.top(GLOBAL, 10)], [100, 70, 50, 20, 10])
+        self.assertEqual(store.rank(GLOBAL, self.user.pk), 3)
+        self.assertEqual(store.rank(team_board(self.profile.team_id), self.user.pk), 2)
+        self.assertEqual(store.top(TEAMS, 2), [(self.others.pk, 130), (self.profile.team_id, 120)])
+
+    def test_view(self):
+        response = self.client.get(reverse('tasks:leaderboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.context['rank'], response.context['count']), (3, 5))
+        self.assertEqual((response.context['team_rank'], response.context['team_count']), (2, 2))
+        self.assertEqual(response.context['users'][2], (self.user.username, 50, True))
+        self.assertEqual(response.context['teams'][0], ('the Others', 130, False))
+
+    def test_profile_required(self):
+        Profile.objects.filter(user=self.user).delete()
+        self.assertRedirects(self.client.get(reverse('tasks:leaderboard')), reverse('tasks:home'))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('rebuild_leaderboards', stdout=out)
+        self.assertIn('5 profiles ranked', out.getvalue())
+
+
+class TestIncrementalLeaderboards(TransactionTestCase):
+    """ The rankings follow the reputation once the transactions are committed """
+
+    def setUp(self):
+        rankings().replace({})
+
+    def test_new_profiles_and_rewards(self):
+        user = UserFactory()
+        team = TeamFactory()
+        ProfileFactory(user=user, team=team)
+        helpers = [ProfileFactory(team=team).user for _ in range(2)]
+        store = rankings()
+        self.assertEqual(store.count(GLOBAL), 3)
+        tasks = [
+            TaskFactory(creator=user, completed_by=helpers[i % 2], status=Task.STATUS.completed,
+                        difficulty=Task.DIFFICULTIES.hard)
+            for i in range(3)
+        ]
+        transitions.CLOSE.apply_many([t.pk for t in tasks], user)
+        aggregate_events()
+        expected = sorted(Profile.objects.values_list('reputation', 'user_id'), reverse=True)
+        self.assertEqual([(s, m) for m, s in store.top(GLOBAL, 3)], expected)
+        self.assertEqual(store.rank(team_board(team.pk), helpers[0].pk), 1)
+        self.assertEqual(store.top(TEAMS, 1), [(team.pk, sum(r for r, _u in expected))])
@@ -0,0 +1,129 @@
+import json
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+from mock import patch
+from test_plus.test import TestCase
+
+from to_do_list.users.tests.factories import UserFactory
+from .factories import ProfileFactory, TaskFactory
+from .. import metrics, transitions
+from ..metrics import LATENCY, REQUESTS, collect, exposition, flush, flush_at_exit, process_file
+from ..models import Task
+
+
+def sample(samples, name, **labels):
+    """Value of the sample name with the labels, 0 if absent."""
+    for (sample_name, sample_labels), value in samples.items():
+        if sample_name == name and dict(sample_labels) == labels:
+            return value
+    return 0
+
+
+class TestMetricsView(TestCase):
+    """ the metrics of the views are served to the staff in the text format of Prometheus """
+
+    def setUp(self):
+        self.user = ProfileFactory().user
+        self.client.login(username=self.user.username, password='password')
+        self.url = reverse('tasks:metrics')
+
+    def test_staff_only(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/admin/login/', response['Location'])
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+
+    def test_home(self):
+        before = collect()
+        self.client.get(reverse('tasks:home'))
+        after = collect()
+        for name, labels in [
+            ('tasks_http_requests_total', {'view': 'tasks:home', 'method': 'GET', 'status': '2xx'}),
+            ('tasks_http_request_duration_seconds_count', {'view': 'tasks:home'}),
+            ('tasks_http_request_duration_seconds_bucket', {'view': 'tasks:home', 'le': '+Inf'}),
+            ('tasks_db_duration_seconds_count', {'view': 'tasks:home'}),
+            ('tasks_template_render_duration_seconds_count', {'template': 'tasks/table_home.html'}),
+        ]:
+            self.assertEqual(sample(after, name, **labels), sample(before, name, **labels) + 1, name)
+        self.assertGreater(sample(after, 'tasks_db_queries_total', view='tasks:home'),
+                           sample(before, 'tasks_db_queries_total', view='tasks:home'))
+
+    @override_settings(TASKS_QUERY_STATS=False)
+    def test_database_without_query_stats(self):
+        """ the queries are counted and timed by the cursors, without the debug ones """
+        before = collect()
+        self.client.get(reverse('tasks:home'))
+        after = collect()
+        name = 'tasks_db_duration_seconds_count'
+        self.assertEqual(sample(after, name, view='tasks:home'), sample(before, name, view='tasks:home') + 1)
+        self.assertGreater(sample(after, 'tasks_db_queries_total', view='tasks:home'),
+                           sample(before, 'tasks_db_queries_total', view='tasks:home'))
+        self.assertGreater(sample(after, 'tasks_db_duration_seconds_sum', view='tasks:home'),
+                           sample(before, 'tasks_db_duration_seconds_sum', view='tasks:home'))
+
+    def test_exposition(self):
+        REQUESTS.inc('tasks:detail_task', 'GET', '4xx')
+        LATENCY.observe(0.03, 'tasks:detail_task')
+        text = exposition(collect())
+        self.assertIn('# TYPE tasks_http_request_duration_seconds histogram\n', text)
+        self.assertIn('# TYPE tasks_http_requests_total counter\n', text)
+        self.assertRegex(text, r'tasks_http_requests_total\{view="tasks:detail_task",method="GET",status="4xx"\} \d')
+        lines = [line for line in text.splitlines()
+                 if line.startswith('tasks_http_request_duration_seconds_bucket{view="tasks:detail_task"')]
+        # the buckets are cumulative, by increasing bound
+        self.assertEqual(len(lines), 12)
+        self.assertTrue(lines[-1].startswith('tasks_http_request_duration_seconds_bucket{'
+                                             'view="tasks:detail_task",le="+Inf"}'))
+        counts = [float(line.rsplit(' ', 1)[1]) for line in lines]
+        self.assertEqual(counts, sorted(counts))
+        self.assertLess(counts[2], counts[3])
+
+    def test_workers(self):
+        """ the files of the workers are summed, those left unchanged for too long removed """
+        labels = {'view': 'tasks:leaderboard', 'method': 'GET', 'status': '2xx'}
+        with tempfile.TemporaryDirectory() as directory, override_settings(TASKS_METRICS_DIR=directory):
+            REQUESTS.inc(*labels.values())
+            flush()
+            own = sample(collect(), 'tasks_http_requests_total', **labels)
+            # another worker, exited or not, and one exited long ago
+            others = ['1-0.json', '2-0.json']
+            for name in others:
+                with open(os.path.join(directory, name), 'w') as f:
+                    json.dump([['tasks_http_requests_total', [list(pair) for pair in labels.items()], 3]], f)
+            stale = time.time() - settings.TASKS_METRICS_RETENTION - 60
+            os.utime(os.path.join(directory, others[1]), (stale, stale))
+            samples = collect()
+            self.assertEqual(sorted(os.listdir(directory)), sorted([others[0], process_file()]))
+        self.assertEqual(sample(samples, 'tasks_http_requests_total', **labels), own + 3)
+
+    def test_flushed_at_exit_if_served(self):
+        """ the processes which served no request -- the management commands -- write no file """
+        with tempfile.TemporaryDirectory() as directory, override_settings(TASKS_METRICS_DIR=directory):
+            with patch.object(metrics, '_served', False):
+                flush_at_exit()
+                self.assertEqual(os.listdir(directory), [])
+            self.client.get(reverse('tasks:home'))
+            flush_at_exit()
+            self.assertEqual(os.listdir(directory), [process_file()])
+
+
+class TestTransitionMetrics(TransactionTestCase):
+    """ the transitions are counted once committed """
+
+    def test_counted(self):
+        user = ProfileFactory().user
+        tasks = [TaskFactory(creator=UserFactory(), visibility=Task.VISIBILITIES.public) for _ in range(3)]
+        before = sample(collect(), 'tasks_task_transitions_total', transition='complete')
+        transitions.COMPLETE.apply(tasks[0].pk, user)
+        transitions.COMPLETE.apply_many([t.pk for t in tasks], user)
+        self.assertEqual(sample(collect(), 'tasks_task_transitions_total', transition='complete'), before + 3)
@@ -0,0 +1,190 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction
+from django.test import RequestFactory, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from test_plus.test import TestCase
+
+from to_do_list.users.tests.factories import UserFactory
+from .factories import ProfileFactory, TaskFactory
+from ..helper_functions import give_reputation_reward
+from ..leaderboards import rebuild_leaderboards
+from ..middleware import get_profile
+from ..models import Task
+from ..queries import QueryBudgetExceeded, query_stats
+from ..reputation import aggregate_events
+from .utils import run_on_commit
+
+
+@override_settings(TASKS_CACHE_ALIAS='default')
+class TestGetProfile(TestCase):
+    """ the profile is loaded once per request and cached across requests until saved """
+
+    def setUp(self):
+        caches['default'].clear()
+        self.profile = ProfileFactory()
+        self.user = self.profile.user
+
+    def request(self, user=None):
+        request = RequestFactory().get('/')
+        request.user = user or self.user
+        return request
+
+    def test_anonymous(self):
+        request = self.request(AnonymousUser())
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_profile(request))
+
+    def test_loaded_once(self):
+        request = self.request()
+        with self.assertNumQueries(1):
+            profile = get_profile(request)
+            self.assertEqual(profile, self.profile)
+            self.assertEqual(profile.team.name, self.profile.team.name)
+            self.assertIs(profile.user, self.user)
+            self.assertIs(get_profile(request), profile)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_profile(self.request()), self.profile)
+
+    def test_forgotten_on_save(self):
+        get_profile(self.request())
+        self.profile.reputation = 42
+        with run_on_commit():
+            self.profile.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(get_profile(self.request()).reputation, 42)
+
+    def test_forgotten_on_creation(self):
+        user = UserFactory()
+        self.assertIsNone(get_profile(self.request(user)))
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_profile(self.request(user)))
+        with run_on_commit():
+            profile = ProfileFactory(user=user, team=self.profile.team)
+        self.assertEqual(get_profile(self.request(user)), profile)
+
+
+@override_settings(TASKS_CACHE_ALIAS='default')
+class TestProfileForgottenOnCommit(TransactionTestCase):
+    """ a profile saved is forgotten once committed, not cached again as it was before """
+
+    def test_forgotten_after_commit(self):
+        caches['default'].clear()
+        profile = ProfileFactory()
+        request = RequestFactory().get('/')
+        request.user = profile.user
+        self.assertEqual(get_profile(request).reputation, 1)
+        with transaction.atomic():
+            profile.reputation = 42
+            profile.save()
+            # a concurrent request, not seeing the write, keeps the cached one
+            request = RequestFactory().get('/')
+            request.user = profile.user
+            self.assertEqual(get_profile(request).reputation, 1)
+        request = RequestFactory().get('/')
+        request.user = profile.user
+        self.assertEqual(get_profile(request).reputation, 42)
+
+
+@override_settings(TASKS_CACHE_ALIAS='default')
+class TestProfileRewarded(TransactionTestCase):
+    """ the profiles are forgotten once the rewards aggregated are committed """
+
+    def test_forgotten_on_reward(self):
+        caches['default'].clear()
+        user = ProfileFactory().user
+        request = RequestFactory().get('/')
+        request.user = user
+        self.assertEqual(get_profile(request).reputation, 1)
+        give_reputation_reward(TaskFactory(completed_by=user, difficulty=Task.DIFFICULTIES.hard))
+        aggregate_events()
+        request = RequestFactory().get('/')
+        request.user = user
+        self.assertGreater(get_profile(request).reputation, 1)
+
+
+@override_settings(TASKS_CACHE_ALIAS='default')
+class TestViewQueries(TestCase):
+    """
+    Number of queries per view once the profile is cached: the session, the
+    user, the savepoint of the request and its release but for the read-only
+    views, and what the view itself needs -- the profile is never read again.
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+        UserFactory.reset_sequence()
+        self.profile = ProfileFactory()
+        self.user = self.profile.user
+        self.client.login(username=self.user.username, password='password')
+        self.task = TaskFactory(creator=self.user, visibility=Task.VISIBILITIES.public)
+
+    def assertQueries(self, count, method, url, **kwargs):
+        method(url, **kwargs)  # caches the profile
+        with CaptureQueriesContext(connection) as context:
+            method(url, **kwargs)
+        queries = [q['sql'] for q in context.captured_queries]
+        self.assertFalse([q for q in queries if 'tasks_profile' in q], queries)
+        self.assertEqual(len(queries), count, queries)
+
+    def test_home(self):
+        self.assertQueries(2, self.client.get, reverse('tasks:home'))
+
+    def test_detail(self):
+        self.assertQueries(6, self.client.get, reverse('tasks:detail_task', kwargs={'pk': self.task.pk}))
+
+    def test_create_task(self):
+        self.assertQueries(4, self.client.get, reverse('tasks:create_task'))
+
+    def test_update_profile(self):
+        self.assertQueries(4, self.client.get, reverse('tasks:update_profile'))
+
+    def test_api_tasks(self):
+        self.assertQueries(2, self.client.get, reverse('tasks:api_tasks'))
+
+    def test_leaderboard(self):
+        rebuild_leaderboards()
+        self.assertQueries(3, self.client.get, reverse('tasks:leaderboard'))
+
+    def test_complete(self):
+        url = reverse('tasks:complete_task', kwargs={'pk': self.task.pk})
+        self.client.get(reverse('tasks:home'))
+        with CaptureQueriesContext(connection) as context:
+            self.client.post(url)
+        queries = [q['sql'] for q in context.captured_queries]
+        self.assertFalse([q for q in queries if 'tasks_profile' in q], queries)
+        self.assertEqual(len(queries), 7, queries)
+
+
+class TestQueryBudgetMiddleware(TestCase):
+    """ the queries of the views are recorded by URL name and checked against their budget """
+
+    def setUp(self):
+        self.user = ProfileFactory().user
+        self.client.login(username=self.user.username, password='password')
+        self.url = reverse('tasks:home')
+
+    def test_stats(self):
+        before = query_stats().get('tasks:home', {'requests': 0, 'queries': 0})
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(self.url)
+        stats = query_stats()['tasks:home']
+        self.assertEqual(stats['requests'], before['requests'] + 1)
+        # the savepoints of the request aren't counted
+        queries = [q['sql'] for q in context.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertEqual(stats['queries'], before['queries'] + len(queries))
+        self.assertTrue(0 < len(stats['slowest']) <= 5)
+        self.assertFalse([sql for _, sql in stats['slowest'] if 'SAVEPOINT' in sql])
+
+    def test_over_budget(self):
+        with override_settings(TASKS_QUERY_BUDGETS={'tasks:home': 1}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(self.url)
+            with override_settings(TASKS_QUERY_BUDGET_ACTION='log'):
+                with self.assertLogs('to_do_list.tasks.queries', 'WARNING'):
+                    self.assertEqual(self.client.get(self.url).status_code, 200)
+            with override_settings(TASKS_QUERY_STATS=False):
+                requests = query_stats()['tasks:home']['requests']
+                self.client.get(self.url)
+                self.assertEqual(query_stats()['tasks:home']['requests'], requests)
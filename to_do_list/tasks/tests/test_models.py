@@ -1,6 +1,17 @@
+from importlib import import_module
+from unittest import skipUnless
+
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils.six import StringIO
+from mock import MagicMock, Mock
 from test_plus.test import TestCase
 from ..models import Profile, Task, Team
+from ..tables import ORDERINGS
 from .factories import ProfileFactory, TaskFactory, TeamFactory
+from to_do_list.users.models import User
 from to_do_list.users.tests.factories import UserFactory
 
 
@@ -36,6 +47,59 @@ class TestTask(TestCase):
         self.task.save()
         self.assertFalse(self.task.is_new())
 
+    def test_creator_team(self):
+        """ the team of the creator is copied on creation, if she has one """
+        self.assertEqual(self.task.creator_team_id, self.profile.team_id)
+        self.assertIsNone(TaskFactory().creator_team_id)
+
+    def test_creator_username(self):
+        """ the username of the creator is copied on creation, and kept current """
+        self.assertEqual(self.task.creator_username, self.task.creator.username)
+        user, modified_at = self.task.creator, self.task.modified_at
+        user.username = 'renamed'
+        user.save()
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.creator_username, 'renamed')
+        # the ETag and Last-Modified of the detail page change
+        self.assertGreater(self.task.modified_at, modified_at)
+        with self.assertNumQueries(1):
+            user.save(update_fields=['last_login'])
+
+    def test_backfill_creator_team(self):
+        """ the data migration fills creator_team for the existing tasks """
+        Task.objects.update(creator_team=None)
+        migration = import_module('to_do_list.tasks.migrations.0006_backfill_task_creator_team')
+        migration.backfill_creator_team(apps, Mock(connection=connection))
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.creator_team_id, self.profile.team_id)
+
+    def test_backfill_creator_username(self):
+        """ the migration fills creator_username for the existing tasks """
+        Task.objects.update(creator_username='')
+        migration = import_module('to_do_list.tasks.migrations.0012_task_creator_username')
+        migration.backfill_creator_username(apps, Mock(connection=connection))
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.creator_username, self.task.creator.username)
+
+    def test_trigram_available(self):
+        """ the migration installs pg_trgm only if the role may, being available isn't enough """
+        migration = import_module('to_do_list.tasks.migrations.0011_task_search')
+
+        def available(pg_version, *rows):
+            cursor = MagicMock()
+            cursor.fetchone.side_effect = rows
+            connection = MagicMock(pg_version=pg_version)
+            connection.cursor.return_value.__enter__.return_value = cursor
+            return migration.trigram_available(connection)
+
+        self.assertTrue(available(120000, (1,)))
+        self.assertFalse(available(120000, None, None))
+        self.assertTrue(available(120000, None, (1,), (True,)))
+        self.assertFalse(available(120000, None, (1,), (False,)))
+        # trusted from PostgreSQL 13, for the roles allowed to CREATE in the database
+        self.assertTrue(available(130000, None, (1,), (False,), (True,)))
+        self.assertFalse(available(130000, None, (1,), (False,), (False,)))
+
     def test_is_visible_by(self):
         # profile2 is in the same team as self.profile
         # profile3 has nothing in common
@@ -58,6 +122,163 @@ class TestTask(TestCase):
         self.assertTrue(task3.is_visible_by(profile3.user))
 
 
+class TestTaskQuerySet(TestCase):
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.profile = ProfileFactory(user=self.user)
+        self.team_mate = ProfileFactory(team=self.profile.team).user
+        self.other = ProfileFactory(team=TeamFactory(name='the Others')).user
+
+    def test_visible_to(self):
+        """ visible_to must agree with Task.is_visible_by for every case """
+        VIZ = Task.VISIBILITIES
+        for creator in (self.user, self.team_mate, self.other):
+            for visibility in (VIZ.private, VIZ.team_only, VIZ.public):
+                TaskFactory(creator=creator, visibility=visibility)
+        TaskFactory(creator=self.user, visibility=VIZ.public, is_removed=True)
+        for user in (self.user, self.team_mate, self.other):
+            expected = {t.pk for t in Task.objects.filter(is_removed=False) if t.is_visible_by(user)}
+            self.assertEqual(set(Task.objects.visible_to(user).values_list('pk', flat=True)), expected)
+            team_id = user.profile.team_id
+            self.assertEqual(
+                set(Task.objects.visible_to(user, team_id=team_id).values_list('pk', flat=True)), expected
+            )
+
+    def test_visible_to_single_query(self):
+        """ the team of the user is resolved in the same query """
+        TaskFactory(creator=self.team_mate, visibility=Task.VISIBILITIES.team_only)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(Task.objects.visible_to(self.user)), 1)
+
+    def test_listing(self):
+        """ only the columns of the TaskTable and the creator's username are fetched, without join """
+        task = TaskFactory(creator=self.user, description='not listed')
+        queryset = Task.objects.visible_to(self.user).listing().order_by('-name')
+        with self.assertNumQueries(1):
+            row, = queryset
+        self.assertEqual(
+            (row.pk, row.name, row.creator_id, row.creator, row.status),
+            (task.pk, task.name, self.user.pk, self.user.username, task.status),
+        )
+        self.assertEqual(row.get_visibility_display(), task.get_visibility_display())
+        sql = str(queryset.query)
+        self.assertNotIn('description', sql)
+        self.assertNotIn('JOIN', sql)
+
+    def test_search(self):
+        """ the matches of the name rank before those of the description, among the visible tasks """
+        in_name = TaskFactory(creator=self.user, name='Weekly reports')
+        in_description = TaskFactory(creator=self.user, name='Garden', description='Write the report')
+        TaskFactory(creator=self.user, name='Kitchen')
+        TaskFactory(creator=self.other, name='Weekly report')
+        visible = Task.objects.visible_to(self.user)
+        # the older task, more relevant, comes first: all the matches are ranked
+        self.assertEqual(list(visible.search('report')), [in_name, in_description])
+        with override_settings(TASKS_SEARCH_WINDOW=1):
+            self.assertEqual(list(visible.search('report')), [in_description])
+        self.assertEqual(list(visible.search('weekly rep')), [in_name])
+        rows = list(visible.search('report').listing())
+        self.assertEqual([row.pk for row in rows], [in_name.pk, in_description.pk])
+        self.assertGreater(rows[0].search_rank, rows[1].search_rank)
+        self.assertFalse(visible.search(' ,; ').exists())
+
+    def test_search_window(self):
+        """ with a window, only the latest matches are ranked, however far apart they are """
+        tasks = [TaskFactory(creator=self.user, name='report' if i in (0, 1, 15) else 'garden') for i in range(20)]
+        visible = Task.objects.visible_to(self.user)
+        # by default, all of them
+        self.assertEqual(set(visible.search('report')), {tasks[0], tasks[1], tasks[15]})
+        with override_settings(TASKS_SEARCH_WINDOW=2):
+            self.assertEqual(list(visible.search('report')), [tasks[15], tasks[1]])
+        # the first range holds 10 pks, the match is found in the next one
+        with override_settings(TASKS_SEARCH_WINDOW=1):
+            self.assertEqual(list(visible.search('garden').filter(pk__lt=tasks[2].pk)), [])
+            self.assertEqual(list(visible.filter(pk__lt=tasks[2].pk).search('report')), [tasks[1]])
+
+    def test_facets(self):
+        """ the tasks visible are counted by status, visibility and difficulty in a single query """
+        VIZ, STATUS = Task.VISIBILITIES, Task.STATUS
+        TaskFactory(creator=self.user, visibility=VIZ.private, status=STATUS.completed, difficulty=1)
+        TaskFactory(creator=self.team_mate, visibility=VIZ.team_only, difficulty=1)
+        TaskFactory(creator=self.other, visibility=VIZ.public)
+        TaskFactory(creator=self.other, visibility=VIZ.team_only)
+        with self.assertNumQueries(1):
+            facets = Task.objects.visible_to(self.user).facets()
+        self.assertEqual(facets, {
+            'status': {STATUS.new: 2, STATUS.completed: 1},
+            'visibility': {VIZ.private: 1, VIZ.team_only: 1, VIZ.public: 1},
+            'difficulty': {1: 2, 2: 1},
+        })
+        self.assertEqual(Task.objects.none().facets(), {'status': {}, 'visibility': {}, 'difficulty': {}})
+
+    def test_search_benchmark(self):
+        out = StringIO()
+        call_command('benchmark', 'task_search', size=50, repeat=1, stdout=out)
+        self.assertIn('no match, second page', out.getvalue())
+
+
+@skipUnless(connection.vendor == 'postgresql', "EXPLAIN plans are checked against PostgreSQL only")
+class TestTaskQuerySetPlan(TestCase):
+    """
+    Seeds a million tasks, mostly private or team_only, and checks the planner
+    serves visible_to from indexes rather than scanning the whole table.
+    """
+
+    SEED_ROWS = 10 ** 6
+    USERS = 200
+    TEAMS = 20
+
+    def setUp(self):
+        teams = Team.objects.bulk_create([Team(name='team-{0}'.format(i)) for i in range(self.TEAMS)])
+        User.objects.bulk_create([User(username='seed-{0}'.format(i)) for i in range(self.USERS)])
+        users = list(User.objects.filter(username__startswith='seed-').order_by('pk'))
+        Profile.objects.bulk_create([
+            Profile(user=user, has_signed=True, team=teams[i % self.TEAMS]) for i, user in enumerate(users)
+        ])
+        self.user = users[0]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO tasks_task (name, description, visibility, created_at, modified_at, creator_id,
+                                        creator_username, creator_team_id, is_removed, status, difficulty)
+                SELECT 'task ' || i, 'seeded', CASE WHEN i %% 100 = 0 THEN 2 ELSE i %% 2 END, now(), now(),
+                       (%s::int[])[1 + i %% %s], 'seed-' || i %% %s, (%s::int[])[1 + i %% %s %% %s], i %% 10 = 0,
+                       i %% 4, 1 + i %% 3
+                FROM generate_series(1, %s) AS i
+                """,
+                [[u.pk for u in users], len(users), len(users), [t.pk for t in teams], len(users), self.TEAMS,
+                 self.SEED_ROWS]
+            )
+            cursor.execute("ANALYZE tasks_task")
+
+    def explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN " + sql, params)
+            return "\n".join(row[0] for row in cursor.fetchall())
+
+    def test_visible_to_uses_index(self):
+        for team_id in (None, self.user.profile.team_id):
+            plan = self.explain(Task.objects.visible_to(self.user, team_id=team_id))
+            self.assertNotIn("Seq Scan on tasks_task", plan)
+            self.assertIn("tasks_task_visibility_creator_team_live", plan)
+        # once the team is known, tasks_task is the only table involved
+        self.assertNotIn("Join", plan)
+        self.assertNotIn("tasks_profile", plan)
+
+    def test_orderings_use_index(self):
+        """ a page of the home table is read in the order of an index, whatever the column sorted """
+        tasks = Task.objects.visible_to(self.user, team_id=self.user.profile.team_id).listing()
+        for column, field in ORDERINGS.items():
+            for prefix in ('', '-'):
+                plan = self.explain(tasks.order_by(prefix + field, prefix + 'pk')[:11])
+                index = 'tasks_task_pkey' if field == 'pk' else 'tasks_task_{0}_live'.format(field)
+                self.assertIn(index, plan, column)
+                self.assertNotIn("Sort", plan, column)
+                self.assertNotIn("Join", plan, column)
+
+
 class TestTeam(TestCase):
     def setUp(self):
         UserFactory.reset_sequence()
@@ -0,0 +1,182 @@
+from unittest import skipUnless
+
+from bs4 import BeautifulSoup
+from django.core.urlresolvers import reverse
+from django.core.cache import caches
+from django.db import connection
+from django.http import QueryDict
+from django.test.utils import CaptureQueriesContext, override_settings
+from test_plus.test import TestCase
+
+from to_do_list.users.tests.factories import UserFactory
+from .factories import ProfileFactory, TaskFactory
+from ..models import Task
+from ..paginators import KeysetPaginator, decode_cursor, encode_cursor, estimate_count
+
+
+class TestCursor(TestCase):
+
+    def test_round_trip(self):
+        values = ['-name', 0, 'a task', 42]
+        self.assertEqual(decode_cursor(encode_cursor(values)), values)
+
+    def test_invalid(self):
+        """ tampered tokens are ignored rather than raising """
+        for token in ('', 'not a cursor', encode_cursor({'a': 1})[:-3], '$$$'):
+            self.assertIsNone(decode_cursor(token))
+
+
+@override_settings(TASKS_KEYSET_PAGINATION=True)
+class TestKeysetPagination(TestCase):
+    """
+    Walks through the home table with the cursors, forward and backward, for
+    several orderings.
+    """
+
+    def setUp(self):
+        UserFactory.reset_sequence()
+        self.user = UserFactory()
+        self.client.login(username=self.user.username, password='password')
+        ProfileFactory(user=self.user)
+        self.url = reverse('tasks:home')
+        # names collide on purpose so that the pk tie-breaker is exercised
+        for i in range(25):
+            TaskFactory(creator=self.user, name='task {0:02d}'.format(i // 2), status=i % 4)
+
+    def get_page(self, data=None):
+        response = self.client.get(self.url, data=data or {})
+        self.assertEqual(response.status_code, 200)
+        table = response.context['table']
+        soup = BeautifulSoup(response.content, "html.parser")
+        links = {}
+        for direction in ('previous', 'next'):
+            li = soup.find("li", class_=direction)
+            links[direction] = li.a['href'] if li else None
+        return [row.record.pk for row in table.page.object_list], links
+
+    def walk(self, sort):
+        prefix, field = ('-' if sort.startswith('-') else ''), sort.lstrip('-').replace('creator', 'creator_username')
+        expected = list(Task.objects.order_by(prefix + field, prefix + 'pk').values_list('pk', flat=True))
+        pages, links = [], {'next': '?sort=' + sort}
+        while links['next']:
+            pks, links = self.get_page(QueryDict(links['next'][1:]))
+            pages.append(pks)
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual([len(p) for p in pages], [10, 10, 5])
+        # and back to the first page
+        previous_pages = []
+        while links['previous']:
+            pks, links = self.get_page(QueryDict(links['previous'][1:]))
+            previous_pages.append(pks)
+        self.assertEqual(previous_pages, pages[-2::-1])
+
+    def test_walk_pk(self):
+        self.walk('pk')
+
+    def test_walk_name(self):
+        self.walk('name')
+        self.walk('-name')
+
+    def test_walk_status(self):
+        self.walk('-status')
+
+    def test_walk_creator(self):
+        self.walk('creator')
+
+    def test_walk_search(self):
+        """ the search results, ordered by rank then pk, are walked with cursors on the rank """
+        expected = list(Task.objects.order_by('-pk').values_list('pk', flat=True))
+        pages, links = [], {'next': '?q=task'}
+        while links['next']:
+            pks, links = self.get_page(QueryDict(links['next'][1:]))
+            pages.append(pks)
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual([len(p) for p in pages], [10, 10, 5])
+
+    @override_settings(TASKS_CACHE_ALIAS='default')
+    def test_no_full_count(self):
+        """ neither full COUNT(*) nor OFFSET is used, even deep in the list -- the facets are cached """
+        caches['default'].clear()
+        _, links = self.get_page()
+        with CaptureQueriesContext(connection) as context:
+            self.get_page(QueryDict(links['next'][1:]))
+        for query in context.captured_queries:
+            sql = query['sql'].upper()
+            self.assertNotIn('OFFSET', sql)
+            if 'COUNT(' in sql:
+                self.assertIn('LIMIT', sql)
+
+    def test_cursor_of_other_ordering(self):
+        """ a cursor built for another ordering shows the first page """
+        _, links = self.get_page({'sort': 'name'})
+        cursor = QueryDict(links['next'][1:])[KeysetPaginator.cursor_field]
+        pks, links = self.get_page({'sort': '-name', 'cursor': cursor})
+        self.assertEqual(pks, list(Task.objects.order_by('-name', '-pk').values_list('pk', flat=True)[:10]))
+        self.assertIsNone(links['previous'])
+
+    def test_tampered_cursor(self):
+        """ a cursor whose values don't fit the ordering shows the first page """
+        first = list(Task.objects.order_by('visibility', 'pk').values_list('pk', flat=True)[:10])
+        for values in (['visibility', 0, 'abc', 1], ['visibility', 0, 1, 'abc'], ['visibility', 0, 1, None],
+                       ['visibility', 0, [1], 1]):
+            data = {'sort': 'visibility', 'cursor': encode_cursor(values)}
+            pks, links = self.get_page(data)
+            self.assertEqual(pks, first, values)
+            self.assertIsNone(links['previous'])
+            self.assertEqual(self.client.get(reverse('tasks:api_tasks'), data).status_code, 200)
+        # the pk ordering converts the pk only
+        pks, _ = self.get_page({'cursor': encode_cursor(['pk', 0, None, 'abc'])})
+        self.assertEqual(pks, list(Task.objects.order_by('pk').values_list('pk', flat=True)[:10]))
+
+    def test_ajax(self):
+        """ the AJAX payload carries the same cursor links """
+        _, links = self.get_page()
+        response = self.client.get(self.url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertIn(links['next'].replace('&', '&amp;'), response.json()['html'])
+
+
+class TestEstimatedCount(TestCase):
+    """
+    The table counts tasks exactly below TASKS_EXACT_COUNT_THRESHOLD, and
+    shows the estimate of the planner above it on PostgreSQL.
+    """
+
+    def setUp(self):
+        UserFactory.reset_sequence()
+        self.user = UserFactory()
+        self.client.login(username=self.user.username, password='password')
+        ProfileFactory(user=self.user)
+        self.url = reverse('tasks:home')
+        for i in range(12):
+            TaskFactory(creator=self.user)
+
+    def test_exact_below_threshold(self):
+        self.assertEqual(estimate_count(Task.objects.all(), 12), (12, False))
+        response = self.client.get(self.url)
+        self.assertContains(response, '12 tasks')
+        self.assertContains(response, 'Page 1 of 2')
+        self.assertFalse(response.context['table'].paginator.is_estimated)
+
+    @skipUnless(connection.vendor == 'postgresql', "estimates come from the PostgreSQL planner")
+    def test_estimated_above_threshold(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE tasks_task")
+        count, is_estimated = estimate_count(Task.objects.all(), 5)
+        self.assertTrue(is_estimated)
+        self.assertGreater(count, 5)
+        # the estimate is at least the capped count, 12 tasks: two pages
+        with self.settings(TASKS_EXACT_COUNT_THRESHOLD=11):
+            response = self.client.get(self.url)
+            self.assertContains(response, 'about {0} tasks'.format(response.context['table'].paginator.count))
+            self.assertContains(response, 'Page 1 of about')
+            response = self.client.get(self.url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            self.assertIn('about', response.json()['html'])
+
+    def test_no_full_count_above_threshold(self):
+        """ the COUNT(*) is capped by a LIMIT once above the threshold """
+        with CaptureQueriesContext(connection) as context:
+            estimate_count(Task.objects.all(), 5)
+        counts = [q['sql'] for q in context.captured_queries if 'COUNT(' in q['sql'].upper()]
+        if connection.vendor == 'postgresql':
+            self.assertEqual(len(counts), 1)
+            self.assertIn('LIMIT 6', counts[0])
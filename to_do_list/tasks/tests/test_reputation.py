@@ -0,0 +1,77 @@
+from django.core.management import CommandError, call_command
+from django.utils.six import StringIO
+from test_plus.test import TestCase
+
+from to_do_list.users.tests.factories import UserFactory
+from .factories import ProfileFactory, TaskFactory, TeamFactory
+from .. import transitions
+from ..models import Profile, ReputationEvent, Task
+from ..reputation import aggregate_batch, aggregate_events, check_reputation
+
+
+class TestReputationLedger(TestCase):
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.profile = ProfileFactory(user=self.user)
+        team = TeamFactory(name='the Others')
+        self.others = [ProfileFactory(team=team).user for _ in range(3)]
+
+    def close_tasks(self, count):
+        tasks = [
+            TaskFactory(creator=self.user, completed_by=self.others[i % 3], status=Task.STATUS.completed,
+                        difficulty=i % 6)
+            for i in range(count)
+        ]
+        transitions.CLOSE.apply_many([t.pk for t in tasks], self.user)
+        return tasks
+
+    def reputations(self):
+        return dict(Profile.objects.filter(user__in=self.others).values_list('user_id', 'reputation'))
+
+    def test_close_appends_events(self):
+        self.close_tasks(4)
+        self.assertEqual(ReputationEvent.objects.filter(applied_at__isnull=True).count(), 4)
+        self.assertEqual(set(self.reputations().values()), {1})
+
+    def test_aggregate(self):
+        tasks = self.close_tasks(10)
+        expected = {user.pk: 1 for user in self.others}
+        for task in tasks:
+            expected[task.completed_by_id] += ReputationEvent.objects.get(task=task).amount
+        # locking select, gains of the users for the leaderboards, UPDATE ...
+        # FROM of the profiles, events marked applied, and the savepoint and
+        # release of the batch
+        with self.assertNumQueries(6):
+            self.assertEqual(aggregate_batch(batch_size=100), 10)
+        self.assertEqual(self.reputations(), expected)
+        self.assertEqual(aggregate_events(), 0)
+        self.assertEqual(self.reputations(), expected)
+
+    def test_aggregate_by_batches(self):
+        self.close_tasks(7)
+        self.assertEqual(aggregate_batch(batch_size=3), 3)
+        self.assertEqual(ReputationEvent.objects.filter(applied_at__isnull=True).count(), 4)
+        self.assertEqual(aggregate_events(batch_size=3), 4)
+        self.assertEqual(check_reputation(), [])
+
+    def test_check(self):
+        self.close_tasks(3)
+        aggregate_events()
+        self.assertEqual(check_reputation(), [])
+        # pending events are not counted yet
+        self.close_tasks(3)
+        self.assertEqual(check_reputation(), [])
+        Profile.objects.filter(user=self.others[0]).update(reputation=1000)
+        (user_id, reputation, ledger), = check_reputation()
+        self.assertEqual((user_id, reputation), (self.others[0].pk, 1000))
+
+    def test_command(self):
+        self.close_tasks(3)
+        out = StringIO()
+        call_command('aggregate_reputation', check=True, stdout=out)
+        self.assertIn('3 reputation events applied', out.getvalue())
+        self.assertIn('agree with the ledger', out.getvalue())
+        Profile.objects.filter(user=self.others[0]).update(reputation=1000)
+        with self.assertRaises(CommandError):
+            call_command('aggregate_reputation', check=True, stdout=out, stderr=StringIO())
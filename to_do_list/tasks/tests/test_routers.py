@@ -0,0 +1,108 @@
+import time
+
+from django.core.cache import caches
+from django.db import connections, router
+from django.core.urlresolvers import reverse
+from django.test import RequestFactory, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from mock import patch
+from test_plus.test import TestCase
+
+from to_do_list.users.tests.factories import UserFactory
+from .factories import ProfileFactory, TaskFactory
+from ..models import Task
+from ..routers import PRIMARY_COOKIE, choose_replica, current_replica, replica_reads, use_replica
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class TestReplicaRouter(TestCase):
+
+    def test_reads_and_writes(self):
+        self.assertEqual(Task.objects.all().db, 'default')
+        with use_replica('replica'):
+            self.assertEqual(Task.objects.all().db, 'replica')
+            task = Task(pk=1)
+            task._state.db = 'replica'
+            self.assertEqual(router.db_for_write(Task, instance=task), 'default')
+        self.assertEqual(Task.objects.all().db, 'default')
+
+    @override_settings(DATABASE_REPLICAS=['a', 'b'])
+    def test_round_robin(self):
+        first, second, third = [choose_replica() for _ in range(3)]
+        self.assertEqual({first, second}, {'a', 'b'})
+        self.assertEqual(first, third)
+
+    @override_settings(DATABASE_REPLICAS=['a', 'b', 'c'], TASKS_REPLICA_SELECTION='least_lag', TASKS_REPLICA_MAX_LAG=5)
+    def test_least_lag(self):
+        lags = {'a': 3.0, 'b': 1.0, 'c': None}
+        with patch('to_do_list.tasks.routers.replica_lag', lambda alias: lags[alias]):
+            self.assertEqual(choose_replica(), 'b')
+            lags['b'] = 8.0
+            self.assertEqual(choose_replica(), 'a')
+            lags['a'] = 6.0
+            self.assertIsNone(choose_replica())
+
+    def test_replica_reads(self):
+        view = replica_reads(lambda request: current_replica())
+        request = RequestFactory().get('/')
+        self.assertEqual(view(request), 'replica')
+        # users who just wrote read from the primary
+        request.COOKIES[PRIMARY_COOKIE] = str(time.time())
+        self.assertIsNone(view(request))
+        request.COOKIES[PRIMARY_COOKIE] = str(time.time() - 3600)
+        self.assertEqual(view(request), 'replica')
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertIsNone(view(RequestFactory().get('/')))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_stickiness_cookie(self):
+        """ the writes are told by a cookie -- the replica doesn't see the rows of the test case """
+        user = ProfileFactory().user
+        self.client.login(username=user.username, password='password')
+        response = self.client.get(reverse('tasks:home'))
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+        task = TaskFactory(creator=user)
+        response = self.client.post(reverse('tasks:complete_task', kwargs={'pk': task.pk}))
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class TestReplicaViews(TransactionTestCase):
+    """ the read-only views read from the replica, a mirror of the test database """
+
+    def setUp(self):
+        UserFactory.reset_sequence()
+        self.user = ProfileFactory().user
+        self.task = TaskFactory(creator=self.user, name='replicated')
+        self.client.login(username=self.user.username, password='password')
+
+    def get(self, url):
+        with CaptureQueriesContext(connections['replica']) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(context.captured_queries)
+
+    def test_views(self):
+        for url in (reverse('tasks:home'), reverse('tasks:detail_task', kwargs={'pk': self.task.pk}),
+                    reverse('tasks:api_tasks')):
+            response, replica_queries = self.get(url)
+            self.assertContains(response, 'replicated')
+            self.assertTrue(replica_queries)
+
+    def test_read_your_writes(self):
+        self.client.post(reverse('tasks:complete_task', kwargs={'pk': self.task.pk}))
+        _, replica_queries = self.get(reverse('tasks:home'))
+        self.assertFalse(replica_queries)
+
+    @override_settings(TASKS_CACHE_ALIAS='default')
+    def test_not_cached(self):
+        """ what is read from the replica, which may lag behind the versions, is neither cached nor tagged """
+        caches['default'].clear()
+        for url in (reverse('tasks:home'), reverse('tasks:api_tasks')):
+            response, _ = self.get(url)
+            self.assertNotIn('ETag', response)
+            # the primary finds nothing cached
+            with override_settings(DATABASE_REPLICAS=[]), CaptureQueriesContext(connections['default']) as context:
+                response = self.client.get(url)
+            self.assertTrue(any('tasks_task' in q['sql'] for q in context.captured_queries))
+            self.assertIn('ETag', response)
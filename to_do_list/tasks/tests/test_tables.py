@@ -0,0 +1,58 @@
+from django.core.management import call_command
+from django.utils.six import StringIO
+from test_plus.test import TestCase
+
+from to_do_list.users.tests.factories import UserFactory
+from .factories import ProfileFactory, TaskFactory
+from ..benchmarks import LegacyTaskTable, render_cells
+from ..models import Task, TaskRow
+from ..tables import TaskTable
+
+
+class TestTaskTable(TestCase):
+
+    def setUp(self):
+        UserFactory.reset_sequence()
+        self.user = UserFactory()
+        self.profile = ProfileFactory(user=self.user)
+        other = ProfileFactory(team=self.profile.team).user
+        for creator in (self.user, other):
+            for status, _ in Task.STATUS:
+                TaskFactory(creator=creator, status=status, name='<b>{0}</b>'.format(status))
+        self.tasks = list(Task.objects.order_by('pk'))
+
+    def test_same_cells_as_legacy(self):
+        """ cells rendered from the cached variants are the ones rendered row by row """
+        self.assertEqual(
+            render_cells(TaskTable(self.tasks, user=self.user)),
+            render_cells(LegacyTaskTable(self.tasks, user=self.user)),
+        )
+
+    def test_name_escaped(self):
+        name, _ = render_cells(TaskTable(self.tasks[:1], user=self.user))[0]
+        self.assertIn('&lt;b&gt;0&lt;/b&gt;', name)
+
+    def test_action_rendered_once_per_variant(self):
+        """ actions_cell.html is rendered once per (is_owner, status) """
+        table = TaskTable(self.tasks + self.tasks, user=self.user)
+        render_cells(table)
+        self.assertEqual(len(table._action_cells), 2 * len(Task.STATUS))
+
+    def test_listing_rows(self):
+        """ TaskRow records render the same cells as Task instances """
+        rows = list(Task.objects.order_by('pk').listing())
+        self.assertTrue(all(isinstance(row, TaskRow) for row in rows))
+        cells = [[str(cell) for cell in row] for row in TaskTable(rows, user=self.user).rows]
+        self.assertEqual(cells, [[str(cell) for cell in row] for row in TaskTable(self.tasks, user=self.user).rows])
+        self.assertIn(str(Task.STATUS[Task.STATUS.closed]), cells[-1])
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('benchmark', 'table_rendering', size=8, repeat=1, stdout=out)
+        self.assertIn('legacy, per row', out.getvalue())
+        self.assertIn('batched, per row', out.getvalue())
+
+    def test_listing_benchmark(self):
+        out = StringIO()
+        call_command('benchmark', 'table_listing', size=8, repeat=1, stdout=out)
+        self.assertIn('listing rows, peak memory', out.getvalue())
@@ -0,0 +1,156 @@
+import threading
+from unittest import skipUnless
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+from test_plus.test import TestCase
+
+from to_do_list.users.tests.factories import UserFactory
+from .factories import ProfileFactory, TaskFactory, TeamFactory
+from .. import transitions
+from ..cache import version_token
+from ..helper_functions import calculate_reputation_gain
+from ..models import Profile, Task
+from ..reputation import aggregate_events
+from .utils import run_on_commit
+
+
+class TestTransitions(TestCase):
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.profile = ProfileFactory(user=self.user)
+        self.other = ProfileFactory(team=TeamFactory(name='the Others')).user
+
+    def test_complete(self):
+        task = TaskFactory(creator=self.other, visibility=Task.VISIBILITIES.public)
+        # update, insert in the history and read back
+        with self.assertNumQueries(3):
+            outcome, read_back = transitions.COMPLETE.apply(task.pk, self.user, team_id=self.profile.team_id)
+        self.assertEqual(outcome, transitions.APPLIED)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.completed_by_id), (Task.STATUS.completed, self.user.pk))
+        self.assertEqual(read_back.status, Task.STATUS.completed)
+        self.assertGreaterEqual(task.modified_at, task.created_at)
+        # completing twice is refused
+        self.assertEqual(transitions.COMPLETE.apply(task.pk, self.user)[0], transitions.FORBIDDEN)
+
+    def test_complete_own_task_closes_it(self):
+        task = TaskFactory(creator=self.user)
+        transitions.COMPLETE.apply(task.pk, self.user)
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.STATUS.closed)
+
+    def test_not_found(self):
+        private = TaskFactory(creator=self.other)
+        self.assertEqual(transitions.COMPLETE.apply(private.pk, self.user), (transitions.NOT_FOUND, None))
+        public = TaskFactory(creator=self.other, visibility=Task.VISIBILITIES.public)
+        for transition in (transitions.CLOSE, transitions.DELETE):
+            self.assertEqual(transition.apply(public.pk, self.user)[0], transitions.NOT_FOUND)
+        private.refresh_from_db()
+        self.assertEqual(private.status, Task.STATUS.new)
+
+    def test_close_rewards(self):
+        task = TaskFactory(creator=self.user, completed_by=self.other, status=Task.STATUS.completed)
+        self.assertEqual(transitions.CLOSE.apply(task.pk, self.user)[0], transitions.APPLIED)
+        aggregate_events()
+        self.assertGreater(Profile.objects.get(user=self.other).reputation, 1)
+        # a second close doesn't reward twice
+        reputation = Profile.objects.get(user=self.other).reputation
+        self.assertEqual(transitions.CLOSE.apply(task.pk, self.user)[0], transitions.FORBIDDEN)
+        aggregate_events()
+        self.assertEqual(Profile.objects.get(user=self.other).reputation, reputation)
+
+    def test_delete(self):
+        task = TaskFactory(creator=self.user)
+        self.assertEqual(transitions.DELETE.apply(task.pk, self.user)[0], transitions.APPLIED)
+        self.assertTrue(Task.objects.get(pk=task.pk).is_removed)
+        self.assertEqual(transitions.DELETE.apply(task.pk, self.user)[0], transitions.NOT_FOUND)
+
+    @override_settings(TASKS_CACHE_ALIAS='default')
+    def test_bumps_versions(self):
+        """ the UPDATE bypasses the signals, the cached tables are invalidated all the same """
+        caches['default'].clear()
+        task = TaskFactory(creator=self.user)
+        token = version_token(self.user.pk, self.profile.team_id)
+        with run_on_commit():
+            transitions.DELETE.apply(task.pk, self.user)
+            # not before the commit
+            self.assertEqual(version_token(self.user.pk, self.profile.team_id), token)
+        self.assertNotEqual(version_token(self.user.pk, self.profile.team_id), token)
+
+    @override_settings(TASKS_CACHE_ALIAS='default')
+    def test_apply_many_bumps_versions(self):
+        caches['default'].clear()
+        tasks = [TaskFactory(creator=self.user) for _ in range(2)]
+        token = version_token(self.user.pk, self.profile.team_id)
+        with run_on_commit():
+            transitions.DELETE.apply_many([t.pk for t in tasks], self.user)
+            self.assertEqual(version_token(self.user.pk, self.profile.team_id), token)
+        self.assertNotEqual(version_token(self.user.pk, self.profile.team_id), token)
+
+    def test_apply_many(self):
+        completed = [
+            TaskFactory(creator=self.user, completed_by=self.other, status=Task.STATUS.completed, difficulty=d)
+            for d in (Task.DIFFICULTIES.easy, Task.DIFFICULTIES.hard)
+        ]
+        new = TaskFactory(creator=self.user)
+        foreign = TaskFactory(creator=self.other, completed_by=self.user, status=Task.STATUS.completed)
+        pks = [t.pk for t in completed] + [new.pk, foreign.pk, 0]
+        reputation = Profile.objects.get(user=self.other).reputation
+        # savepoint, locking select, update, insert in the history, insert of
+        # the rewards, release and the outcomes of the others
+        with self.assertNumQueries(7):
+            outcomes = transitions.CLOSE.apply_many(pks, self.user)
+        self.assertEqual(outcomes, {
+            completed[0].pk: transitions.APPLIED, completed[1].pk: transitions.APPLIED,
+            new.pk: transitions.FORBIDDEN, foreign.pk: transitions.NOT_FOUND, 0: transitions.NOT_FOUND,
+        })
+        self.assertEqual(
+            set(Task.objects.filter(status=Task.STATUS.closed).values_list('pk', flat=True)),
+            {t.pk for t in completed}
+        )
+        aggregate_events()
+        rewarded = Profile.objects.get(user=self.other).reputation - reputation
+        self.assertEqual(rewarded, sum(calculate_reputation_gain(t) for t in completed))
+
+
+@skipUnless(connection.vendor == 'postgresql', "concurrent transactions need PostgreSQL")
+class TestConcurrentTransitions(TransactionTestCase):
+    """ Users racing to complete the same tasks: exactly one of them wins each task """
+
+    THREADS = 8
+    TASKS = 20
+
+    def test_one_winner_per_task(self):
+        team = TeamFactory()
+        users = [ProfileFactory(team=team, user=UserFactory()).user for _ in range(self.THREADS)]
+        creator = ProfileFactory(team=TeamFactory(name='creators')).user
+        tasks = [TaskFactory(creator=creator, visibility=Task.VISIBILITIES.public) for _ in range(self.TASKS)]
+        barrier = threading.Barrier(self.THREADS)
+        outcomes = []
+
+        def race(user):
+            try:
+                barrier.wait()
+                for task in tasks:
+                    outcomes.append((task.pk, user.pk, transitions.COMPLETE.apply(task.pk, user)[0]))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=race, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(outcomes), self.THREADS * self.TASKS)
+        for task in tasks:
+            winners = [user for pk, user, outcome in outcomes if pk == task.pk and outcome == transitions.APPLIED]
+            losers = [o for pk, _, o in outcomes if pk == task.pk and o != transitions.APPLIED]
+            self.assertEqual(len(winners), 1)
+            self.assertEqual(set(losers), {transitions.FORBIDDEN})
+            task.refresh_from_db()
+            self.assertEqual((task.status, task.completed_by_id), (Task.STATUS.completed, winners[0]))
@@ -1,4 +1,7 @@
+from django.core.cache import caches
+from django.db import connection
 from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
 from test_plus.test import TestCase
 from django.test.client import Client
 from django.core.urlresolvers import reverse
@@ -6,7 +9,9 @@ from django.core.urlresolvers import reverse
 from to_do_list.users.tests.factories import UserFactory
 from .factories import ProfileFactory, TaskFactory, TeamFactory
 from to_do_list.users.models import User
-from mock import patch
+from ..queries import query_budget
+from ..reputation import aggregate_events
+from .utils import run_on_commit
 
 from ..views import (
     home_view,
@@ -111,6 +116,7 @@ class TestHomeIndividualTask(BaseTaskTestCase):
         profile2 = ProfileFactory(team=team2)
         self.user2 = profile2.user
 
+    @query_budget('tasks:home')
     def test_show_new_task_user_is_creator(self):
         """
         a new task belonging to the current user must have links for edition,
@@ -134,6 +140,16 @@ class TestHomeIndividualTask(BaseTaskTestCase):
             response, 'href="{0}"'.format(reverse("tasks:detail_task", kwargs={'pk': pk})),
         )
 
+    @query_budget('tasks:home')
+    def test_many_tasks(self):
+        """ the queries don't grow with the number of tasks, their creators or their teams """
+        for i in range(5):
+            creator = ProfileFactory(team=TeamFactory(name='team {0}'.format(i))).user
+            for visibility in Task.VISIBILITIES:
+                TaskFactory(creator=creator, visibility=visibility[0])
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Perform a test', status_code=200)
+
     def test_show_completed_task_user_is_creator(self):
         """
         a 'completed' task (ie marked as done by someone else) and created by
@@ -206,6 +222,32 @@ class TestHomeFilterOrderTask(BaseTaskTestCase):
         self.assertNotContains(response, t2.name)
         self.assertContains(response, t3.name)
 
+    @query_budget('tasks:home')
+    def test_search(self):
+        """ only the tasks matching the search must be shown """
+        t1 = TaskFactory(name="garden_task", creator=self.user, description="Water the roses")
+        t2 = TaskFactory(name="kitchen_task", creator=self.user)
+        response = self.client.get(self.url, data={'q': 'roses'})
+        self.assertContains(response, t1.name, status_code=200)
+        self.assertNotContains(response, t2.name)
+
+    @override_settings(TASKS_CACHE_ALIAS='default')
+    def test_facets(self):
+        """ the choices of the filter show their number of tasks, cached until a task changes """
+        caches['default'].clear()
+        TaskFactory(creator=self.user, status=Task.STATUS.new)
+        task = TaskFactory(creator=self.user, status=Task.STATUS.new)
+        self.assertContains(self.client.get(self.url), '{0} (2)'.format(Task.STATUS[Task.STATUS.new]))
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(self.url, data={'status': Task.STATUS.new})
+        self.assertFalse([q for q in context.captured_queries if 'GROUP BY' in q['sql']])
+        task.status = Task.STATUS.completed
+        with run_on_commit():
+            task.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, '{0} (1)'.format(Task.STATUS[Task.STATUS.new]))
+        self.assertContains(response, '{0} (1)'.format(Task.STATUS[Task.STATUS.completed]))
+
     def test_filter_status(self):
         """ only tasks matching the status filter must be shown """
         t1 = TaskFactory(name="new_task", creator=self.user, status=Task.STATUS.new)
@@ -281,6 +323,49 @@ class TestHomeFilterOrderTask(BaseTaskTestCase):
         self.assertEqual(name_list, ['e', 'd', 'c', 'b', 'a'])
 
 
+@override_settings(TASKS_CACHE_ALIAS='default')
+class TestHomeConditionalGet(BaseTaskTestCase):
+    """ the home page answers 304 as long as no visible task has changed """
+
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        self.profile = ProfileFactory(user=self.user)
+        self.url = reverse('tasks:home')
+        self.client.get(self.url)  # gets the CSRF cookie
+
+    def revalidate(self, **kwargs):
+        response = self.client.get(self.url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('X-Requested-With', response['Vary'])
+        return self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'], **kwargs)
+
+    def test_not_modified(self):
+        response = self.revalidate()
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.revalidate(HTTP_X_REQUESTED_WITH='XMLHttpRequest').status_code, 304)
+
+    def test_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        with run_on_commit():
+            TaskFactory(creator=self.user)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, {'sort': 'name'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_no_etag_with_pending_messages(self):
+        """ the messages would be lost in a 304 """
+        self.client.post(reverse('tasks:update_profile'), {'first_name': 'A', 'last_name': 'B'})
+        self.assertFalse(self.client.get(self.url).has_header('ETag'))
+        self.assertTrue(self.client.get(self.url).has_header('ETag'))
+
+    @override_settings(TASKS_CACHE_ALIAS='tasks')
+    def test_no_etag_without_versions(self):
+        self.assertFalse(self.client.get(self.url).has_header('ETag'))
+
+
 #  ------------------------------------------------
 #                PROFILE RELATED VIEWS
 #  ------------------------------------------------
@@ -401,6 +486,7 @@ class TestTaskCreateView(BaseTaskTestCase):
         self.assertEqual(response.status_code, 302)
         task = self.user.created_tasks.first()
         self.assertEqual(task.name, 'A new task')
+        self.assertEqual(task.creator_team_id, self.user.profile.team_id)
 
 
 #  ---------------------------------------------------------------------------
@@ -471,6 +557,63 @@ class TestTaskUpdateView(BaseTaskTestCase):
         self.assertEqual(response.status_code, 404)
 
 
+#  ---------------------------------------------------------------------------
+#                       Testing TaskDetailView
+#  ---------------------------------------------------------------------------
+
+class TestTaskDetailView(BaseTaskTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.profile = ProfileFactory(user=self.user)
+        team2 = TeamFactory(name="other_team")
+        self.profile2 = ProfileFactory(team=team2)
+
+    def test_login_required(self):
+        self.url = reverse("tasks:detail_task", kwargs={"pk": 42})
+        self.run_test_login_required()
+
+    @query_budget('tasks:detail_task')
+    def test_visible_task(self):
+        """ public tasks of other people and own tasks can be seen """
+        for task in (TaskFactory(creator=self.user),
+                     TaskFactory(creator=self.profile2.user, visibility=Task.VISIBILITIES.public)):
+            response = self.client.get(reverse("tasks:detail_task", kwargs={"pk": task.pk}))
+            self.assertContains(response, task.description, status_code=200)
+
+    def test_404_invisible_or_removed_task(self):
+        """ private tasks of other people and removed tasks are not found """
+        for task in (TaskFactory(creator=self.profile2.user, visibility=Task.VISIBILITIES.private),
+                     TaskFactory(creator=self.user, is_removed=True)):
+            response = self.client.get(reverse("tasks:detail_task", kwargs={"pk": task.pk}))
+            self.assertEqual(response.status_code, 404)
+
+    def test_conditional_get(self):
+        """ the details answer 304 until the task is saved again """
+        task = TaskFactory(creator=self.user)
+        url = reverse("tasks:detail_task", kwargs={"pk": task.pk})
+        self.client.get(url)  # gets the CSRF cookie
+        response = self.client.get(url)
+        self.assertIn('Last-Modified', response)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        etag = response['ETag']
+        task.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        # another user doesn't share the ETag
+        other = Client()
+        other.login(username=self.profile2.user.username, password='password')
+        task.visibility = Task.VISIBILITIES.public
+        task.save()
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(other.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        # the ETag changes once the creator is renamed
+        self.user.username = 'renamed'
+        self.user.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'renamed')
+
+
 #  ---------------------------------------------------------------------------
 #                       Testing delete_view
 #  ---------------------------------------------------------------------------
@@ -567,23 +710,28 @@ class TestTaskCompleteView(BaseTaskTestCase):
         self.assertEqual(self.task.status, Task.STATUS.completed)
         self.assertEqual(self.task.completed_by, self.user)
 
-    @patch('to_do_list.tasks.models.Task.is_visible_by', lambda *_: False)
     def test_deny_completion_for_invisible_task(self):
         """
-        The user should be denied access to tasks which are not visible to her
-        (we patch Task.is_visible_by, any task should fail)
+        The user should be denied access to tasks which are not visible to her,
+        they are not part of Task.objects.visible_to so it is a 404
         """
-        response = self.client.post(self.url, {})
-        self.assertEqual(response.status_code, 400)
+        for visibility in (Task.VISIBILITIES.private, Task.VISIBILITIES.team_only):
+            task = TaskFactory(creator=self.profile2.user, visibility=visibility)
+            url = reverse('tasks:complete_task', kwargs={"pk": task.pk})
+            response = self.client.post(url, {})
+            self.assertEqual(response.status_code, 404)
 
-    @patch('to_do_list.tasks.models.Task.is_new', lambda *_: False)
     def test_deny_completion_task_not_completed(self):
         """
-        Should be impossible to complete tasks which are not new (patc
-        Task.is_new so any task should fail)
+        Should be impossible to complete tasks which are not new -- the status
+        is checked by the UPDATE itself, so a task completed meanwhile fails
         """
-        response = self.client.post(self.url, {})
-        self.assertEqual(response.status_code, 400)
+        for status in (Task.STATUS.assigned, Task.STATUS.completed, Task.STATUS.closed):
+            Task.objects.filter(pk=self.task.pk).update(status=status)
+            response = self.client.post(self.url, {})
+            self.assertEqual(response.status_code, 400)
+        self.task.refresh_from_db()
+        self.assertIsNone(self.task.completed_by)
 
 
 #  ---------------------------------------------------------------------------
@@ -613,12 +761,13 @@ class TestTaskCloseView(BaseTaskTestCase):
     def test_successful_update(self):
         """
         checks a task completed and belonging to the current user can be closed,
-        and that the person that completed it has an increase in reputation (exact
-        number tested in test_helper_function)
+        and that the person that completed it has an increase in reputation once
+        the ledger is aggregated (exact number tested in test_helper_function)
         """
         response = self.client.post(self.url, {})
         self.assertRedirects(response, reverse('tasks:home'), status_code=302,
         target_status_code=200)
+        aggregate_events()
         self.task.refresh_from_db()
         self.profile2.refresh_from_db()
         self.assertEqual(self.task.status, Task.STATUS.closed)
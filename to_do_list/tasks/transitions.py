@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""
+State transitions of the tasks: complete, close and delete. Each one is a
+single conditional UPDATE whose WHERE clause holds the pk, the expected state
+and the permission of the user, so that among concurrent requests only one
+can apply it -- the others update no row. Only the changed columns and
+modified_at are written. On success the transition is appended to the history
+of the task and the task read back once, to invalidate the cached tables and
+for the side effects of the transition. The invalidation and the metrics wait
+for the commit.
+Many tasks are changed at once by locking the candidate rows, then updating
+them in a single statement.
+"""
+
+from django.db import transaction
+from django.db.models import Case, PositiveSmallIntegerField, Value, When
+from django.utils import timezone
+
+from . import metrics
+from .cache import bump_task_versions, task_scopes
+from .helper_functions import give_reputation_rewards
+from .history import record_transitions
+from .models import Task
+
+# Outcomes of Transition.apply
+APPLIED, NOT_FOUND, FORBIDDEN = 'applied', 'not_found', 'forbidden'
+
+# Fields of the task read back after a transition
+READ_BACK = ('creator', 'creator_team', 'visibility', 'status', 'completed_by', 'difficulty')
+
+
+class Transition:
+    """
+    Change, named `name`, of the tasks in the state `source` (a dict of
+    lookups) among the ones `allowed(user, team_id)` returns, setting the
+    `values(user)`. `after(tasks)` is called with the list of the tasks
+    changed.
+    """
+
+    def __init__(self, name, source, allowed, values, after=None):
+        self.name = name
+        self.source = source
+        self.allowed = allowed
+        self.values = values
+        self.after = after
+
+    def apply(self, pk, user, team_id=None):
+        """
+        Apply the transition to the task pk on behalf of the user, team_id
+        being her team if known. Return (outcome, task): APPLIED and the task
+        read back, else FORBIDDEN if the task is allowed but not in the source
+        state -- e.g. another request was first -- or NOT_FOUND, and None.
+        """
+        allowed = self.allowed(user, team_id).filter(pk=pk)
+        updated = allowed.filter(**self.source).update(modified_at=timezone.now(), **self.values(user))
+        if not updated:
+            return (FORBIDDEN if allowed.exists() else NOT_FOUND), None
+        record_transitions([pk], user)
+        self.count(1)
+        task = Task.objects.only(*READ_BACK).get(pk=pk)
+        scopes = task_scopes(task)
+        transaction.on_commit(lambda: bump_task_versions(*scopes))
+        if self.after:
+            self.after([task])
+        return APPLIED, task
+
+    def apply_many(self, pks, user, team_id=None):
+        """
+        Apply the transition to the tasks pks on behalf of the user, return
+        {pk: outcome}. The candidate rows are locked and read by one query,
+        changed by a single UPDATE and recorded by a single INSERT, and the
+        outcomes of the others told apart by another query.
+        """
+        pks = set(pks)
+        allowed = self.allowed(user, team_id).filter(pk__in=pks)
+        with transaction.atomic():
+            tasks = list(allowed.filter(**self.source).select_for_update().only(*READ_BACK))
+            if tasks:
+                changed = [t.pk for t in tasks]
+                Task.objects.filter(pk__in=changed).update(modified_at=timezone.now(), **self.values(user))
+                record_transitions(changed, user)
+                self.count(len(changed))
+                scopes = [scope for t in tasks for scope in task_scopes(t)]
+                transaction.on_commit(lambda: bump_task_versions(*scopes))
+                if self.after:
+                    self.after(tasks)
+        outcomes = {t.pk: APPLIED for t in tasks}
+        if len(outcomes) < len(pks):
+            found = set(allowed.exclude(pk__in=outcomes).values_list('pk', flat=True))
+            outcomes.update({pk: FORBIDDEN if pk in found else NOT_FOUND for pk in pks - set(outcomes)})
+        return outcomes
+
+    def count(self, number):
+        """Count the number of tasks changed in the metrics, once the transaction is committed."""
+        transaction.on_commit(lambda: metrics.TRANSITIONS.inc(self.name, amount=number))
+
+
+def owned_by(user, team_id=None):
+    """Tasks of the user which have not been removed."""
+    return Task.objects.filter(creator_id=user.pk, is_removed=False)
+
+
+# Any visible new task can be completed, it is closed at once by its creator
+COMPLETE = Transition(
+    'complete',
+    source={'status': Task.STATUS.new},
+    allowed=lambda user, team_id=None: Task.objects.visible_to(user, team_id=team_id),
+    values=lambda user: {
+        'status': Case(
+            When(creator_id=user.pk, then=Value(Task.STATUS.closed)), default=Value(Task.STATUS.completed),
+            output_field=PositiveSmallIntegerField(),
+        ),
+        'completed_by_id': user.pk,
+    },
+)
+
+# The creator closes the tasks completed by others, rewarding them
+CLOSE = Transition(
+    'close',
+    source={'status': Task.STATUS.completed},
+    allowed=owned_by,
+    values=lambda user: {'status': Task.STATUS.closed},
+    after=give_reputation_rewards,
+)
+
+# The creator removes her tasks as long as they are new
+DELETE = Transition(
+    'delete',
+    source={'status': Task.STATUS.new},
+    allowed=owned_by,
+    values=lambda user: {'is_removed': True},
+)
+
+# Transitions by name, as given to the bulk action view
+TRANSITIONS = {t.name: t for t in (COMPLETE, CLOSE, DELETE)}
@@ -4,7 +4,7 @@
 
 from django.conf.urls import url
 
-from . import views
+from . import api, views
 
 urlpatterns = [
     #  Home
@@ -26,6 +26,13 @@ urlpatterns = [
         view=views.ProfileUpdateView.as_view(),
         name='update_profile'
     ),
+    #  Leaderboards
+    #  ----------------------------------------------------------------------
+    url(
+        regex=r'^leaderboard/$',
+        view=views.LeaderboardView.as_view(),
+        name='leaderboard'
+    ),
     #  Task urls
     #  ----------------------------------------------------------------------
     url(
@@ -58,4 +65,38 @@ urlpatterns = [
         view=views.delete_task,
         name='delete_task'
     ),
+    url(
+        regex=r'^export\.(?P<format>csv|ndjson)$',
+        view=views.export_tasks,
+        name='export_tasks'
+    ),
+    #  JSON API
+    #  ----------------------------------------------------------------------
+    url(
+        regex=r'^api/v1/tasks/$',
+        view=api.tasks_view,
+        name='api_tasks'
+    ),
+    url(
+        regex=r'^api/v1/tasks/bulk/$',
+        view=api.bulk_action_view,
+        name='api_bulk_action'
+    ),
+    url(
+        regex=r'^api/v1/tasks/import/$',
+        view=api.import_view,
+        name='api_import_tasks'
+    ),
+    url(
+        regex=r'^api/v1/table-config/$',
+        view=api.table_config_view,
+        name='api_table_config'
+    ),
+    #  Metrics, for the staff
+    #  ----------------------------------------------------------------------
+    url(
+        regex=r'^metrics/$',
+        view=views.metrics_view,
+        name='metrics'
+    ),
 ]
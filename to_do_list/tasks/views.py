@@ -2,6 +2,10 @@
 
 """Views for tasks app."""
 
+import hashlib
+from calendar import timegm
+
+from django.conf import settings
 from django.contrib import messages
 from django.core.exceptions import SuspiciousOperation
 from django.core.urlresolvers import reverse
@@ -10,29 +14,50 @@ from django.views.generic import (
     UpdateView,
     CreateView,
     FormView,
+    TemplateView,
 )
 
+from django.http import Http404
 from django.http.response import (
+    HttpResponse,
     HttpResponseNotAllowed,
     HttpResponseRedirect,
     JsonResponse,
+    StreamingHttpResponse,
 )
 
 from django.template.loader import render_to_string
+from django.utils import translation
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
 from django.shortcuts import render, get_object_or_404
 from django.utils.translation import ugettext as _
 from django.urls.base import reverse_lazy
 
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.messages.views import SuccessMessageMixin
-from django.db.models import Q
 
-from .forms import UserProfileForm, UserUpdateForm
-from .models import Profile, Task
+from . import transitions
+from .forms import TaskForm, UserProfileForm, UserUpdateForm
+from .api import PER_PAGE
+from .cache import cached_facets, cached_teams, home_table_key, may_cache, task_cache
+from .decorators import ReadOnlyRequestMixin, read_only_requests
+from .exports import FORMATS
+from .leaderboards import GLOBAL, TEAMS, RedisError, rankings, team_board
+from .metrics import TABLE_CACHE, collect, exposition
+from .middleware import get_profile
+from .models import Task, TaskStatusHistory
 from .tables import TaskFilter, TaskFilterFormHelper, TaskTable
-from .helper_functions import give_reputation_reward
+from .paginators import EstimatedCountPaginator, KeysetPaginator
+from .routers import replica_reads
 from django_tables2 import RequestConfig
+from to_do_list.users.models import User
 
 
 #  ----------------------------------------------------
@@ -40,34 +65,97 @@ from django_tables2 import RequestConfig
 #  ----------------------------------------------------
 
 
+def table_pagination(request):
+    """
+    Return the pagination options of the TaskTable, paginated by cursor rather
+    than by page number if settings.TASKS_KEYSET_PAGINATION is set. Either
+    way, large lists are counted from the planner statistics.
+    """
+    if settings.TASKS_KEYSET_PAGINATION:
+        return {
+            "klass": KeysetPaginator, "per_page": PER_PAGE,
+            "cursor": request.GET.get(KeysetPaginator.cursor_field),
+        }
+    return {"klass": EstimatedCountPaginator, "per_page": PER_PAGE, "page": 1}
+
+
+def page_etag(request, profile, *parts):
+    """
+    Return the ETag of a page rendered for request.user from the parts
+    identifying its content. The page also shows the reputation of the user
+    and embeds her CSRF token. Return None if messages are pending, as they
+    would be shown.
+    """
+    if len(messages.get_messages(request)):
+        return None
+    parts += (
+        request.user.pk, profile.reputation, request.META.get('CSRF_COOKIE'),
+        translation.get_language(), request.is_ajax(),
+    )
+    return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+
+def home_etag(request):
+    """
+    ETag of home_view, derived from the key the table is cached under -- hence
+    from the versions of the tasks visible by the user. None when reading
+    from a replica, whose rows may be older than the versions.
+    """
+    profile = get_profile(request)
+    if profile is None or not may_cache():
+        return None
+    key = home_table_key(request, profile.team_id)
+    return page_etag(request, profile, key) if key else None
+
+
 @login_required
+@read_only_requests
+@replica_reads
+@vary_on_headers('X-Requested-With')
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=home_etag)
 def home_view(request):
     """
     Return the home view after successful login. By default, lists all tasks
     visible by the current user.
-    Provides also a filter by status and difficulty.
+    Provides also a filter by visibility, status and difficulty, showing the
+    number of tasks of each choice.
     """
 
-    try:
-        profile = Profile.objects.get(user=request.user)
-        VIZ = Task.VISIBILITIES
-        queryset = Task.objects.select_related().filter(is_removed=False).filter(
-            Q(visibility=VIZ.public) | Q(creator=request.user) |
-            Q(visibility=VIZ.team_only, creator__profile__team_id=request.user.profile.team_id)
-        )
+    profile, f = get_profile(request), None
+    if profile is not None:
+        queryset = Task.objects.visible_to(request.user, team_id=profile.team_id)
         f = TaskFilter(request.GET, queryset=queryset)
         f.form.helper = TaskFilterFormHelper()
-        table = TaskTable(f.qs, user=request.user)
-        RequestConfig(request, paginate={"per_page": 10, "page": 1}).configure(table)
-    except Profile.DoesNotExist:
-        profile, table, f = None, None, None
 
-    context = {"profile": profile, 'table': table, 'filter': f, "request": request}
+    # The table -- and the whole AJAX payload -- is cached until a task it may
+    # show is changed, the queryset is only evaluated on a miss. A table read
+    # from a replica is served, not cached
+    cache = task_cache()
+    key = home_table_key(request, profile.team_id) if profile else None
+    cached = cache.get(key) if key else None
+    if key:
+        TABLE_CACHE.inc('tasks:home', 'hit' if cached is not None else 'miss')
+    if not may_cache():
+        key = None
+    if cached is not None and request.is_ajax():
+        return JsonResponse({'html': cached})
+    if profile is not None:
+        f.form.helper.show_facets(f.form, cached_facets(request.user, profile.team_id))
+
+    context = {"profile": profile, 'table': None, 'table_html': cached, 'filter': f, "request": request}
+    if profile and cached is None:
+        table = TaskTable(f.qs.listing(), user=request.user)
+        RequestConfig(request, paginate=table_pagination(request)).configure(table)
+        context['table'], context['table_html'] = table, table.as_html(request)
     if request.is_ajax():
         html = render_to_string("tasks/table_home.html", context)
+        if key:
+            cache.set(key, html, settings.TASKS_CACHE_TIMEOUT)
         return JsonResponse({'html': html})
-    else:
-        return render(request, "tasks/table_home.html", context)
+    if key and cached is None:
+        cache.set(key, context['table_html'], settings.TASKS_CACHE_TIMEOUT)
+    return render(request, "tasks/table_home.html", context)
 
 
 class ProfileCreateView(SuccessMessageMixin, LoginRequiredMixin, FormView):
@@ -84,7 +172,7 @@ class ProfileCreateView(SuccessMessageMixin, LoginRequiredMixin, FormView):
 
     def dispatch(self, request, *args, **kwargs):
         """If the user is already activated, redirect to tasks:home."""
-        if Profile.objects.filter(user_id=self.request.user.id).exists():
+        if get_profile(request) is not None:
             return HttpResponseRedirect(reverse('tasks:home'))
         else:
             return super().dispatch(request, *args, **kwargs)
@@ -104,9 +192,8 @@ class ProfileRequiredMixin(LoginRequiredMixin):
     has a profile.
     """
     def dispatch(self, request, *args, **kwargs):
-        try:
-            self.profile = Profile.objects.get(user_id=self.request.user.id)
-        except Profile.DoesNotExist:
+        self.profile = get_profile(request)
+        if self.profile is None:
             messages.error(request, _("You must have a valid profile to access this page"))
             return HttpResponseRedirect(reverse('tasks:home'))
         return super().dispatch(request, *args, **kwargs)
@@ -135,13 +222,14 @@ class TaskCreateView(SuccessMessageMixin, ProfileRequiredMixin, CreateView):
     """CBV creating a new task for the current user."""
 
     model = Task
-    fields = ['name', 'description', 'visibility', 'difficulty']
+    form_class = TaskForm
     success_message = _("Your task has been successfully created.")
     success_url = reverse_lazy('tasks:home')
     template_name = "tasks/create_task_form.html"
 
     def form_valid(self, form):
         form.instance.creator = self.request.user
+        form.instance.creator_team_id = self.profile.team_id
         form.save()
         return super().form_valid(form)
 
@@ -153,7 +241,7 @@ class TaskUpdateView(SuccessMessageMixin, ProfileRequiredMixin, UpdateView):
     """
 
     model = Task
-    fields = ['name', 'description', 'visibility', 'difficulty']
+    form_class = TaskForm
     success_message = _("Your task has been successfully updated.")
     success_url = reverse_lazy('tasks:home')
     template_name = "tasks/update_task_form.html"
@@ -170,22 +258,63 @@ class TaskUpdateView(SuccessMessageMixin, ProfileRequiredMixin, UpdateView):
         return task
 
 
-class TaskDetailView(ProfileRequiredMixin, DetailView):
+class TaskDetailView(ReadOnlyRequestMixin, ProfileRequiredMixin, DetailView):
     """
     CBV to see the details of an existing task -- task has to be visible to
-    the current user.
+    the current user -- with a page of its history, walked with cursors.
     """
 
     model = Task
     template_name = "tasks/detail_task.html"
-    queryset = Task.objects.filter(is_removed=False)
-
-    def get_object(self):
-        """Only gets the Task record if the current user can see it."""
-        task = get_object_or_404(Task, is_removed=False, pk=self.kwargs['pk'])
-        if not task.is_visible_by(self.request.user):
-            raise SuspiciousOperation(_('You cannot see this tasks'))
-        return task
+    history_per_page = 10
+    history_cursor_field = 'history'
+
+    def get_queryset(self):
+        """Only the tasks the current user can see, others raise a 404."""
+        return Task.objects.visible_to(self.request.user, team_id=self.profile.team_id)
+
+    def get_context_data(self, **kwargs):
+        """Add the page of the history pointed at by the cursor of the query string."""
+        context = super().get_context_data(**kwargs)
+        history = TaskStatusHistory.objects.filter(task_id=self.object.pk).select_related('user')
+        paginator = KeysetPaginator(history.order_by('-modified_at'), self.history_per_page,
+                                    cursor=self.request.GET.get(self.history_cursor_field))
+        context['history'] = paginator.page()
+        return context
+
+    @method_decorator(replica_reads)
+    @method_decorator(cache_control(private=True, no_cache=True))
+    def get(self, request, *args, **kwargs):
+        """
+        Answer 304 if neither the task -- as told by its modified_at -- nor the
+        page around it have changed.
+        """
+        modified_at = self.get_queryset().filter(pk=kwargs['pk']).values_list('modified_at', flat=True).first()
+        if modified_at is None:
+            return super().get(request, *args, **kwargs)
+        etag = page_etag(request, self.profile, kwargs['pk'], modified_at.isoformat(),
+                         request.GET.get(self.history_cursor_field, ''))
+        last_modified = timegm(modified_at.utctimetuple())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        response['Last-Modified'] = http_date(last_modified)
+        if etag:
+            response['ETag'] = quote_etag(etag)
+        return response
+
+
+def apply_transition(request, transition, pk, message, team_id=None):
+    """
+    Apply the transition to the task pk on behalf of the current user: 404 if
+    she can't access the task, 400 if it isn't in a state allowing it.
+    """
+    outcome, task = transition.apply(pk, request.user, team_id=team_id)
+    if outcome == transitions.NOT_FOUND:
+        raise Http404
+    if outcome == transitions.FORBIDDEN:
+        raise SuspiciousOperation(message)
+    return JsonResponse({}) if request.is_ajax() else HttpResponseRedirect(reverse('tasks:home'))
 
 
 @login_required
@@ -195,20 +324,15 @@ def complete_task(request, pk):
     automatically closed as well.
     """
 
-    home_url = reverse('tasks:home')
     if request.method != 'POST':
         return HttpResponseNotAllowed(['POST'])
-    if not Profile.objects.filter(user=request.user).exists():
-        return HttpResponseRedirect(home_url)
-
-    task = get_object_or_404(Task, pk=pk, is_removed=False)
-    if not task.is_visible_by(request.user) or not task.is_new():
-        raise SuspiciousOperation(_("You do not have the right to complete this task"))
-
-    task.status = Task.STATUS.closed if request.user == task.creator else Task.STATUS.completed
-    task.completed_by = request.user
-    task.save()
-    return JsonResponse({}) if request.is_ajax() else HttpResponseRedirect(home_url)
+    profile = get_profile(request)
+    if profile is None:
+        return HttpResponseRedirect(reverse('tasks:home'))
+    return apply_transition(
+        request, transitions.COMPLETE, pk, _("You do not have the right to complete this task"),
+        team_id=profile.team_id,
+    )
 
 
 @login_required
@@ -221,13 +345,7 @@ def close_task(request, pk):
 
     if request.method != 'POST':
         return HttpResponseNotAllowed(['POST'])
-    task = get_object_or_404(Task, creator=request.user, pk=pk, is_removed=False)
-    if task.status != Task.STATUS.completed:
-        raise SuspiciousOperation(_("You do not have the right to complete this task"))
-    give_reputation_reward(task)
-    task.status = Task.STATUS.closed
-    task.save()
-    return JsonResponse({}) if request.is_ajax() else HttpResponseRedirect(reverse('tasks:home'))
+    return apply_transition(request, transitions.CLOSE, pk, _("You do not have the right to complete this task"))
 
 
 @login_required
@@ -239,9 +357,69 @@ def delete_task(request, pk):
 
     if request.method != 'POST':
         return HttpResponseNotAllowed(['POST'])
-    task = get_object_or_404(Task, creator=request.user, pk=pk, is_removed=False)
-    if not task.is_new():
-        raise SuspiciousOperation(_("You do not have the right to delete this task"))
-    task.is_removed = True
-    task.save()
-    return JsonResponse({}) if request.is_ajax() else HttpResponseRedirect(reverse('tasks:home'))
+    return apply_transition(request, transitions.DELETE, pk, _("You do not have the right to delete this task"))
+
+
+@login_required
+def export_tasks(request, format):
+    """
+    Stream all the tasks visible by the current user, filtered by TaskFilter
+    as on the home page, as CSV or NDJSON.
+    """
+    profile = get_profile(request)
+    if profile is None:
+        return HttpResponseRedirect(reverse('tasks:home'))
+    queryset = Task.objects.visible_to(request.user, team_id=profile.team_id)
+    queryset = TaskFilter(request.GET, queryset=queryset).qs.order_by('pk')
+    content_type, export = FORMATS[format]
+    response = StreamingHttpResponse(export(queryset), content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="tasks.{0}"'.format(format)
+    return response
+
+
+#  ----------------------------------------------------
+#              Leaderboards
+#  ----------------------------------------------------
+
+
+class LeaderboardView(ReadOnlyRequestMixin, ProfileRequiredMixin, TemplateView):
+    """
+    CBV showing the first users, the first members of the team of the user,
+    the teams and the ranks of the user, read from the precomputed rankings
+    of leaderboards.py rather than by sorting the profiles.
+    """
+
+    template_name = 'tasks/leaderboard.html'
+    size = 10
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        store, board = rankings(), team_board(self.profile.team_id)
+        try:
+            users, members, teams = [store.top(b, self.size) for b in (GLOBAL, board, TEAMS)]
+            context.update({
+                'rank': store.rank(GLOBAL, self.request.user.pk), 'count': store.count(GLOBAL),
+                'team_rank': store.rank(board, self.request.user.pk), 'team_count': store.count(board),
+            })
+        except RedisError:
+            messages.error(self.request, _("The leaderboards are unavailable for now"))
+            users, members, teams = [], [], []
+        usernames = dict(User.objects.filter(pk__in={pk for pk, _s in users + members}).values_list('pk', 'username'))
+        team_names = dict(cached_teams())
+        context.update({
+            'users': [(usernames.get(pk), score, pk == self.request.user.pk) for pk, score in users],
+            'members': [(usernames.get(pk), score, pk == self.request.user.pk) for pk, score in members],
+            'teams': [(team_names.get(pk), score, pk == self.profile.team_id) for pk, score in teams],
+        })
+        return context
+
+
+#  ----------------------------------------------------
+#              Metrics
+#  ----------------------------------------------------
+
+
+@staff_member_required
+def metrics_view(request):
+    """Return the metrics of all the workers in the text format of Prometheus, see metrics.py."""
+    return HttpResponse(exposition(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')